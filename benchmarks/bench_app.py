@@ -0,0 +1,180 @@
+''' Load test the FastAPI app and record throughput and latency percentiles
+
+    Usage: python -m benchmarks.bench_app [num_cars ...] [--concurrency N]
+           [--requests N] [--cache] [--baseline results.json]
+
+    For each size the database at BENCH_DB_URL (defaults to a SQLite file, use
+    a postgresql+pg8000 URL for PostgreSQL) is seeded with generated customers
+    and cars from a fixed seed, src.main:app is started under uvicorn against
+    it and every scenario is driven by a concurrent async HTTP client. Results
+    are written to benchmarks/results as json with the commit and settings, a
+    baseline file from an earlier run is compared scenario by scenario.
+'''
+import argparse
+import asyncio
+import subprocess
+import sys
+from itertools import cycle
+from os import environ as env
+from time import perf_counter, perf_counter_ns, sleep
+import httpx
+from src.data.car_gen import generate_cars_frame
+from src.data.customers_gen import generate_customers_frame
+from src.db.listings import refresh_car_listings
+from src.db.logger import percentile
+from src.db.seed_db import create_dimension_tables, create_cars_for_sale
+from src.db.table_classes import Base, CarsForSale
+from src.utils.file_utils import pd_load_json
+from .common import new_results, bench_engine, bulk_load, run_benchmark
+
+SIZES = [10_000, 100_000]
+DEFAULT_URL = 'sqlite:////tmp/bench_app.db'
+PORT = 8765
+SEED = 0
+
+# compared against a baseline, (direction, floor) as in find_regressions
+METRICS = {'p99_ms': (1, 1.0), 'throughput_rps': (-1, 0)}
+
+# the requests of each scenario, cycled through in order
+SCENARIOS = {
+    'healthcheck': [('/api/healthcheck', {})],
+    'locations': [
+        ('/api/locations', {'search_term': term})
+        for term in ['a', 'ab', 'bri', 'lon', 'man', 'som', 'st', 'we']
+    ],
+    'search': [
+        ('/api/cars/search', filters) for filters in [
+            {},
+            {'make': 'Ford'},
+            {'make': 'Ford', 'model': 'Focus', 'sort': '-price'},
+            {'fuel_type': 'diesel', 'max_price': 10_000},
+            {'mileage_band': 'up to 10,000', 'sort': 'mileage'},
+            {'location': 'Somerset', 'sort': '-year'},
+            {'keyword': 'tempora magnam', 'sort': '-relevance'},
+        ]
+    ],
+    'export': [('/api/cars/export', {'format': 'ndjson', 'make': 'Ford', 'limit': 1_000})],
+}
+
+
+def seed(engine, num_cars: int) -> None:
+    ''' seeds the database with generated customers and cars, the same for every run '''
+    num_customers = max(1, num_cars // 10)
+    tables = create_dimension_tables(
+        pd_load_json('data/json/cars.json'), generate_customers_frame(num_customers, seed=SEED)
+    )
+    tables[CarsForSale] = create_cars_for_sale(
+        generate_cars_frame(num_cars, num_customers, seed=SEED), tables=tables
+    )
+
+    Base.metadata.drop_all(engine)
+    with engine.begin() as conn:
+        bulk_load(conn, tables)
+        refresh_car_listings(conn)
+
+
+def start_server(
+    db_url: str, cache: bool, workers: int = 1, extra_env: dict = None
+) -> subprocess.Popen:
+    ''' runs src.main:app under uvicorn and waits for the healthcheck '''
+    server_env = {**env, 'DATABASE_URL': db_url, **(extra_env or {})}
+    if not cache:
+        server_env['RESPONSE_CACHE_SIZE'] = '0'
+    server = subprocess.Popen( # pylint: disable=consider-using-with
+        [sys.executable, '-m', 'uvicorn', 'src.main:app', '--port', str(PORT),
+         '--workers', str(workers), '--log-level', 'warning'],
+        env=server_env
+    )
+    for _ in range(300):
+        try:
+            httpx.get(f'http://127.0.0.1:{PORT}/api/healthcheck').raise_for_status()
+            return server
+        except httpx.HTTPError:
+            sleep(0.1)
+    server.terminate()
+    raise RuntimeError('uvicorn did not start')
+
+
+async def drive(client: httpx.AsyncClient, requests: list, total: int, concurrency: int) -> dict:
+    ''' sends total requests from concurrency workers, returns throughput and percentiles '''
+    pending = cycle(requests)
+    remaining = total
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            url, params = next(pending)
+            start = perf_counter_ns()
+            response = await client.get(url, params=params)
+            latencies.append(perf_counter_ns() - start)
+            errors += response.status_code != 200
+
+    start = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': total,
+        'errors': errors,
+        'throughput_rps': total / elapsed,
+        'p50_ms': percentile(latencies, 0.50) / 1e6,
+        'p99_ms': percentile(latencies, 0.99) / 1e6,
+    }
+
+
+async def run_scenarios(total: int, concurrency: int) -> dict:
+    ''' warms up then drives every scenario in turn '''
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=f'http://127.0.0.1:{PORT}', limits=limits, timeout=60
+    ) as client:
+        results = {}
+        for name, requests in SCENARIOS.items():
+            await drive(client, requests, len(requests), 1)
+            results[name] = await drive(client, requests, total, concurrency)
+        return results
+
+
+def load_test(args: argparse.Namespace) -> dict:
+    ''' seeds, serves and load tests every size '''
+    engine = bench_engine(DEFAULT_URL)
+    db_url = engine.url.render_as_string(hide_password=False)
+    settings = {
+        'concurrency': args.concurrency, 'requests': args.requests,
+        'cache': args.cache, 'seed': SEED
+    }
+    results = new_results(settings, database=engine.dialect.name)
+
+    for size in args.sizes:
+        seed(engine, size)
+        server = start_server(db_url, args.cache)
+        try:
+            runs = asyncio.run(run_scenarios(args.requests, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+
+        results['runs'][str(size)] = runs
+        print(f'\n{size:,} cars for sale')
+        print(f'{"scenario":<14}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+        for name, run in runs.items():
+            print(f'{name:<14}{run["throughput_rps"]:>10.1f}{run["p50_ms"]:>10.2f}'
+                  f'{run["p99_ms"]:>10.2f}{run["errors"]:>8}')
+    return results
+
+
+def main() -> int:
+    ''' load tests every size, returns 1 if a regression was found '''
+    parser = argparse.ArgumentParser(description='Load test the FastAPI app')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--cache', action='store_true', help='keep the response cache enabled')
+    return run_benchmark('app', parser, METRICS, load_test)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+''' Benchmark the in-memory inventory snapshot against the SQL search
+
+    Usage: python -m benchmarks.bench_facets [num_cars ...] [--repeats N]
+           [--baseline results.json]
+
+    For each size the database at BENCH_DB_URL (defaults to a SQLite file) is
+    seeded with generated cars as in bench_app, the snapshot is built from
+    car_listings and every search is answered by search_cars and by the
+    snapshot, first pages with facet counts and a cursor page. Median and p99
+    latencies of both engines are written to benchmarks/results.
+'''
+import argparse
+import sys
+from functools import partial
+from time import perf_counter, perf_counter_ns
+from src.db.logger import percentile
+from src.models.model_inventory import InventorySnapshot, fetch_inventory
+from src.models.model_search import SearchFilters, search_cars
+from .bench_app import seed
+from .common import new_results, bench_engine, run_benchmark
+
+SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_URL = 'sqlite:////tmp/bench_facets.db'
+
+# compared against a baseline, (direction, floor) as in find_regressions
+METRICS = {'sql_p50_ms': (1, 1.0), 'memory_p50_ms': (1, 0.1)}
+
+SEARCHES = {
+    'all': {},
+    'make': {'make': 'Ford'},
+    'make_model_price': {'make': 'Ford', 'model': 'Focus', 'sort': '-price'},
+    'fuel_max_price': {'fuel_type': 'diesel', 'max_price': 10_000},
+    'mileage_band': {'mileage_band': 'up to 10,000', 'sort': 'mileage'},
+    'location_year': {'location': 'Somerset', 'sort': '-year'},
+}
+
+
+def latencies_ms(search, repeats: int) -> dict:
+    ''' median and p99 of the search in milliseconds '''
+    times = []
+    for _ in range(repeats):
+        start = perf_counter_ns()
+        search()
+        times.append(perf_counter_ns() - start)
+    times.sort()
+    return {'p50_ms': percentile(times, 0.50) / 1e6, 'p99_ms': percentile(times, 0.99) / 1e6}
+
+
+def run(engine, num_cars: int, repeats: int) -> tuple[dict, float]:
+    ''' times every search on both engines, returns the runs and the snapshot build time '''
+    seed(engine, num_cars)
+    runs = {}
+
+    with engine.connect() as conn:
+        start = perf_counter()
+        snapshot = InventorySnapshot(fetch_inventory(conn))
+        build_seconds = perf_counter() - start
+
+        for name, params in SEARCHES.items():
+            filters = SearchFilters(**params)
+            next_page = filters.model_copy(
+                update={'cursor': search_cars(conn, filters)['next_cursor']}
+            )
+            for page, page_filters in [('', filters), ('_page2', next_page)]:
+                if page and not page_filters.cursor:
+                    continue
+                engines = {
+                    'sql': partial(search_cars, conn, page_filters),
+                    'memory': partial(snapshot.search, page_filters),
+                }
+                runs[name + page] = {
+                    f'{engine_name}_{key}': value
+                    for engine_name, search in engines.items()
+                    for key, value in latencies_ms(search, repeats).items()
+                }
+
+    return runs, build_seconds
+
+
+def compare_sizes(args: argparse.Namespace) -> dict:
+    ''' benchmarks both engines at every size '''
+    engine = bench_engine(DEFAULT_URL)
+    results = new_results({'repeats': args.repeats}, database=engine.dialect.name)
+    results['snapshot_build_seconds'] = {}
+
+    for size in args.sizes:
+        runs, build_seconds = run(engine, size, args.repeats)
+        results['runs'][str(size)] = runs
+        results['snapshot_build_seconds'][str(size)] = build_seconds
+
+        print(f'\n{size:,} cars for sale, snapshot built in {build_seconds:.2f} s')
+        print(f'{"search":<24}{"sql p50":>10}{"mem p50":>10}{"sql p99":>10}{"mem p99":>10}'
+              f'{"speedup":>9}')
+        for name, timings in runs.items():
+            speedup = timings['sql_p50_ms'] / max(timings['memory_p50_ms'], 1e-6)
+            print(f'{name:<24}{timings["sql_p50_ms"]:>10.2f}{timings["memory_p50_ms"]:>10.2f}'
+                  f'{timings["sql_p99_ms"]:>10.2f}{timings["memory_p99_ms"]:>10.2f}'
+                  f'{speedup:>8.1f}x')
+    return results
+
+
+def main() -> int:
+    ''' benchmarks every size, returns 1 if a search regressed against the baseline '''
+    parser = argparse.ArgumentParser(description='Benchmark the in-memory facet engine')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES)
+    parser.add_argument('--repeats', type=int, default=20)
+    return run_benchmark('facets', parser, METRICS, compare_sizes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+''' Benchmark loading the seed data from JSON against Parquet and Feather
+
+    Usage: python -m benchmarks.bench_formats [num_cars ...] [--baseline results.json]
+
+    Writes generated cars for sale in each format to a temporary directory, then
+    loads each file in a fresh process as create_tables would and reports the
+    load time and the peak RSS above the interpreter baseline (Linux only).
+    Results are written to benchmarks/results, compared against a baseline
+    when given.
+'''
+import argparse
+import sys
+import json
+import subprocess
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from src.data.car_gen import generate_cars_frame
+from src.db.seed_db import normalize
+from src.utils.file_utils import load_json_data, pd_save_parquet, pd_save_feather, pd_load_file
+from .common import new_results, memory_status_mb, run_benchmark
+
+SIZES = [100_000, 1_000_000]
+FORMATS = ['json', 'parquet', 'feather']
+
+# compared against a baseline, (direction, floor) as in find_regressions
+METRICS = {'seconds': (1, 0.05), 'peak_rss_mb': (1, 10.0)}
+
+
+def write_files(num_cars: int, directory: str) -> dict:
+    ''' writes the same generated cars in every format '''
+    cars = generate_cars_frame(num_cars, num_cars // 10, seed=0)
+    files = {fmt: f'{directory}/cars_for_sale_{num_cars}.{fmt}' for fmt in FORMATS}
+
+    with open(files['json'], 'w', encoding='utf-8') as out_file:
+        json.dump(cars.astype({'make': str, 'model': str}).to_dict('records'), out_file, indent=4)
+    pd_save_parquet(cars, files['parquet'], root=False)
+    pd_save_feather(cars, files['feather'], root=False)
+
+    return files
+
+
+def load(file_path: str) -> None:
+    ''' loads one file and prints the time and memory used as json '''
+    baseline = memory_status_mb('VmRSS')
+    start = perf_counter()
+
+    if file_path.endswith('.json'):
+        df = normalize(load_json_data(file_path, root=False))
+    else:
+        df = pd_load_file(file_path, root=False)
+
+    print(json.dumps({
+        'rows': len(df.index),
+        'seconds': perf_counter() - start,
+        'peak_rss_mb': memory_status_mb('VmHWM') - baseline,
+    }))
+
+
+def run(num_cars: int, directory: str) -> dict:
+    ''' loads each format of one dataset size in its own process '''
+    files = write_files(num_cars, directory)
+    print(f'\n{num_cars:,} cars_for_sale rows')
+    print(f'{"format":<10}{"load s":>10}{"peak RSS MB":>14}')
+
+    runs = {}
+    for fmt, file_path in files.items():
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_formats', '--load', file_path],
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        runs[fmt] = json.loads(output)
+        print(f'{fmt:<10}{runs[fmt]["seconds"]:>10.2f}{runs[fmt]["peak_rss_mb"]:>14.0f}')
+    return runs
+
+
+def compare_sizes(args: argparse.Namespace) -> dict:
+    ''' loads every format at every size '''
+    results = new_results({'formats': FORMATS, 'seed': 0})
+    with TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            results['runs'][str(size)] = run(size, temp_dir)
+    return results
+
+
+def main() -> int:
+    ''' benchmarks every size, returns 1 if a format regressed against the baseline '''
+    parser = argparse.ArgumentParser(description='Benchmark loading the seed data formats')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES)
+    return run_benchmark('formats', parser, METRICS, compare_sizes)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--load']:
+        load(sys.argv[2])
+    else:
+        sys.exit(main())
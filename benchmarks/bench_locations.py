@@ -0,0 +1,104 @@
+''' Benchmark the in-memory locations index against the SQL prefix search
+
+    Usage: python -m benchmarks.bench_locations [num_customers ...] [--baseline results.json]
+
+    Seeds a throwaway database (BENCH_DB_URL, defaults to in-memory SQLite) with
+    generated customers and times both lookups over a set of typeahead prefixes.
+    Results are written to benchmarks/results, compared against a baseline when
+    given.
+'''
+import argparse
+import sys
+from functools import partial
+from time import perf_counter_ns
+import pandas as pd
+from sqlalchemy import insert
+from src.data.customers_gen import generate_customers
+from src.db.table_classes import Base, Counties, Customers
+from src.db.seed_db import create_counties_table, create_customers_table
+from src.models.location_index import LocationIndex
+from src.models.model_motors import LOCATIONS_STMT, fetch_location_counts
+from .common import new_results, bench_engine, run_benchmark
+
+SIZES = [10_000, 100_000]
+SEARCH_TERMS = ['a', 'ab', 'aber', 'b', 'lon', 'north', 'st', 'w', 'york', 'zz']
+REPEATS = 20
+
+# compared against a baseline, (direction, floor) as in find_regressions
+METRICS = {'sql_us': (1, 100.0), 'index_us': (1, 10.0)}
+
+
+def seed_customers(engine, num_customers: int) -> None:
+    ''' creates the counties and customers tables with generated customers '''
+    Base.metadata.drop_all(engine, tables=[Customers.__table__, Counties.__table__])
+    Base.metadata.create_all(engine, tables=[Counties.__table__, Customers.__table__])
+
+    customers_df = pd.DataFrame(generate_customers(num_customers))
+    counties_df = create_counties_table(customers_df)
+    customers = create_customers_table(customers_df, counties_df)
+
+    with engine.begin() as conn:
+        conn.execute(insert(Counties), counties_df.reset_index().to_dict('records'))
+        conn.execute(insert(Customers), customers.reset_index().to_dict('records'))
+
+
+def time_per_call(func, repeats: int = REPEATS) -> float:
+    ''' returns the mean time per call in microseconds '''
+    start = perf_counter_ns()
+    for _ in range(repeats):
+        func()
+    return (perf_counter_ns() - start) / repeats / 1_000
+
+
+def run(num_customers: int, engine) -> tuple[dict, float]:
+    ''' times both lookups of every term for one dataset size, returns the runs and
+        the index build time in milliseconds
+    '''
+    seed_customers(engine, num_customers)
+
+    with engine.connect() as conn:
+        start = perf_counter_ns()
+        index = LocationIndex(fetch_location_counts(conn))
+        build_ms = (perf_counter_ns() - start) / 1_000_000
+
+        def search_sql(term: str) -> list[str]:
+            return conn.execute(LOCATIONS_STMT, {'search_term': term}).scalars().all()
+
+        print(f'\n{num_customers:,} customers, {len(index):,} index entries '
+              f'(built in {build_ms:.1f} ms)')
+        print(f'{"term":<8}{"sql µs":>12}{"index µs":>12}{"speedup":>10}')
+
+        runs = {}
+        for term in SEARCH_TERMS:
+            runs[term] = {
+                'sql_us': time_per_call(partial(search_sql, term)),
+                'index_us': time_per_call(partial(index.search, term), repeats=REPEATS * 100),
+            }
+            sql_us, index_us = runs[term]['sql_us'], runs[term]['index_us']
+            print(f'{term:<8}{sql_us:>12.1f}{index_us:>12.2f}{sql_us / index_us:>9.0f}x')
+
+    return runs, build_ms
+
+
+def compare_sizes(args: argparse.Namespace) -> dict:
+    ''' times both lookups at every size '''
+    engine = bench_engine('sqlite://')
+    results = new_results({'repeats': REPEATS}, database=engine.dialect.name)
+    results['index_build_ms'] = {}
+
+    for size in args.sizes:
+        runs, build_ms = run(size, engine)
+        results['runs'][str(size)] = runs
+        results['index_build_ms'][str(size)] = build_ms
+    return results
+
+
+def main() -> int:
+    ''' benchmarks every size, returns 1 if a lookup regressed against the baseline '''
+    parser = argparse.ArgumentParser(description='Benchmark the locations index')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES)
+    return run_benchmark('locations', parser, METRICS, compare_sizes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
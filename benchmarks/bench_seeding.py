@@ -0,0 +1,101 @@
+''' Benchmark the bulk loader against a single multi-row INSERT per table
+
+    Usage: python -m benchmarks.bench_seeding [num_cars ...] [--baseline results.json]
+
+    Loads the dimension tables from the json data and a synthetic cars_for_sale
+    table of each size into BENCH_DB_URL (defaults to a SQLite file, use a
+    postgresql+pg8000 URL to measure COPY). The time of each loader is written
+    to benchmarks/results, a loader the database rejects is recorded as failed.
+'''
+import argparse
+import sys
+from time import perf_counter
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from src.db.table_classes import Base, CarsForSale, Models, Colours, Customers
+from src.db.seed_db import create_dimension_tables
+from src.utils.file_utils import pd_load_json
+from .common import new_results, bench_engine, bulk_load, run_benchmark
+
+SIZES = [10_000, 100_000, 1_000_000]
+DEFAULT_URL = 'sqlite:////tmp/bench_seeding.db'
+
+# compared against a baseline, (direction, floor) as in find_regressions
+METRICS = {'seconds': (1, 0.05)}
+
+
+def synthetic_cars(num_cars: int, tables: dict, seed: int = 0) -> pd.DataFrame:
+    ''' random cars_for_sale rows referencing the dimension tables '''
+    rng = np.random.default_rng(seed)
+    cars = pd.DataFrame({
+        'model_id': rng.integers(1, len(tables[Models].index) + 1, num_cars),
+        'colour_id': rng.integers(1, len(tables[Colours].index) + 1, num_cars),
+        'fuel_type': rng.choice(['petrol', 'diesel', 'electric', 'hybrid'], num_cars),
+        'transmission_type': rng.choice(['manual', 'automatic'], num_cars),
+        'customer_id': rng.integers(1, len(tables[Customers].index) + 1, num_cars),
+        'year': rng.integers(2010, 2025, num_cars),
+        'price': rng.integers(1_000, 60_000, num_cars),
+        'mileage': rng.integers(0, 150_000, num_cars),
+        'description': 'Lorem ipsum dolor sit amet.'
+    })
+    return cars.set_index(pd.Index(range(1, num_cars + 1), name='car_id'))
+
+
+def load_with_values(engine, tables: dict) -> None:
+    ''' the previous loader, one insert().values(records) statement per table '''
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table, df in tables.items():
+            conn.execute(insert(table).values(df.to_dict('records')))
+
+
+def load_with_bulk_loader(engine, tables: dict) -> None:
+    ''' COPY or chunked executemany with deferred foreign keys and indexes '''
+    with engine.begin() as conn:
+        bulk_load(conn, tables)
+
+
+def run(num_cars: int, engine, tables: dict) -> dict:
+    ''' times both loaders for one dataset size '''
+    tables = {**tables, CarsForSale: synthetic_cars(num_cars, tables)}
+    print(f'\n{num_cars:,} cars_for_sale rows')
+
+    loaders = {'insert_values': load_with_values, 'bulk_loader': load_with_bulk_loader}
+    runs = {}
+    for name, loader in loaders.items():
+        Base.metadata.drop_all(engine)
+        start = perf_counter()
+        try:
+            loader(engine, tables)
+            runs[name] = {'seconds': perf_counter() - start}
+            print(f'{name:<16}{runs[name]["seconds"]:>10.2f} s')
+        except SQLAlchemyError as exc:
+            error = type(getattr(exc, 'orig', None) or exc).__name__
+            runs[name] = {'failed': error}
+            print(f'{name:<16}{"failed":>10} ({error})')
+    return runs
+
+
+def compare_sizes(args: argparse.Namespace) -> dict:
+    ''' times both loaders at every size '''
+    engine = bench_engine(DEFAULT_URL)
+    results = new_results({'seed': 0}, database=engine.dialect.name)
+    dimension_tables = create_dimension_tables(
+        pd_load_json('data/json/cars.json'), pd_load_json('data/json/customers.json')
+    )
+    for size in args.sizes:
+        results['runs'][str(size)] = run(size, engine, dimension_tables)
+    return results
+
+
+def main() -> int:
+    ''' benchmarks every size, returns 1 if a loader regressed against the baseline '''
+    parser = argparse.ArgumentParser(description='Benchmark the bulk loader')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES)
+    return run_benchmark('seeding', parser, METRICS, compare_sizes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
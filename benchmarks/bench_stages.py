@@ -0,0 +1,136 @@
+''' Time each stage of the seeding pipeline and measure its peak memory
+
+    Usage: python -m benchmarks.bench_stages [num_cars ...] [--repeats N]
+           [--baseline results.json]
+
+    For each size generated cars and customers are written to a temporary json
+    file, then pd_load_json, normalize, create_indexed_column, the dimension
+    tables, create_cars_for_sale and the load into BENCH_DB_URL (defaults to a
+    SQLite file) are run on their own. The best wall time of the repeats and
+    the peak RSS above the stage's starting RSS are recorded, the peak is reset
+    through /proc/self/clear_refs before each stage (Linux only). Results are
+    written to benchmarks/results, compared against a baseline when given.
+'''
+import argparse
+import gc
+import json
+import sys
+from collections.abc import Callable
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import pandas as pd
+from src.data.car_gen import generate_cars_frame
+from src.data.customers_gen import generate_customers_frame
+from src.db.bulk_load import load_dataframe, create_tables_deferred
+from src.db.seed_db import (
+    normalize, create_indexed_column, create_makes_table, create_counties_table,
+    create_colours_table, create_models_table, create_customers_table, create_cars_for_sale
+)
+from src.db.table_classes import Base, Makes, Models, Colours, CarsForSale
+from src.utils.file_utils import load_json_data, pd_load_json
+from .common import new_results, bench_engine, memory_status_mb, run_benchmark
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_URL = 'sqlite:////tmp/bench_stages.db'
+SEED = 0
+
+# compared against a baseline, (direction, floor) as in find_regressions
+METRICS = {'seconds': (1, 0.01), 'peak_mb': (1, 10.0)}
+
+
+def reset_peak_memory() -> None:
+    ''' resets VmHWM to the current RSS so the next peak belongs to one stage '''
+    gc.collect()
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='utf-8') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def measure(stage: Callable[[], object], repeats: int) -> dict:
+    ''' best wall time of the repeats and the peak memory of the first run '''
+    reset_peak_memory()
+    baseline = memory_status_mb('VmRSS')
+    times, peak = [], 0.0
+    for repeat in range(max(repeats, 1)):
+        start = perf_counter()
+        stage()
+        times.append(perf_counter() - start)
+        if repeat == 0:
+            peak = memory_status_mb('VmHWM') - baseline
+
+    return {'seconds': min(times), 'peak_mb': max(peak, 0.0)}
+
+
+def write_cars_json(num_cars: int, directory: str) -> tuple[str, pd.DataFrame]:
+    ''' writes generated cars for sale as a json file, returns its path and the frame '''
+    cars = generate_cars_frame(num_cars, max(1, num_cars // 10), seed=SEED)
+    file_path = f'{directory}/cars_for_sale_{num_cars}.json'
+    with open(file_path, 'w', encoding='utf-8') as out_file:
+        json.dump(cars.astype({'make': str, 'model': str}).to_dict('records'), out_file)
+    return file_path, cars
+
+
+def run(num_cars: int, directory: str, engine, repeats: int) -> dict:
+    ''' measures every stage for one dataset size '''
+    file_path, cars = write_cars_json(num_cars, directory)
+    customers = generate_customers_frame(max(1, num_cars // 10), seed=SEED)
+    source_cars = pd_load_json('data/json/cars.json')
+
+    # the inputs of each stage are built up front so only the stage itself is measured
+    makes = create_makes_table(cars)
+    counties = create_counties_table(customers)
+    tables = {
+        Makes: makes,
+        Models: create_models_table(cars, makes),
+        Colours: create_colours_table(source_cars),
+    }
+    cars_for_sale = normalize(load_json_data(file_path, root=False))
+    cars_df = create_cars_for_sale(cars_for_sale, tables=tables)
+
+    def load_cars_for_sale():
+        Base.metadata.drop_all(engine)
+        with engine.begin() as conn:
+            create_tables_deferred(conn, Base.metadata)
+            load_dataframe(conn, CarsForSale.__table__, cars_df)
+
+    stages = {
+        'pd_load_json': lambda: pd_load_json(file_path, root=False),
+        'normalize': lambda: normalize(load_json_data(file_path, root=False)),
+        'create_indexed_column': lambda: create_indexed_column(cars['model'], unique=True),
+        'create_models_table': lambda: create_models_table(cars, makes),
+        'create_customers_table': lambda: create_customers_table(customers, counties),
+        'create_cars_for_sale': lambda: create_cars_for_sale(cars_for_sale, tables=tables),
+        'load_dataframe': load_cars_for_sale,
+    }
+    return {name: measure(stage, repeats) for name, stage in stages.items()}
+
+
+def measure_sizes(args: argparse.Namespace) -> dict:
+    ''' measures the stages of every size '''
+    engine = bench_engine(DEFAULT_URL)
+    results = new_results({'repeats': args.repeats, 'seed': SEED}, database=engine.dialect.name)
+
+    with TemporaryDirectory() as temp_dir:
+        for size in args.sizes:
+            stages = run(size, temp_dir, engine, args.repeats)
+            results['runs'][str(size)] = stages
+
+            print(f'\n{size:,} cars_for_sale rows')
+            print(f'{"stage":<24}{"seconds":>10}{"peak MB":>10}')
+            for name, stage in stages.items():
+                print(f'{name:<24}{stage["seconds"]:>10.3f}{stage["peak_mb"]:>10.1f}')
+    return results
+
+
+def main() -> int:
+    ''' measures every size, returns 1 if a stage regressed against the baseline '''
+    parser = argparse.ArgumentParser(description='Benchmark the seeding pipeline stages')
+    parser.add_argument('sizes', nargs='*', type=int, default=SIZES)
+    parser.add_argument('--repeats', type=int, default=3)
+    return run_benchmark('stages', parser, METRICS, measure_sizes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+''' Measure the memory of each uvicorn worker with and without the shared snapshot
+
+    Usage: python -m benchmarks.bench_workers [num_cars] [--workers 1 2 4]
+           [--baseline results.json]
+
+    The database at BENCH_DB_URL (defaults to a SQLite file) is seeded with
+    generated cars as in bench_app and a shared snapshot is published to a
+    temporary directory. src.main:app is then started with SEARCH_ENGINE=memory
+    and each number of workers, once mapping the snapshot and once with an
+    empty snapshot directory so every worker reads its own copy from the
+    database. After a round of searches the unique (private) and proportional
+    memory of every worker is read from /proc/<pid>/smaps_rollup (Linux only).
+'''
+import argparse
+import asyncio
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+import httpx
+from src.db.snapshot import snapshot_tables
+from src.utils.response_cache import DataVersion, new_version
+from src.utils.shared_snapshot import SharedSnapshot
+from .bench_app import PORT, SCENARIOS, seed, start_server, drive
+from .common import new_results, bench_engine, run_benchmark
+
+DEFAULT_CARS = 100_000
+DEFAULT_URL = 'sqlite:////tmp/bench_workers.db'
+WORKERS = [1, 2, 4]
+
+# compared against a baseline, (direction, floor) as in find_regressions
+METRICS = {'worker_private_mb': (1, 5.0), 'startup_seconds': (1, 0.5)}
+
+
+def worker_pids(pid: int) -> list[int]:
+    ''' the uvicorn worker processes, the server itself when it runs a single worker '''
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children', encoding='utf-8') as children:
+            pids = [int(child) for child in children.read().split()]
+    except OSError:
+        return [pid]
+
+    def is_worker(child: int) -> bool:
+        with open(f'/proc/{child}/cmdline', 'rb') as cmdline:
+            return b'resource_tracker' not in cmdline.read()
+    return [child for child in pids if is_worker(child)] or [pid]
+
+
+def memory_mb(pid: int) -> dict:
+    ''' private and proportional set size of the process in MB '''
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as rollup:
+        for line in rollup:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0]) / 1024
+    return {
+        'private_mb': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        'pss_mb': fields.get('Pss', 0),
+        'rss_mb': fields.get('Rss', 0),
+    }
+
+
+async def search_round(workers: int) -> None:
+    ''' sends enough searches that every worker has answered some '''
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{PORT}', timeout=60) as client:
+        await drive(client, SCENARIOS['search'], 50 * workers, 2 * workers)
+
+
+def measure(db_url: str, workers: int, server_env: dict) -> dict:
+    ''' starts the app with the workers, searches, then reads the memory of every worker '''
+    start = perf_counter()
+    server = start_server(db_url, cache=False, workers=workers, extra_env=server_env)
+    startup_seconds = perf_counter() - start
+    try:
+        asyncio.run(search_round(workers))
+        memory = [memory_mb(pid) for pid in worker_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+
+    count = max(len(memory), 1)
+    return {
+        'workers': len(memory),
+        'startup_seconds': startup_seconds,
+        'worker_private_mb': sum(usage['private_mb'] for usage in memory) / count,
+        'worker_rss_mb': sum(usage['rss_mb'] for usage in memory) / count,
+        'total_pss_mb': sum(usage['pss_mb'] for usage in memory),
+    }
+
+
+def measure_modes(args: argparse.Namespace) -> dict:
+    ''' measures every worker count with the shared snapshot and with private copies '''
+    engine = bench_engine(DEFAULT_URL)
+    db_url = engine.url.render_as_string(hide_password=False)
+    results = new_results(
+        {'num_cars': args.num_cars, 'workers': args.workers}, database=engine.dialect.name
+    )
+    seed(engine, args.num_cars)
+
+    with TemporaryDirectory() as temp_dir:
+        version = new_version()
+        with engine.connect() as conn:
+            SharedSnapshot(f'{temp_dir}/snapshots').write(version, snapshot_tables(conn))
+        DataVersion(f'{temp_dir}/version').bump(version)
+
+        print(f'\n{args.num_cars:,} cars for sale')
+        print(f'{"mode":<10}{"workers":>8}{"startup s":>11}{"private MB":>12}'
+              f'{"rss MB":>9}{"total pss MB":>14}')
+
+        modes = {'shared': f'{temp_dir}/snapshots', 'private': f'{temp_dir}/empty'}
+        for mode, snapshot_path in modes.items():
+            server_env = {
+                'SEARCH_ENGINE': 'memory',
+                'SNAPSHOT_PATH': snapshot_path,
+                'DATA_VERSION_PATH': f'{temp_dir}/version',
+            }
+            for workers in args.workers:
+                run = measure(db_url, workers, server_env)
+                results['runs'].setdefault(mode, {})[str(workers)] = run
+                print(f'{mode:<10}{run["workers"]:>8}{run["startup_seconds"]:>11.2f}'
+                      f'{run["worker_private_mb"]:>12.1f}{run["worker_rss_mb"]:>9.1f}'
+                      f'{run["total_pss_mb"]:>14.1f}')
+    return results
+
+
+def main() -> int:
+    ''' measures every worker count in both modes, returns 1 if memory regressed '''
+    parser = argparse.ArgumentParser(description='Measure uvicorn worker memory')
+    parser.add_argument('num_cars', nargs='?', type=int, default=DEFAULT_CARS)
+    parser.add_argument('--workers', nargs='+', type=int, default=WORKERS)
+    return run_benchmark('workers', parser, METRICS, measure_modes)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
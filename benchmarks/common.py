@@ -0,0 +1,148 @@
+''' Shared runner and result files of the benchmarks
+
+    Results are json files in benchmarks/results holding the commit, the machine
+    and the settings next to the measurements, runs[size][name][metric], so a
+    later run can be compared against them as a baseline. A benchmark supplies
+    its arguments and a workload returning the results to run_benchmark, which
+    adds --baseline and --output, writes the results and reports regressions.
+'''
+import argparse
+import json
+import platform
+import subprocess
+from collections.abc import Callable
+from datetime import datetime, timezone
+from os import environ as env, makedirs
+from sqlalchemy import Connection, create_engine
+from sqlalchemy.engine import Engine
+from src.db.bulk_load import load_dataframe, create_tables_deferred, create_deferred_constraints
+from src.db.table_classes import Base
+
+RESULTS_DIR = 'benchmarks/results'
+
+# a metric is reported as a regression when worse than the baseline by more than this
+REGRESSION_THRESHOLD = 0.2
+
+
+def git_commit() -> str:
+    ''' the current commit so results can be matched to the code measured '''
+    output = subprocess.run(
+        ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=False
+    )
+    return output.stdout.strip() or 'unknown'
+
+
+def new_results(settings: dict, **metadata) -> dict:
+    ''' an empty results document describing the code, machine and settings '''
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        **metadata,
+        'settings': settings,
+        'runs': {},
+    }
+
+
+def write_results(results: dict, name: str, output: str = None) -> str:
+    ''' writes the results to output or a new file in RESULTS_DIR, returns the path '''
+    if not output:
+        makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.fromisoformat(results['timestamp']).strftime('%Y%m%dT%H%M%S')
+        output = f'{RESULTS_DIR}/{name}-{stamp}-{results["commit"]}.json'
+
+    with open(output, 'w', encoding='utf-8') as out_file:
+        json.dump(results, out_file, indent=2)
+    return output
+
+
+def bench_engine(default_url: str) -> Engine:
+    ''' engine on BENCH_DB_URL, the benchmark's own SQLite file when not set '''
+    return create_engine(env.get('BENCH_DB_URL', default_url))
+
+
+def memory_status_mb(key: str) -> float:
+    ''' reads VmRSS or VmHWM from /proc/self/status in MB, 0 if unavailable (Linux only)
+
+        ru_maxrss is not used as Linux carries it over from the parent process
+        through fork and exec, hiding the peak of a process started to measure.
+    '''
+    try:
+        with open('/proc/self/status', encoding='utf-8') as status:
+            for line in status:
+                if line.startswith(f'{key}:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def bulk_load(conn: Connection, tables: dict) -> None:
+    ''' creates the tables and loads the frames with the bulk loader, foreign keys last '''
+    create_tables_deferred(conn, Base.metadata)
+    for table, df in tables.items():
+        load_dataframe(conn, table.__table__, df)
+    create_deferred_constraints(conn, Base.metadata)
+
+
+def metric_regressions(
+    previous: dict, current: dict, metrics: dict, threshold: float = REGRESSION_THRESHOLD
+) -> list[str]:
+    ''' lists the metrics of one run worse than the previous run by more than the threshold
+
+        metrics maps each metric to (direction, floor), direction is 1 when
+        higher is worse and -1 when lower is worse. Values below the floor in
+        both runs are too small to compare reliably and are skipped.
+    '''
+    regressions = []
+    for metric, (direction, floor) in metrics.items():
+        before, after = previous.get(metric), current.get(metric)
+        if not before or after is None or max(before, after) < floor:
+            continue
+        if (after / before - 1) * direction > threshold:
+            regressions.append(f'{metric}: {before:.3g} -> {after:.3g}')
+    return regressions
+
+
+def find_regressions(
+    results: dict, baseline_file: str, metrics: dict, threshold: float = REGRESSION_THRESHOLD
+) -> list[str]:
+    ''' lists the metrics of every run worse than in the baseline file, as metric_regressions '''
+    with open(baseline_file, encoding='utf-8') as in_file:
+        baseline = json.load(in_file)
+
+    return [
+        f'{size} {name} {regression}'
+        for size, entries in results['runs'].items()
+        for name, current in entries.items()
+        for regression in metric_regressions(
+            baseline['runs'].get(size, {}).get(name, {}), current, metrics, threshold
+        )
+    ]
+
+
+def run_benchmark(
+    name: str,
+    parser: argparse.ArgumentParser,
+    metrics: dict,
+    workload: Callable[[argparse.Namespace], dict]
+) -> int:
+    ''' runs the workload with the parsed arguments and writes the results it returns
+
+        Returns 1 if a metric regressed against the --baseline results, else 0.
+    '''
+    parser.add_argument('--baseline', help='results json of an earlier run to compare against')
+    parser.add_argument('--output', help=f'defaults to a new file in {RESULTS_DIR}')
+    args = parser.parse_args()
+
+    results = workload(args)
+    output = write_results(results, name, args.output)
+    print(f'\nresults written to {output}')
+
+    if not args.baseline:
+        return 0
+    regressions = find_regressions(results, args.baseline, metrics)
+    for regression in regressions:
+        print(f'regression: {regression}')
+    return 1 if regressions else 0
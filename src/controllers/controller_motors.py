@@ -1,19 +1,38 @@
 ''' route handlers for treasures api '''
-from typing import Dict
-from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse
+from typing import Annotated, Dict
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
 from ..dependencies import ROOT_PATH
-from ..models.model_motors import fetch_locations
+from ..db.connection import get_async_engine
+from ..db.logger import query_metrics, statement_registry
+from ..models.model_motors import search_locations_async, current_dimensions, LOCATIONS_LIMIT
+from ..models.model_search import SearchFilters
+from ..models.model_inventory import inventory_snapshot, search_cars_async
+from ..models.model_nearby import NearbyFilters, nearby_listings_async
+from ..models.model_export import (
+    ExportFilters, EXPORT_MEDIA_TYPES, export_statement, stream_export
+)
+from ..utils.response_cache import response_cache
 
 router = APIRouter()
 templates = Jinja2Templates(directory=f'{ROOT_PATH}/views')
 
+# compiled by warm_templates when the app starts
+TEMPLATES = ['index.html', 'partials/locations_datalist.html', 'partials/options.html']
+
+
+def warm_templates() -> None:
+    ''' loads and compiles the templates so the first requests do not pay for it '''
+    for name in TEMPLATES:
+        templates.get_template(name)
+
 
 # Homepage and search form
 @router.get('/', response_class=HTMLResponse)
-def homepage(request: Request) -> HTMLResponse:
+@response_cache.cached
+async def homepage(request: Request) -> HTMLResponse:
     ''' return the home page '''
     return templates.TemplateResponse(
         request, name='index.html'
@@ -22,21 +41,128 @@ def homepage(request: Request) -> HTMLResponse:
 
 # Initial healthcheck
 @router.get('/api/healthcheck')
-def get_healthcheck() -> Dict:
+async def get_healthcheck() -> Dict:
     ''' Check that we are all up and running! '''
     return {'message': 'application is healthy'}
 
 
+# Query timings per statement fingerprint
+@router.get('/api/metrics')
+async def get_metrics() -> Dict:
+    ''' Return latency percentiles for every query, compiled and response cache hit rates '''
+    return {
+        'queries': query_metrics.snapshot(),
+        'statements': statement_registry.snapshot(),
+        'response_cache': response_cache.stats(),
+        'inventory': inventory_snapshot.stats()
+    }
+
+
 # Fetch all treasures
 # Returns an datalist of all matching locations
 @router.get('/api/locations', response_class=HTMLResponse)
-def get_locations(request: Request, search_term:str = '') -> HTMLResponse:
+@response_cache.cached
+async def get_locations(
+    request: Request, search_term:str = '', limit: int = LOCATIONS_LIMIT
+) -> HTMLResponse:
     ''' return all treasures and their shop details '''
     locations = []
 
     if search_term:
-        locations = fetch_locations(search_term)
+        locations = await search_locations_async(get_async_engine(request), search_term, limit)
 
     return templates.TemplateResponse(
         request, name='partials/locations_datalist.html', context={'locations': locations}
     )
+
+
+# Chained make, model and colour selects
+# Return the options of each select from the dimension cache
+@router.get('/api/makes', response_class=HTMLResponse)
+@response_cache.cached
+async def get_makes(request: Request, make: str = '') -> HTMLResponse:
+    ''' return the options of every make, the current make selected '''
+    dimensions = await current_dimensions(get_async_engine(request))
+    return templates.TemplateResponse(
+        request, name='partials/options.html',
+        context={'placeholder': 'Any make', 'options': dimensions.makes(), 'selected': make}
+    )
+
+
+@router.get('/api/models', response_class=HTMLResponse)
+@response_cache.cached
+async def get_models(request: Request, make: str = '', model: str = '') -> HTMLResponse:
+    ''' return the options of the models of the make, the current model selected '''
+    dimensions = await current_dimensions(get_async_engine(request))
+    return templates.TemplateResponse(
+        request, name='partials/options.html',
+        context={'placeholder': 'Any model', 'options': dimensions.models(make), 'selected': model}
+    )
+
+
+@router.get('/api/colours', response_class=HTMLResponse)
+@response_cache.cached
+async def get_colours(
+    request: Request, make: str = '', model: str = '', colour: str = ''
+) -> HTMLResponse:
+    ''' return the options of the colours the model, or the models of the make, come in,
+        the current colour selected
+    '''
+    dimensions = await current_dimensions(get_async_engine(request))
+    return templates.TemplateResponse(
+        request, name='partials/options.html',
+        context={
+            'placeholder': 'Any colour',
+            'options': dimensions.colours(make, model),
+            'selected': colour
+        }
+    )
+
+
+# Search cars for sale
+# Returns the matching cars and the counts for every filter in the form
+@router.get('/api/cars/search')
+@response_cache.cached
+async def get_cars_search(
+    request: Request,
+    filters: Annotated[SearchFilters, Query()]
+) -> Dict:
+    ''' return a page of filtered cars with facet counts, use next_cursor for the next page '''
+    try:
+        return await search_cars_async(get_async_engine(request), filters)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+# Search cars for sale by distance
+# Returns the cars sold within the radius of a town, nearest first
+@router.get('/api/cars/nearby')
+@response_cache.cached
+async def get_cars_nearby(
+    request: Request,
+    filters: Annotated[NearbyFilters, Query()]
+) -> Dict:
+    ''' return the cars within filters.miles of the town with their distance in miles '''
+    try:
+        return await nearby_listings_async(get_async_engine(request), filters)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+# Export cars for sale
+# Streams every matching car as a CSV, NDJSON or Parquet file
+@router.get('/api/cars/export')
+async def get_cars_export(
+    request: Request, filters: Annotated[ExportFilters, Query()]
+) -> StreamingResponse:
+    ''' stream the filtered cars in batches, memory use does not depend on the number of cars '''
+    try:
+        stmt = export_statement(filters)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    return StreamingResponse(
+        stream_export(get_async_engine(request), stmt, filters.format),
+        media_type=EXPORT_MEDIA_TYPES[filters.format],
+        headers={'Content-Disposition': f'attachment; filename="cars_for_sale.{filters.format}"'}
+    )
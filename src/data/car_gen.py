@@ -1,11 +1,16 @@
 ''' Generate random car sales data and save it to a JSON file '''
 import json
+from argparse import ArgumentParser
+from os import makedirs
 from random import choice, randint
+from typing import Iterator
 import numpy as np
+import pandas as pd
+from lorem.data import WORDS
 from lorem.text import TextLorem
-from .customers_gen import generate_customers
+from .customers_gen import generate_customers, generate_customers_chunks
 from ..dependencies import ROOT_PATH
-from ..utils.file_utils import load_json_data
+from ..utils.file_utils import load_json_data, pd_save_chunks
 
 OLDEST = 2010
 NEWEST = 2024
@@ -13,6 +18,9 @@ AVG_YEARLY_MILEAGE = [5_000, 12_000]
 EXPECTED_YEARLY_MILEAGE = 10_000
 DECREASE_PER_YEAR = np.array([0,19,31,42,51,60,65,71,76,82,85,91,95]) / 100
 NUM_ENTRIES = 500
+NUM_DESCRIPTIONS = 1_000
+CHUNK_SIZE = 100_000
+GENERATED_DIR = 'data/generated'
 
 def calculate_price(year: int, init_price: int, mileage: int) -> int:
     '''Calculate the price of a car based on its year, initial price, and mileage'''
@@ -63,10 +71,129 @@ def generate_cars(customers: list[dict]) -> list[dict]:
         generate_car_entry(choice(cars), choice(customers)) for _ in range(num_entries)
     ]
 
+# -------- Batched generation --------
+
+def calculate_prices(ages: np.ndarray, init_prices: np.ndarray, mileages: np.ndarray) -> np.ndarray:
+    '''Vectorised calculate_price for arrays of ages, initial prices and mileages'''
+    expected_mileages = ages * EXPECTED_YEARLY_MILEAGE
+    percentage_for_mileage = (mileages - expected_mileages) * 0.000_001
+    decrease = DECREASE_PER_YEAR.take(ages, mode='clip') + percentage_for_mileage
+
+    return (init_prices - init_prices * decrease).astype(np.int64)
+
+def calculate_mileages(rng: np.random.Generator, ages: np.ndarray) -> np.ndarray:
+    '''Vectorised calculate_mileage, one yearly mileage +/- 1000 per year of age'''
+    yearly_mileages = rng.integers(AVG_YEARLY_MILEAGE[0], AVG_YEARLY_MILEAGE[1] + 1, ages.size)
+    variations = rng.integers(-1000, 1001, size=(ages.size, NEWEST - OLDEST), dtype=np.int32)
+    variations[np.arange(NEWEST - OLDEST) >= ages[:, None]] = 0
+
+    return yearly_mileages * ages + variations.sum(axis=1)
+
+def choose_per_row(
+    rng: np.random.Generator, options: list[list[str]], rows: np.ndarray
+) -> pd.Categorical:
+    '''Pick one of the options of rows[i] for each row e.g. a colour offered for the car'''
+    categories = sorted({option for row_options in options for option in row_options})
+    codes = {category: code for code, category in enumerate(categories)}
+
+    lengths = np.array([len(row_options) for row_options in options])
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    flat_codes = np.array([codes[option] for row_options in options for option in row_options])
+    picks = (rng.random(rows.size) * lengths[rows]).astype(np.int64)
+
+    return pd.Categorical.from_codes(flat_codes[offsets[rows] + picks], categories=categories)
+
+def lorem_paragraphs(rng: np.random.Generator, size: int) -> np.ndarray:
+    '''Generate a pool of two sentence lorem paragraphs to draw descriptions from'''
+    words = np.array(WORDS)
+
+    def sentence() -> str:
+        text = ' '.join(rng.choice(words, rng.integers(10, 21)))
+        return text[0].upper() + text[1:] + '.'
+
+    return np.array([f'{sentence()} {sentence()}' for _ in range(size)], dtype=object)
+
+def generate_cars_frame(
+    num_entries: int, num_customers: int, seed: int | np.random.Generator | None = None
+) -> pd.DataFrame:
+    '''Generate random car sales data as a DataFrame, drawing every column in one pass
+
+    Produces the same columns and distributions as generate_cars, with the low
+    cardinality columns as categoricals. Pass a seed for reproducible data.
+    '''
+    rng = np.random.default_rng(seed)
+    cars = load_json_data(f'{ROOT_PATH}/data/json/cars.json')
+    car_rows = rng.integers(0, len(cars), num_entries)
+
+    def car_column(key: str) -> pd.Categorical:
+        categories = sorted({car[key] for car in cars})
+        codes = np.array([categories.index(car[key]) for car in cars])
+        return pd.Categorical.from_codes(codes[car_rows], categories=categories)
+
+    years = rng.integers(OLDEST, NEWEST + 1, num_entries)
+    ages = NEWEST - years
+    mileages = calculate_mileages(rng, ages)
+    init_prices = np.array([car['retail_price'] for car in cars])[car_rows]
+    descriptions = lorem_paragraphs(rng, NUM_DESCRIPTIONS)
+
+    return pd.DataFrame({
+        'make': car_column('make'),
+        'model': car_column('model'),
+        'year': years,
+        'fuel_type': choose_per_row(rng, [car['fuel_types'] for car in cars], car_rows),
+        'transmission': choose_per_row(rng, [car['transmissions'] for car in cars], car_rows),
+        'color': choose_per_row(rng, [car['colours'] for car in cars], car_rows),
+        'customer_id': rng.integers(1, num_customers + 1, num_entries),
+        'mileage': mileages,
+        'price': calculate_prices(ages, init_prices, mileages),
+        'description': descriptions[rng.integers(0, NUM_DESCRIPTIONS, num_entries)],
+    })
+
+def generate_cars_chunks(
+    num_entries: int, num_customers: int, chunk_size: int, seed: int | None = None
+) -> Iterator[pd.DataFrame]:
+    '''Generate random car sales data in DataFrames of at most chunk_size rows'''
+    rng = np.random.default_rng(seed)
+    for start in range(0, num_entries, chunk_size):
+        yield generate_cars_frame(min(chunk_size, num_entries - start), num_customers, seed=rng)
+
+def write_generated_data(
+    num_entries: int, num_customers: int, file_format: str = 'parquet',
+    chunk_size: int = CHUNK_SIZE, seed: int | None = None
+) -> tuple[str, str]:
+    '''Stream generated customers and cars to data/generated with bounded memory
+
+    Parquet and Feather files store make, model, colour and the other low
+    cardinality columns dictionary encoded, they load back as categoricals.
+    '''
+    makedirs(f'{ROOT_PATH}/{GENERATED_DIR}', exist_ok=True)
+    customers_file = f'{GENERATED_DIR}/customers.{file_format}'
+    cars_file = f'{GENERATED_DIR}/cars_for_sale.{file_format}'
+
+    pd_save_chunks(generate_customers_chunks(num_customers, chunk_size, seed), customers_file)
+    pd_save_chunks(generate_cars_chunks(num_entries, num_customers, chunk_size, seed), cars_file)
+
+    return customers_file, cars_file
+
 if __name__ == '__main__':
-    rand_customers = generate_customers(NUM_ENTRIES)
-    with open(f'{ROOT_PATH}/data/json/customers.json', 'w', encoding='utf-8') as out_file:
-        json.dump(rand_customers, out_file, indent=4)
+    parser = ArgumentParser(description='Generate customers and cars for sale')
+    parser.add_argument('--entries', type=int, default=NUM_ENTRIES)
+    parser.add_argument('--customers', type=int, help='defaults to the number of entries')
+    parser.add_argument(
+        '--format', choices=['json', 'ndjson', 'parquet', 'feather'], default='json'
+    )
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    if args.format != 'json':
+        print(write_generated_data(
+            args.entries, args.customers or args.entries, args.format, args.chunk_size, args.seed
+        ))
+    else:
+        rand_customers = generate_customers(args.entries)
+        with open(f'{ROOT_PATH}/data/json/customers.json', 'w', encoding='utf-8') as out_file:
+            json.dump(rand_customers, out_file, indent=4)
 
-    with open(f'{ROOT_PATH}/data/json/cars_for_sale.json', 'w', encoding='utf-8') as out_file:
-        json.dump(generate_cars(rand_customers), out_file, indent=4)
+        with open(f'{ROOT_PATH}/data/json/cars_for_sale.json', 'w', encoding='utf-8') as out_file:
+            json.dump(generate_cars(rand_customers), out_file, indent=4)
@@ -1,5 +1,8 @@
 ''' Generate random car sales data and save it to a JSON file '''
 from random import choice
+from typing import Iterator
+import numpy as np
+import pandas as pd
 from ..dependencies import ROOT_PATH
 from ..utils.file_utils import load_json_data
 
@@ -25,3 +28,36 @@ def generate_customers(num_entries: int) -> list[dict]:
     return [
         generate_customer(choice(customers), choice(locations), i) for i in range(num_entries)
     ]
+
+def generate_customers_frame(
+    num_entries: int, seed: int | np.random.Generator | None = None, start_id: int = 1
+) -> pd.DataFrame:
+    '''Generate random customers as a DataFrame, drawing every column in one pass'''
+    rng = np.random.default_rng(seed)
+    names = pd.DataFrame(load_json_data(f'{ROOT_PATH}/data/json/customers_names.json'))
+    locations = pd.DataFrame(load_json_data(f'{ROOT_PATH}/data/json/locations.json'))
+
+    name_rows = rng.integers(0, len(names.index), num_entries)
+    location_rows = rng.integers(0, len(locations.index), num_entries)
+
+    # categories from every location, so all chunks share one dictionary when written
+    def categorical(column: str) -> pd.Categorical:
+        dtype = pd.CategoricalDtype(sorted(locations[column].unique()))
+        return pd.Categorical(locations[column].to_numpy()[location_rows], dtype=dtype)
+
+    return pd.DataFrame({
+        'customer_id': np.arange(start_id, start_id + num_entries),
+        'first_name': names['first_name'].to_numpy()[name_rows],
+        'last_name': names['last_name'].to_numpy()[name_rows],
+        'town': categorical('town'),
+        'county': categorical('county'),
+    })
+
+def generate_customers_chunks(
+    num_entries: int, chunk_size: int, seed: int | None = None
+) -> Iterator[pd.DataFrame]:
+    '''Generate random customers in DataFrames of at most chunk_size rows'''
+    rng = np.random.default_rng(seed)
+    for start in range(0, num_entries, chunk_size):
+        size = min(chunk_size, num_entries - start)
+        yield generate_customers_frame(size, seed=rng, start_id=start + 1)
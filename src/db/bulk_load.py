@@ -0,0 +1,114 @@
+''' Bulk loading of dataframes into the database
+
+    PostgreSQL tables are streamed with COPY ... FROM STDIN through an in-memory
+    CSV buffer, other databases fall back to chunked executemany inserts.
+    Foreign keys and indexes can be deferred until the data has been loaded.
+'''
+from contextlib import closing
+from io import StringIO
+import pandas as pd
+from sqlalchemy import Connection, MetaData, Table, insert, select, func, text
+from sqlalchemy.schema import AddConstraint, CreateTable
+
+# rows written per COPY / executemany batch, bounds the size of the buffer
+CHUNK_SIZE = 100_000
+
+# written for missing values, COPY csv would otherwise read an unquoted empty string as NULL
+NULL_MARKER = r'\N'
+
+
+def supports_copy(conn: Connection) -> bool:
+    ''' COPY FROM STDIN is available through the pg8000 cursor stream argument '''
+    return conn.dialect.name == 'postgresql' and conn.dialect.driver == 'pg8000'
+
+
+def table_records(table: Table, df: pd.DataFrame) -> pd.DataFrame:
+    ''' moves a named primary key index into a column and orders the columns as the table '''
+    if df.index.name in table.c:
+        df = df.reset_index()
+    return df[[column.name for column in table.c if column.name in df.columns]]
+
+
+def csv_buffer(df: pd.DataFrame) -> StringIO:
+    ''' the rows as csv for COPY, missing values written as NULL_MARKER '''
+    buffer = StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep=NULL_MARKER)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_dataframe(conn: Connection, table: Table, df: pd.DataFrame) -> None:
+    ''' streams the dataframe into the table with COPY in chunks of CHUNK_SIZE rows '''
+    columns = ', '.join(f'"{column}"' for column in df.columns)
+    statement = (
+        f'COPY "{table.name}" ({columns}) FROM STDIN '
+        f"WITH (FORMAT csv, NULL '{NULL_MARKER}')"
+    )
+
+    with closing(conn.connection.cursor()) as cursor:
+        for start in range(0, len(df.index), CHUNK_SIZE):
+            cursor.execute(statement, stream=csv_buffer(df.iloc[start:start + CHUNK_SIZE]))
+
+
+def insert_dataframe(conn: Connection, table: Table, df: pd.DataFrame) -> None:
+    ''' inserts the dataframe with executemany in chunks of CHUNK_SIZE rows '''
+    for start in range(0, len(df.index), CHUNK_SIZE):
+        records = df.iloc[start:start + CHUNK_SIZE].to_dict('records')
+        conn.execute(insert(table), records)
+
+
+def reset_sequence(conn: Connection, table: Table) -> None:
+    ''' moves a serial primary key sequence past the explicitly loaded ids '''
+    if conn.dialect.name != 'postgresql' or len(table.primary_key.columns) != 1:
+        return
+
+    [column] = table.primary_key.columns
+    conn.execute(
+        select(func.setval(
+            func.pg_get_serial_sequence(table.name, column.name),
+            func.coalesce(select(func.max(column)).scalar_subquery(), 0) + 1,
+            False
+        ))
+    )
+
+
+def load_dataframe(conn: Connection, table: Table, df: pd.DataFrame) -> int:
+    ''' loads the dataframe into the table, returns the number of rows loaded '''
+    df = table_records(table, df)
+
+    if supports_copy(conn):
+        copy_dataframe(conn, table, df)
+    else:
+        insert_dataframe(conn, table, df)
+
+    reset_sequence(conn, table)
+    return len(df.index)
+
+
+def create_tables_deferred(conn: Connection, metadata: MetaData) -> None:
+    ''' creates the tables without foreign keys or indexes '''
+    if not conn.dialect.supports_alter:
+        metadata.create_all(conn)
+        return
+
+    # creates the enum types and runs the metadata before_create DDL e.g. extensions
+    metadata.create_all(conn, tables=[])
+
+    for table in metadata.sorted_tables:
+        conn.execute(CreateTable(table, include_foreign_key_constraints=[]))
+
+
+def create_deferred_constraints(conn: Connection, metadata: MetaData) -> None:
+    ''' adds the foreign keys and indexes skipped by create_tables_deferred '''
+    if not conn.dialect.supports_alter:
+        return
+
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            # create() rather than CreateIndex so dialect specific indexes are skipped
+            index.create(conn)
+        for constraint in table.foreign_key_constraints:
+            conn.execute(AddConstraint(constraint))
+
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('ANALYZE'))
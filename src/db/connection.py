@@ -1,37 +1,125 @@
 ''' Database connection module for SQLAlchemy '''
 from os import environ as env
+from functools import cache
+from typing import AsyncIterator, Iterator, Optional, TYPE_CHECKING
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, URL
+from fastapi import Request
+from sqlalchemy import create_engine, event, make_url, URL
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from ..dependencies import ROOT_PATH
-from .logger import log_query_time
+from .logger import log_query_time, query_metrics, statement_registry
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
 
 # Load the environment variables based on the app environment
 APP_ENV = env.get('APP_ENV', default='test')
 load_dotenv(f'{ROOT_PATH}/.env.{APP_ENV}')
 
-print(f'\nEnvironment: {APP_ENV}')
-print(env.get('PG_USER'))
-# create a connection URL for SQLAlchemy
-CONNECTION_URL = URL.create(
-    'postgresql+pg8000',
-    username    = env.get('PG_USER'),
-    password    = env.get('PG_PASSWORD'),
-    host        = env.get('PG_HOST'),
-    database    = env.get('PG_DATABASE'),
-    port        = env.get('PG_PORT')
-)
-
-# Create the SQLAlchemy engine
-engine = create_engine(CONNECTION_URL)
+def env_int(name: str, default: int) -> int:
+    ''' reads an integer setting from the environment '''
+    return int(env.get(name) or default)
+
+def env_bool(name: str, default: bool) -> bool:
+    ''' reads a true/false setting from the environment '''
+    return env.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+# Connection pool settings, override in .env.{APP_ENV}
+POOL_OPTIONS = {
+    'pool_size': env_int('PG_POOL_SIZE', 5),
+    'max_overflow': env_int('PG_MAX_OVERFLOW', 10),
+    'pool_timeout': env_int('PG_POOL_TIMEOUT', 30),
+    'pool_recycle': env_int('PG_POOL_RECYCLE', 1800),
+    'pool_pre_ping': env_bool('PG_POOL_PRE_PING', True),
+}
+
+# Statement timeout in milliseconds applied to every connection (0 disables it)
+STATEMENT_TIMEOUT = env_int('PG_STATEMENT_TIMEOUT', 0)
+
+# Driver for the optional async engine e.g. asyncpg
+ASYNC_DRIVER = env.get('PG_ASYNC_DRIVER', 'asyncpg')
+
+def create_url(driver: str = 'pg8000') -> URL:
+    ''' create a connection URL for SQLAlchemy '''
+    return URL.create(
+        f'postgresql+{driver}',
+        username    = env.get('PG_USER'),
+        password    = env.get('PG_PASSWORD'),
+        host        = env.get('PG_HOST'),
+        database    = env.get('PG_DATABASE'),
+        port        = env.get('PG_PORT')
+    )
+
+# DATABASE_URL replaces the PostgreSQL settings e.g. sqlite:///bench.db for benchmarks
+CONNECTION_URL = env.get('DATABASE_URL') or create_url()
+
+def set_statement_timeout(dbapi_connection, _):
+    ''' applies the statement timeout to each new pooled connection '''
+    if not STATEMENT_TIMEOUT:
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'SET statement_timeout = {STATEMENT_TIMEOUT}')
+    cursor.close()
+    dbapi_connection.commit()
+
+@cache
+def get_engine() -> Engine:
+    ''' Create the sync engine on first use, importing a module does not build it
+
+        Used by the seeding and sync scripts and the sync fallbacks, the app
+        disposes of it on shutdown if it was created.
+    '''
+    engine = create_engine(CONNECTION_URL, **POOL_OPTIONS)
+    query_metrics.instrument(engine)
+    statement_registry.instrument(engine)
+    event.listen(engine, 'connect', set_statement_timeout)
+    return engine
+
+def dispose_engine() -> None:
+    ''' closes the pooled connections of the sync engine, if it was created '''
+    if get_engine.cache_info().currsize:
+        get_engine().dispose()
+
+def create_async_url() -> URL:
+    ''' the connection URL with the async driver, aiosqlite for a SQLite DATABASE_URL '''
+    if not env.get('DATABASE_URL'):
+        return create_url(ASYNC_DRIVER)
+
+    url = make_url(CONNECTION_URL)
+    if url.get_backend_name() == 'sqlite':
+        return url.set(drivername='sqlite+aiosqlite')
+    return url.set(drivername=f'{url.get_backend_name()}+{ASYNC_DRIVER}')
+
+def create_async_db_engine() -> Optional['AsyncEngine']:
+    ''' Create the async engine, None if the async driver is not installed
+
+        Called from the app lifespan, which disposes of it on shutdown.
+    '''
+    connect_args = {}
+    # pylint: disable=import-outside-toplevel
+    if STATEMENT_TIMEOUT and ASYNC_DRIVER == 'asyncpg':
+        connect_args['server_settings'] = {'statement_timeout': str(STATEMENT_TIMEOUT)}
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        async_engine = create_async_engine(
+            create_async_url(), connect_args=connect_args, **POOL_OPTIONS
+        )
+    except ImportError as exc:
+        print(f'Async engine unavailable: {exc}')
+        return None
+
+    query_metrics.instrument(async_engine.sync_engine)
+    statement_registry.instrument(async_engine.sync_engine)
+    return async_engine
 
 def create_connection(logging: str = ''):
     ''' Standard function to create a connection '''
     try:
         if logging:
-            log_query_time(f'log.{APP_ENV}.{logging}')
-        return engine.connect()
+            log_query_time(get_engine(), f'log.{APP_ENV}.{logging}')
+        return get_engine().connect()
     except SQLAlchemyError as exc:
         print(f'Error during connection: {exc}')
         return None
@@ -40,8 +128,26 @@ def create_session(logging: str = ''):
     ''' Standard function to create a session '''
     try:
         if logging:
-            log_query_time(f'log.{APP_ENV}.{logging}')
-        return Session(engine)
+            log_query_time(get_engine(), f'log.{APP_ENV}.{logging}')
+        return Session(get_engine())
     except SQLAlchemyError as exc:
         print(f'Error with session: {exc}')
         return None
+
+# FastAPI dependencies e.g. conn: Connection = Depends(get_connection)
+
+def get_connection() -> Iterator[Connection]:
+    ''' yields a pooled connection for the request and always returns it to the pool '''
+    with get_engine().connect() as conn:
+        yield conn
+
+def get_async_engine(request: Request) -> 'AsyncEngine':
+    ''' the async engine created by the app lifespan '''
+    if (async_engine := getattr(request.app.state, 'async_engine', None)) is None:
+        raise RuntimeError(f'Async driver {ASYNC_DRIVER} is not installed')
+    return async_engine
+
+async def get_async_connection(request: Request) -> AsyncIterator['AsyncConnection']:
+    ''' yields a pooled async connection for the request and always returns it to the pool '''
+    async with get_async_engine(request).connect() as conn:
+        yield conn
@@ -0,0 +1,37 @@
+''' Foreign key resolution against the dimension tables
+
+    A lookup is built once per dimension table as a Series of ids indexed by the
+    natural key, whole columns are then resolved in one vectorised pass without
+    merging, so the result is always aligned with the input rows.
+'''
+import numpy as np
+import pandas as pd
+
+
+def key_lookup(dimension: pd.DataFrame, key_columns: list[str]) -> pd.Series:
+    ''' returns the dimension ids indexed by the natural key columns '''
+    if len(key_columns) == 1:
+        index = pd.Index(dimension[key_columns[0]], name=key_columns[0])
+    else:
+        index = pd.MultiIndex.from_frame(dimension[key_columns])
+    return pd.Series(dimension.index.to_numpy(), index=index, name=dimension.index.name)
+
+
+def resolve_keys(keys: pd.Series | pd.DataFrame, lookup: pd.Series) -> np.ndarray:
+    ''' maps every row of keys to the id of the matching dimension row
+
+        Single column keys are factorised first, so only the distinct values
+        are hashed against the lookup. Raises ValueError for unknown keys.
+    '''
+    if isinstance(keys, pd.DataFrame):
+        positions = lookup.index.get_indexer(pd.MultiIndex.from_frame(keys))
+    else:
+        codes, uniques = pd.factorize(keys, use_na_sentinel=True)
+        unique_positions = lookup.index.get_indexer(uniques)
+        positions = np.where(codes < 0, -1, unique_positions[codes])
+
+    if (missing := positions < 0).any():
+        unknown = keys[missing].drop_duplicates().head(5)
+        raise ValueError(f'Unknown {lookup.name} keys e.g. {unknown.to_numpy().tolist()}')
+
+    return lookup.to_numpy()[positions]
@@ -0,0 +1,69 @@
+''' Denormalised car listings read by the search
+
+    car_listings holds cars_for_sale joined to its models, makes, colours,
+    customers and counties, so searches and facet counts read one indexed
+    relation. On PostgreSQL it is a materialized view refreshed concurrently,
+    readers keep the old rows until the refresh commits. Other databases get
+    a table that is emptied and refilled in the caller's transaction.
+'''
+from sqlalchemy import Connection, delete, insert, join, select, text
+from sqlalchemy.schema import CreateIndex
+from .table_classes import Makes, Models, Colours, Counties, Customers, CarsForSale, CarListings
+
+# cars_for_sale joined to all of its dimension tables
+listings_join = (
+    join(CarsForSale, Models, CarsForSale.model_id == Models.model_id)
+    .join(Makes, Models.make_id == Makes.make_id)
+    .join(Colours, CarsForSale.colour_id == Colours.colour_id)
+    .join(Customers, CarsForSale.customer_id == Customers.customer_id)
+    .join(Counties, Customers.county_id == Counties.county_id)
+)
+
+# the columns of car_listings in table order
+listings_select = select(
+    CarsForSale.car_id,
+    Makes.make_name.label('make'),
+    Models.model_name.label('model'),
+    Colours.colour_name.label('colour'),
+    CarsForSale.fuel_type,
+    CarsForSale.transmission_type,
+    CarsForSale.year,
+    CarsForSale.price,
+    CarsForSale.mileage,
+    Customers.town_name.label('town'),
+    Counties.county_name.label('county'),
+).select_from(listings_join)
+
+
+def view_populated(conn: Connection):
+    ''' True if the materialized view holds data, None if it does not exist '''
+    return conn.scalar(text(
+        "SELECT ispopulated FROM pg_matviews WHERE matviewname = 'car_listings'"
+    ))
+
+
+def create_listings_view(conn: Connection) -> None:
+    ''' creates and fills the materialized view with its indexes '''
+    query = listings_select.compile(conn, compile_kwargs={'literal_binds': True})
+    conn.exec_driver_sql(f'CREATE MATERIALIZED VIEW car_listings AS {query}')
+
+    for index in CarListings.__table__.indexes:
+        conn.execute(CreateIndex(index))
+
+
+def refresh_car_listings(conn: Connection) -> None:
+    ''' brings car_listings in line with the tables, creating it if needed '''
+    if conn.dialect.name != 'postgresql':
+        CarListings.__table__.create(conn, checkfirst=True)
+        conn.execute(delete(CarListings))
+        conn.execute(insert(CarListings).from_select(
+            [column.name for column in CarListings.__table__.columns], listings_select
+        ))
+        return
+
+    populated = view_populated(conn)
+    if populated is None:
+        create_listings_view(conn)
+    else:
+        concurrently = 'CONCURRENTLY ' if populated else ''
+        conn.exec_driver_sql(f'REFRESH MATERIALIZED VIEW {concurrently}car_listings')
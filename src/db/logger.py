@@ -1,35 +1,221 @@
-'''module for logging for query times'''
-import time
+'''module for logging and metrics for query times'''
 import re
+import atexit
 import logging
+from collections import deque, defaultdict
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from threading import Lock
+from time import perf_counter_ns
+from weakref import WeakKeyDictionary, WeakSet
 from sqlalchemy import event
 from sqlalchemy.engine import Engine
+from sqlalchemy.engine.default import CACHE_HIT
 # pylint: disable=too-many-arguments, too-many-positional-arguments, disable=unused-argument
 
 # regex to match INSERT INTO statements
 INSERT_EXPR = re.compile(r'INSERT INTO[^)]+\)')
 
-def log_query_time(name: str ='log') -> None:
-    '''sets up logging for query times'''
-    logging.basicConfig(filename='query.log')
-    time_logger = logging.getLogger(name)
-    time_logger.setLevel(logging.DEBUG)
+# regexes used to reduce a statement to its fingerprint, applied in order
+FINGERPRINT_EXPRS = [
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\((?:\s*(?:\?|%s|\$\d+|%\(\w+\)s|:\w+)\s*,?)+\)'), '(...)'),
+    (re.compile(r'(?:\(\.\.\.\),\s*)+\(\.\.\.\)'), '(...)'),
+]
+MAX_FINGERPRINT_LENGTH = 500
+
+# number of recent timings kept per statement for the percentiles
+SAMPLE_SIZE = 1024
+
+LOG_FILE = 'query.log'
+
+# errors of the background refreshes, written to the log file once the listener is started
+app_logger = logging.getLogger('log.app')
+
+
+def fingerprint(statement: str) -> str:
+    '''reduces a statement to its shape, replacing literals and parameter lists'''
+    statement = statement.strip()
+    for expr, replacement in FINGERPRINT_EXPRS:
+        statement = expr.sub(replacement, statement)
+    return statement[:MAX_FINGERPRINT_LENGTH]
+
+
+def percentile(samples: list[int], fraction: float) -> int:
+    '''nearest rank percentile of sorted samples'''
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class StatementStats:
+    '''timings and row counts for one statement fingerprint'''
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        self.count = 0
+        self.rows = 0
+        self.total_ns = 0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+
+    def add(self, elapsed_ns: int, rows: int) -> None:
+        '''records a single execution'''
+        self.count += 1
+        self.total_ns += elapsed_ns
+        self.rows += max(rows, 0)
+        self.samples.append(elapsed_ns)
+
+    def summary(self) -> dict:
+        '''returns the histogram summary in milliseconds'''
+        samples = sorted(self.samples)
+        return {
+            'count': self.count,
+            'rows': self.rows,
+            'mean_ms': self.total_ns / self.count / 1e6,
+            'p50_ms': percentile(samples, 0.50) / 1e6,
+            'p95_ms': percentile(samples, 0.95) / 1e6,
+            'p99_ms': percentile(samples, 0.99) / 1e6,
+        }
+
+
+class QueryMetrics:
+    '''per fingerprint query statistics collected from instrumented engines'''
+
+    def __init__(self):
+        self._stats = defaultdict(StatementStats)
+        self._lock = Lock()
+        self._engines = WeakSet()
+        self._log_queue = SimpleQueue()
+        self._log_listener = None
+        self._loggers = WeakKeyDictionary()
+
+    def record(self, statement: str, elapsed_ns: int, rows: int) -> None:
+        '''adds a timing for the statement'''
+        key = fingerprint(statement)
+        with self._lock:
+            self._stats[key].add(elapsed_ns, rows)
+
+    def snapshot(self) -> list[dict]:
+        '''returns the statistics for every statement, slowest total time first'''
+        with self._lock:
+            stats = sorted(self._stats.items(), key=lambda item: -item[1].total_ns)
+            return [{'statement': key, **value.summary()} for key, value in stats]
+
+    def reset(self) -> None:
+        '''clears all collected statistics'''
+        with self._lock:
+            self._stats.clear()
+
+    def instrument(self, engine: Engine) -> None:
+        '''installs the timing listeners on the engine, only once per engine'''
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.add(engine)
 
+        event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
 
-    @event.listens_for(Engine, 'before_cursor_execute')
-    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    def set_logger(self, engine: Engine, logger: logging.Logger) -> None:
+        '''logs the queries of the engine to the logger'''
+        with self._lock:
+            self._loggers[engine] = logger
+
+    def start_log_listener(self) -> None:
+        '''writes queued log records to the log file on a background thread'''
+        with self._lock:
+            if self._log_listener:
+                return
+
+            parent = logging.getLogger('log')
+            parent.addHandler(QueueHandler(self._log_queue))
+            parent.propagate = False
+
+            self._log_listener = QueueListener(self._log_queue, logging.FileHandler(LOG_FILE))
+            self._log_listener.start()
+            atexit.register(self._log_listener.stop)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
         '''Logs the start of a query filtering out INSERT INTO statements'''
-        conn.info.setdefault('query_start_time', []).append(time.time())
-        statement = statement.strip()
+        conn.info.setdefault('query_start_time', []).append(perf_counter_ns())
+
+        if (logger := self._loggers.get(conn.engine)):
+            statement = statement.strip()
+            if (command:= INSERT_EXPR.search(statement)):
+                statement = command.group()
+            logger.debug('Start Query:\n %s', statement)
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        '''Records and logs the end of a query with total time for the query'''
+        total = perf_counter_ns() - conn.info['query_start_time'].pop(-1)
+        self.record(statement, total, cursor.rowcount)
+
+        if (logger := self._loggers.get(conn.engine)):
+            logger.debug('Total Time: %f', total / 1e9)
+
+
+query_metrics = QueryMetrics()
+
+
+class StatementRegistry:
+    '''named statements with the hit rate of the compiled cache for each name'''
 
-        if (command:= INSERT_EXPR.search(statement)):
-            statement = command.group()
+    def __init__(self):
+        self._stats = {}
+        self._lock = Lock()
+        self._engines = WeakSet()
 
-        time_logger.debug('Start Query:\n %s', statement)
+    def register(self, name: str, stmt):
+        '''tags the statement with its name so its executions are counted'''
+        with self._lock:
+            self._stats.setdefault(name, {'executions': 0, 'cache_hits': 0})
+        return stmt.execution_options(statement_name=name)
 
+    def snapshot(self) -> list[dict]:
+        '''returns the executions and compiled cache hit rate of every statement'''
+        with self._lock:
+            return [
+                {
+                    'statement': name,
+                    **stats,
+                    'hit_rate': stats['cache_hits'] / max(stats['executions'], 1)
+                }
+                for name, stats in sorted(self._stats.items())
+            ]
+
+    def reset(self) -> None:
+        '''zeroes the counts, the registered names are kept'''
+        with self._lock:
+            for stats in self._stats.values():
+                stats.update(executions=0, cache_hits=0)
+
+    def instrument(self, engine: Engine) -> None:
+        '''installs the counting listener on the engine, only once per engine'''
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.add(engine)
+
+        event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        '''counts the execution of a registered statement and whether it was compiled'''
+        if not (name := context.execution_options.get('statement_name')):
+            return
+        with self._lock:
+            stats = self._stats.setdefault(name, {'executions': 0, 'cache_hits': 0})
+            stats['executions'] += 1
+            stats['cache_hits'] += context.cache_hit == CACHE_HIT
+
+
+statement_registry = StatementRegistry()
+
+
+def log_query_time(engine: Engine, name: str ='log') -> None:
+    '''sets up logging for query times, safe to call any number of times'''
+    query_metrics.start_log_listener()
+    time_logger = logging.getLogger(name)
+    time_logger.setLevel(logging.DEBUG)
 
-    @event.listens_for(Engine, 'after_cursor_execute')
-    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-        '''Logs the end of a query with total time for the query'''
-        total = time.time() - conn.info['query_start_time'].pop(-1)
-        time_logger.debug('Total Time: %f', total)
+    query_metrics.set_logger(engine, time_logger)
+    query_metrics.instrument(engine)
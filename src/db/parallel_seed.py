@@ -0,0 +1,261 @@
+''' Parallel seeding scheduled from the foreign key graph
+
+    Tables are grouped into levels from Base.metadata.sorted_tables, every table
+    only referencing tables in earlier levels. The frames of a level are built
+    concurrently in a process pool and loaded concurrently over separate pooled
+    connections while the next level is built. cars_for_sale is split into
+    partitions which are built and loaded by several workers at once.
+
+    The tables are created without foreign keys, so loads do not wait for each
+    other, the keys and indexes are added once everything has been loaded.
+    Unlike create_tables the load is not a single transaction.
+'''
+import argparse
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from math import ceil
+from os import cpu_count
+from time import perf_counter
+from typing import Optional
+import pandas as pd
+from sqlalchemy import MetaData, Table
+from .connection import get_engine, POOL_OPTIONS
+from .bulk_load import (
+    load_dataframe, reset_sequence, create_tables_deferred, create_deferred_constraints
+)
+from .seed_db import (
+    normalize, create_makes_table, create_counties_table, create_colours_table,
+    create_models_table, create_customers_table, create_cars_for_sale
+)
+from .listings import refresh_car_listings
+from .snapshot import publish_snapshot
+from .table_classes import (
+    Base, Makes, Models, Colours, Counties, Customers, CarsForSale, CarListings
+)
+from ..utils.file_utils import pd_load_json, pd_load_file, pd_load_chunks, load_json_data
+from ..models.model_motors import refresh_location_index
+
+# builder for each dimension table and the source frames or tables it is built from
+BUILDERS = {
+    Makes: (create_makes_table, ['cars']),
+    Counties: (create_counties_table, ['customers']),
+    Colours: (create_colours_table, ['cars']),
+    Models: (create_models_table, ['cars', Makes]),
+    Customers: (create_customers_table, ['customers', Counties]),
+}
+
+# the dimension tables create_cars_for_sale resolves keys against
+CARS_FOR_SALE_DIMENSIONS = [Makes, Models, Colours]
+
+TABLE_CLASSES = {
+    table_class.__table__: table_class for table_class in [*BUILDERS, CarsForSale]
+}
+
+
+def dependency_levels(metadata: MetaData) -> list[list[Table]]:
+    ''' groups the tables so each table only references tables in earlier groups '''
+    depth = {}
+    for table in metadata.sorted_tables:
+        parents = [fk.column.table for fk in table.foreign_keys if fk.column.table is not table]
+        depth[table] = 1 + max((depth[parent] for parent in parents), default=-1)
+
+    levels = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+    for table, level in depth.items():
+        levels[level].append(table)
+    return levels
+
+
+@contextmanager
+def stage(timings: dict, name: str, report: Callable[[str], None]):
+    ''' records the wall time of a seeding stage and reports it once done '''
+    start = perf_counter()
+    yield
+    timings[name] = perf_counter() - start
+    report(f'{name:<40}{timings[name]:>8.2f} s')
+
+
+def load_workers(workers: int) -> int:
+    ''' SQLite serialises writers, otherwise as many connections as the pool allows '''
+    if get_engine().dialect.name == 'sqlite':
+        return 1
+    return max(1, min(workers, POOL_OPTIONS['pool_size'] + POOL_OPTIONS['max_overflow']))
+
+
+def load_table(table: Table, df: pd.DataFrame) -> int:
+    ''' loads a frame over its own pooled connection and transaction '''
+    with get_engine().begin() as conn:
+        return load_dataframe(conn, table, df)
+
+
+def cars_for_sale_partitions(
+    file_path: str, workers: int, chunksize: int
+) -> Iterator[tuple[int, pd.DataFrame]]:
+    ''' yields the first car_id and rows of each partition, a json file is split in
+        one partition per worker, NDJSON, Parquet and Feather files are streamed in chunks
+    '''
+    if not file_path.endswith('.json'):
+        start_id = 1
+        for chunk in pd_load_chunks(file_path, chunksize):
+            yield start_id, chunk
+            start_id += len(chunk.index)
+        return
+
+    cars_for_sale = normalize(load_json_data(file_path))
+    size = max(1, ceil(len(cars_for_sale.index) / workers))
+    for start in range(0, len(cars_for_sale.index), size):
+        yield start + 1, cars_for_sale.iloc[start:start + size]
+
+
+@dataclass(frozen=True)
+class SeedSettings:
+    ''' the source files and how to seed them, workers defaults to the cpu count '''
+    cars_for_sale_file: str = 'data/json/cars_for_sale.json'
+    customers_file: str = 'data/json/customers.json'
+    workers: int = field(default_factory=lambda: cpu_count() or 1)
+    chunksize: int = 100_000
+    report: Callable[[str], None] = print
+
+
+@dataclass
+class SeedPools:
+    ''' the process pool building frames and the thread pool loading them '''
+    processes: ProcessPoolExecutor
+    threads: ThreadPoolExecutor
+
+
+def seed_dimensions(
+    pools: SeedPools, sources: dict, timings: dict, settings: SeedSettings
+) -> dict:
+    ''' builds the dimension tables level by level in the process pool, each level is
+        loaded while the next is built, returns the built frames
+    '''
+    tables, loads = {}, []
+    for number, level in enumerate(dependency_levels(Base.metadata)):
+        dimensions = [
+            TABLE_CLASSES[table] for table in level if TABLE_CLASSES.get(table) in BUILDERS
+        ]
+        if not dimensions:
+            continue
+
+        names = ', '.join(dimension.__tablename__ for dimension in dimensions)
+        with stage(timings, f'build level {number}: {names}', settings.report):
+            futures = {
+                dimension: pools.processes.submit(
+                    BUILDERS[dimension][0],
+                    *(tables.get(arg, sources.get(arg)) for arg in BUILDERS[dimension][1])
+                )
+                for dimension in dimensions
+            }
+            tables.update({dimension: future.result() for dimension, future in futures.items()})
+
+        # loading overlaps with building the next level
+        loads += [
+            pools.threads.submit(load_table, dimension.__table__, tables[dimension])
+            for dimension in dimensions
+        ]
+
+    with stage(timings, 'load dimension tables', settings.report):
+        for load in loads:
+            load.result()
+    return tables
+
+
+def seed_cars_for_sale(pools: SeedPools, tables: dict, settings: SeedSettings) -> int:
+    ''' builds the partitions in the process pool and loads each one as soon as it is
+        built, at most two partitions per worker are held in memory at once
+    '''
+    dimensions = {table: tables[table] for table in CARS_FOR_SALE_DIMENSIONS}
+    in_flight = 2 * settings.workers
+    builds: deque[Future] = deque()
+    loads: deque[Future] = deque()
+    num_cars = 0
+
+    def finish_load():
+        nonlocal num_cars
+        num_cars += loads.popleft().result()
+        settings.report(f'  {CarsForSale.__tablename__}: {num_cars:,} rows loaded')
+
+    def finish_build():
+        loads.append(
+            pools.threads.submit(load_table, CarsForSale.__table__, builds.popleft().result())
+        )
+        while len(loads) > in_flight:
+            finish_load()
+
+    partitions = cars_for_sale_partitions(
+        settings.cars_for_sale_file, settings.workers, settings.chunksize
+    )
+    for start_id, partition in partitions:
+        builds.append(pools.processes.submit(create_cars_for_sale, partition, dimensions, start_id))
+        while len(builds) > in_flight:
+            finish_build()
+
+    while builds:
+        finish_build()
+    while loads:
+        finish_load()
+    return num_cars
+
+
+def seed_tables(settings: Optional[SeedSettings] = None) -> dict:
+    ''' drops and seeds every table using all cores, returns the seconds per stage '''
+    settings = settings or SeedSettings()
+    report, timings = settings.report, {}
+
+    with stage(timings, 'create tables', report):
+        Base.metadata.drop_all(get_engine())
+        with get_engine().begin() as conn:
+            create_tables_deferred(conn, Base.metadata)
+
+    with stage(timings, 'read source files', report):
+        sources = {
+            'cars': pd_load_json('data/json/cars.json'),
+            'customers': pd_load_file(settings.customers_file)
+        }
+
+    with (
+        ProcessPoolExecutor(settings.workers) as processes,
+        ThreadPoolExecutor(load_workers(settings.workers)) as threads
+    ):
+        pools = SeedPools(processes, threads)
+        tables = seed_dimensions(pools, sources, timings, settings)
+
+        with stage(timings, f'build and load {CarsForSale.__tablename__}', report):
+            seed_cars_for_sale(pools, tables, settings)
+
+    with stage(timings, 'add foreign keys and indexes', report):
+        with get_engine().begin() as conn:
+            # partitions set the sequences concurrently, move them past every loaded id
+            for table in Base.metadata.sorted_tables:
+                reset_sequence(conn, table)
+            create_deferred_constraints(conn, Base.metadata)
+
+    with stage(timings, f'refresh {CarListings.__tablename__}', report):
+        with get_engine().begin() as conn:
+            refresh_car_listings(conn)
+
+    with stage(timings, 'refresh location index', report):
+        refresh_location_index()
+
+    with stage(timings, 'publish shared snapshot', report):
+        with get_engine().connect() as conn:
+            publish_snapshot(conn)
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seed the database using every core')
+    parser.add_argument('cars_for_sale_file', nargs='?', default='data/json/cars_for_sale.json')
+    parser.add_argument('customers_file', nargs='?', default='data/json/customers.json')
+    parser.add_argument('--workers', type=int, default=None, help='defaults to the cpu count')
+    parser.add_argument('--chunk-size', type=int, default=100_000)
+    args = parser.parse_args()
+
+    stage_timings = seed_tables(SeedSettings(
+        args.cars_for_sale_file, args.customers_file,
+        args.workers or cpu_count() or 1, args.chunk_size
+    ))
+    print(f'{"total":<40}{sum(stage_timings.values()):>8.2f} s')
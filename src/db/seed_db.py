@@ -1,7 +1,12 @@
+import sys
 import pandas as pd
-from sqlalchemy import insert
-from .connection import engine, create_session
-from ..utils.file_utils import pd_load_json, load_json_data
+from .connection import get_engine, create_session
+from .bulk_load import load_dataframe, create_tables_deferred, create_deferred_constraints
+from .dimensions import key_lookup, resolve_keys
+from .listings import refresh_car_listings
+from .snapshot import publish_snapshot
+from ..utils.file_utils import pd_load_json, pd_load_chunks, pd_load_file, load_json_data
+from ..models.model_motors import refresh_location_index
 from .table_classes import (
     Base,
     Makes,
@@ -68,11 +73,12 @@ def create_models_table(
 ) -> pd.DataFrame:
     ''' creates a car models series indexed from 1 with reference to car_makes '''
     car_models = (
-        pd.merge(car_data, car_makes.reset_index(), left_on='make', right_on='make_name')
-        [['model', 'make_id']]
-        .rename(columns={'model': 'model_name'})
+        pd.DataFrame({
+            'model_name': car_data['model'].to_numpy(),
+            'make_id': resolve_keys(car_data['make'], key_lookup(car_makes, ['make_name']))
+        })
         .drop_duplicates()
-        .sort_values('make_id')
+        .sort_values('make_id', kind='stable')
     )
 
     return (
@@ -84,45 +90,46 @@ def create_customers_table(
         customers: pd.DataFrame,
         counties: pd.DataFrame
 ) -> pd.DataFrame:
-    ''' creates a customers series indexed from 1 with reference to counties '''
-    customers = pd.merge(
-        customers, counties.reset_index(),
-        left_on='county', right_on='county_name'
+    ''' creates a customers series indexed from 1 with reference to counties,
+        located at the coordinates of their town
+    '''
+    locations = pd_load_json('data/json/locations.json').rename_axis('location')
+    rows = resolve_keys(
+        customers[['town', 'county']], key_lookup(locations, ['town', 'county'])
+    )
+    customers = customers.assign(
+        county_id=resolve_keys(customers['county'], key_lookup(counties, ['county_name'])),
+        latitude=locations['latitude'].to_numpy()[rows],
+        longitude=locations['longitude'].to_numpy()[rows]
     )
 
     return (
-        customers[['first_name', 'last_name', 'town', 'county_id']]
+        customers[['first_name', 'last_name', 'town', 'county_id', 'latitude', 'longitude']]
             .rename(columns={'town': 'town_name'})
             .set_index(pd.Index(range(1, customers.index.size + 1), name='customer_id'))
     )
 
 
-def create_cars_for_sale(cars_for_sale: pd.DataFrame, tables: dict = None) -> pd.DataFrame:
-    ''' creates a car series indexed from 1 with reference to the other tables '''
+def create_cars_for_sale(
+    cars_for_sale: pd.DataFrame, tables: dict = None, start_id: int = 1
+) -> pd.DataFrame:
+    ''' creates a car series indexed from start_id with reference to the other tables '''
     if not isinstance(tables, dict):
         return None
 
-    # Move indexes to columns to make name, id columns accessible
-    fk_model_ids = tables[Models].reset_index()
-    fk_colour_ids = tables[Colours].reset_index()
-
-    # Replace the car data column data with the foreign key ids
-
-    # car models
-    model_ids = pd.merge(
-        cars_for_sale['model'], fk_model_ids,
-        left_on='model', right_on='model_name'
+    # Replace the car data column data with the foreign key ids, resolved row by row
+    # so every id stays aligned with the car it came from
+    models = tables[Models].assign(
+        make_name=tables[Makes]['make_name'].reindex(tables[Models]['make_id']).to_numpy()
     )
-
-    # car colours
-    colour_ids = pd.merge(
-        cars_for_sale['color'], fk_colour_ids,
-        left_on='color', right_on='colour_name'
+    model_ids = resolve_keys(
+        cars_for_sale[['make', 'model']], key_lookup(models, ['make_name', 'model_name'])
     )
+    colour_ids = resolve_keys(cars_for_sale['color'], key_lookup(tables[Colours], ['colour_name']))
 
     cars = pd.DataFrame({
-        'model_id': model_ids['model_id'],
-        'colour_id': colour_ids['colour_id'],
+        'model_id': model_ids,
+        'colour_id': colour_ids,
         'fuel_type': cars_for_sale['fuel_type'].str.lower(),
         'transmission_type': cars_for_sale['transmission'].str.lower(),
         'customer_id': cars_for_sale['customer_id'],
@@ -132,41 +139,72 @@ def create_cars_for_sale(cars_for_sale: pd.DataFrame, tables: dict = None) -> pd
         'description': cars_for_sale['description']
     })
 
-    return cars.set_index(pd.Index(range(1, cars.index.size + 1), name='car_id'))
+    return cars.set_index(pd.Index(range(start_id, start_id + cars.index.size), name='car_id'))
+
+
+def create_dimension_tables(cars_df: pd.DataFrame, customers_df: pd.DataFrame) -> dict:
+    ''' creates the makes, counties, models, colours and customers tables '''
+    car_makes_df = create_makes_table(cars_df)
+    counties_df = create_counties_table(customers_df)
+
+    return {
+        Makes: car_makes_df,
+        Counties: counties_df,
+        Models: create_models_table(cars_df, car_makes_df),
+        Colours: create_colours_table(cars_df),
+        Customers: create_customers_table(customers_df, counties_df)
+    }
 
 
-def create_tables():
-    ''' creates the tables in the database '''
-    Base.metadata.drop_all(engine)
-    Base.metadata.create_all(engine)
+def load_cars_for_sale_chunks(conn, file_path: str, tables: dict, chunksize: int) -> int:
+    ''' streams a NDJSON or Parquet cars for sale file into the database chunk by chunk '''
+    num_cars = 0
+    for chunk in pd_load_chunks(file_path, chunksize):
+        cars_df = create_cars_for_sale(chunk, tables=tables, start_id=num_cars + 1)
+        num_cars += load_dataframe(conn, CarsForSale.__table__, cars_df)
+    return num_cars
+
+
+def create_tables(
+    cars_for_sale_file: str = 'data/json/cars_for_sale.json',
+    customers_file: str = 'data/json/customers.json',
+    chunksize: int = 100_000
+):
+    ''' creates the tables in the database
+
+        The pretty printed json files are loaded whole, NDJSON, Parquet and Feather
+        files e.g. from `python -m src.data.car_gen --format parquet` are streamed in chunks.
+    '''
+    Base.metadata.drop_all(get_engine())
 
     if not (session := create_session()):
         return 'Failed to create session'
 
     with session.begin():
-        cars_df = pd_load_json('data/json/cars.json')
-        customers_df = pd_load_json('data/json/customers.json')
-        cars_for_sale_df = normalize(load_json_data('data/json/cars_for_sale.json'))
-        car_makes_df = create_makes_table(cars_df)
-        counties_df = create_counties_table(customers_df)
-
-        tables = {
-            Makes: car_makes_df,
-            Counties: counties_df,
-            Models: create_models_table(cars_df, car_makes_df),
-            Colours: create_colours_table(cars_df),
-            Customers: create_customers_table(customers_df, counties_df)
-        }
+        # foreign keys and indexes are added once the data is loaded
+        conn = session.connection()
+        create_tables_deferred(conn, Base.metadata)
 
-        cars_df = create_cars_for_sale(cars_for_sale_df, tables=tables)
+        cars_df = pd_load_json('data/json/cars.json')
+        tables = create_dimension_tables(cars_df, pd_load_file(customers_file))
 
         for table, df in tables.items():
-            records = df.to_dict('records')
-            session.execute(insert(table).values(records))
+            load_dataframe(conn, table.__table__, df)
+
+        if cars_for_sale_file.endswith('.json'):
+            cars_for_sale_df = normalize(load_json_data(cars_for_sale_file))
+            cars_df = create_cars_for_sale(cars_for_sale_df, tables=tables)
+            load_dataframe(conn, CarsForSale.__table__, cars_df)
+        else:
+            load_cars_for_sale_chunks(conn, cars_for_sale_file, tables, chunksize)
 
-        session.execute(insert(CarsForSale).values(cars_df.to_dict('records')))
+        create_deferred_constraints(conn, Base.metadata)
+        refresh_car_listings(conn)
 
+    refresh_location_index()
+    with get_engine().connect() as conn:
+        publish_snapshot(conn)
     return 'Tables created successfully!!'
 
 if __name__ == '__main__':
-    print(create_tables())
+    print(create_tables(*sys.argv[1:3]))
@@ -0,0 +1,51 @@
+''' Publishes the snapshot the app workers map instead of querying the database
+
+    Once the tables and car_listings are loaded the inventory, the location
+    counts, the customer coordinates of the radius search, the makes, models
+    and colours dimensions and the colours of every model are written as a
+    new shared snapshot version, then the data version is bumped to it. Workers
+    compare the data version on their next request and swap to the new files,
+    the old version stays mapped by whoever still holds it.
+'''
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import Connection, select
+from .table_classes import Makes, Models, Colours
+from ..models.model_inventory import fetch_inventory, with_search_columns
+from ..models.model_motors import (
+    DIMENSION_COLUMNS, fetch_columns, fetch_location_counts, location_counts_table,
+    model_colours_table
+)
+from ..models.model_nearby import fetch_customer_locations
+from ..utils.response_cache import data_version, new_version
+from ..utils.shared_snapshot import shared_snapshot
+
+DIMENSIONS = {'makes': Makes, 'models': Models, 'colours': Colours}
+
+
+def dimension_table(conn: Connection, table) -> pa.Table:
+    ''' the whole dimension table ordered by its id '''
+    [id_column] = table.__table__.primary_key.columns
+    df = pd.read_sql(select(table.__table__).order_by(id_column), conn, dtype_backend='pyarrow')
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def snapshot_tables(conn: Connection) -> dict[str, pa.Table]:
+    ''' every table of the shared snapshot read from the database '''
+    tables = {
+        'inventory': with_search_columns(fetch_inventory(conn)),
+        'locations': location_counts_table(fetch_location_counts(conn)),
+        'customer_locations': fetch_customer_locations(conn),
+        'model_colours': model_colours_table(
+            fetch_columns(conn, *DIMENSION_COLUMNS['model_colours'], is_distinct=True)
+        ),
+    }
+    for name, table in DIMENSIONS.items():
+        tables[name] = dimension_table(conn, table)
+    return tables
+
+
+def publish_snapshot(conn: Connection) -> str:
+    ''' writes a new snapshot version then bumps the data version to it '''
+    version = shared_snapshot.write(new_version(), snapshot_tables(conn))
+    return data_version.bump(version)
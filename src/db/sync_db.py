@@ -0,0 +1,229 @@
+''' Incremental sync of the source data into an existing database
+
+    Unlike create_tables nothing is dropped, the incoming tables are matched to
+    the existing rows by natural key, cars for sale by their LISTING_KEYS, then
+    only new or changed rows are upserted
+    and rows missing from the source are deleted, in small batches each in
+    its own transaction so readers are never blocked for long.
+'''
+import sys
+import pandas as pd
+from sqlalchemy import Connection, Table, delete, text
+from sqlalchemy.dialects import postgresql, sqlite
+from .connection import get_engine
+from .bulk_load import table_records, reset_sequence
+from .listings import refresh_car_listings
+from .snapshot import publish_snapshot
+from .seed_db import create_dimension_tables, create_cars_for_sale, normalize
+from .table_classes import Makes, Models, Colours, Counties, Customers, CarsForSale
+from ..utils.file_utils import pd_load_json, pd_load_file, load_json_data
+from ..models.model_motors import refresh_location_index
+
+BATCH_SIZE = 10_000
+
+# columns identifying a dimension row independently of its id
+NATURAL_KEYS = {
+    Makes: ['make_name'],
+    Counties: ['county_name'],
+    Colours: ['colour_name'],
+    Models: ['make_id', 'model_name'],
+}
+
+# columns identifying a car for sale whatever its price, mileage or description,
+# the source has no listing id and a car's position in the file moves as cars are removed
+LISTING_KEYS = ['customer_id', 'model_id', 'colour_id', 'fuel_type', 'transmission_type', 'year']
+
+# tables whose rows are removed when they disappear from the source, children first
+DELETABLE = [CarsForSale, Customers]
+
+
+def primary_key(table: Table) -> str:
+    ''' name of the single column primary key '''
+    [column] = table.primary_key.columns
+    return column.name
+
+
+def fetch_table(conn: Connection, table: Table) -> pd.DataFrame:
+    ''' reads the whole table with its raw driver values, indexed by primary key,
+        generated columns are left out as they are never written
+    '''
+    columns = ', '.join(f'"{column.name}"' for column in table.c if column.computed is None)
+    return pd.read_sql(
+        text(f'SELECT {columns} FROM "{table.name}"'), conn, index_col=primary_key(table)
+    )
+
+
+def resolve_ids(
+    incoming: pd.DataFrame, existing: pd.DataFrame, keys: list[str]
+) -> pd.DataFrame:
+    ''' re-indexes incoming dimension rows with the ids of the existing rows sharing
+        the natural key, rows not in the database yet are given new ids
+    '''
+    id_name = incoming.index.name
+    merged = incoming.reset_index(drop=True).merge(
+        existing.reset_index()[[id_name, *keys]], on=keys, how='left'
+    )
+    new_rows = merged[id_name].isna()
+    start = int(existing.index.max()) + 1 if len(existing.index) else 1
+    merged.loc[new_rows, id_name] = range(start, start + int(new_rows.sum()))
+
+    return merged.astype({id_name: 'int64'}).set_index(id_name)
+
+
+def listing_keys(cars: pd.DataFrame) -> pd.DataFrame:
+    ''' the LISTING_KEYS of the cars as text, with the position of each car among
+        identical cars in id order so every car has a unique key
+    '''
+    keys = pd.DataFrame(
+        {column: cars[column].astype(str) for column in LISTING_KEYS}, index=cars.index
+    ).sort_index()
+    return keys.assign(occurrence=keys.groupby(LISTING_KEYS).cumcount())
+
+
+def resolve_car_ids(incoming: pd.DataFrame, existing: pd.DataFrame) -> pd.DataFrame:
+    ''' re-indexes the incoming cars with the car_id of the existing car sharing its
+        listing key, so removing a car does not renumber the cars after it
+    '''
+    incoming = incoming.sort_index()
+    ids = resolve_ids(listing_keys(incoming), listing_keys(existing), [*LISTING_KEYS, 'occurrence'])
+    return incoming.set_index(ids.index)
+
+
+def remap(column: pd.Series, old: pd.DataFrame, new: pd.DataFrame) -> pd.Series:
+    ''' converts ids from the freshly numbered table to the resolved ids '''
+    mapping = pd.Series(new.index, index=old.index)
+    return column.map(mapping)
+
+
+def row_hashes(df: pd.DataFrame, numeric: list[str]) -> pd.Series:
+    ''' hashes each row with numbers and text normalised, so values read back
+        from the database compare equal to the values loaded from file
+    '''
+    normalised = pd.DataFrame({
+        column: (
+            pd.to_numeric(df[column], errors='coerce').astype('float64')
+            if column in numeric else df[column].astype(str)
+        )
+        for column in df.columns
+    }, index=df.index)
+    return pd.util.hash_pandas_object(normalised, index=False)
+
+
+def diff_table(incoming: pd.DataFrame, existing: pd.DataFrame) -> tuple[pd.DataFrame, pd.Index]:
+    ''' returns the incoming rows that are new or changed and the ids no longer in the source '''
+    columns = list(incoming.columns)
+    numeric = [
+        column for column in columns if pd.api.types.is_numeric_dtype(incoming[column].dtype)
+    ]
+    incoming_hashes = row_hashes(incoming, numeric)
+    existing_hashes = row_hashes(existing[columns], numeric).reindex(incoming.index)
+
+    changed = incoming[incoming_hashes.ne(existing_hashes)]
+    removed = existing.index.difference(incoming.index)
+    return changed, removed
+
+
+def upsert_statement(conn: Connection, table: Table):
+    ''' INSERT ... ON CONFLICT (primary key) DO UPDATE for PostgreSQL and SQLite '''
+    dialect_insert = postgresql.insert if conn.dialect.name == 'postgresql' else sqlite.insert
+    stmt = dialect_insert(table)
+    id_name = primary_key(table)
+    updates = {
+        column.name: stmt.excluded[column.name]
+        for column in table.c if column.name != id_name and column.computed is None
+    }
+    return stmt.on_conflict_do_update(index_elements=[id_name], set_=updates)
+
+
+def upsert_rows(table: Table, df: pd.DataFrame, batch_size: int) -> int:
+    ''' upserts the rows in batches, each batch in its own short transaction '''
+    records = table_records(table, df)
+    for start in range(0, len(records.index), batch_size):
+        with get_engine().begin() as conn:
+            batch = records.iloc[start:start + batch_size].to_dict('records')
+            conn.execute(upsert_statement(conn, table), batch)
+
+    with get_engine().begin() as conn:
+        reset_sequence(conn, table)
+    return len(records.index)
+
+
+def delete_rows(table: Table, ids: pd.Index, batch_size: int) -> int:
+    ''' deletes the rows by primary key in batches '''
+    id_column = table.c[primary_key(table)]
+    for start in range(0, len(ids), batch_size):
+        with get_engine().begin() as conn:
+            batch = [int(row_id) for row_id in ids[start:start + batch_size]]
+            conn.execute(delete(table).where(id_column.in_(batch)))
+    return len(ids)
+
+
+def resolve_tables(cars_df: pd.DataFrame, customers_df: pd.DataFrame, existing: dict) -> dict:
+    ''' builds the source tables with every id matched to the existing database ids '''
+    source = create_dimension_tables(cars_df, customers_df)
+    tables = {}
+
+    for table in [Makes, Counties, Colours, Models]:
+        incoming = source[table]
+        if table is Models:
+            incoming = incoming.assign(
+                make_id=remap(incoming['make_id'], source[Makes], tables[Makes])
+            )
+        tables[table] = resolve_ids(incoming, existing[table], NATURAL_KEYS[table])
+
+    # customers keep their source ids, only the county reference is remapped
+    tables[Customers] = source[Customers].assign(
+        county_id=remap(source[Customers]['county_id'], source[Counties], tables[Counties])
+    )
+    return tables
+
+
+def sync_tables(
+    cars_for_sale_file: str = 'data/json/cars_for_sale.json',
+    customers_file: str = 'data/json/customers.json',
+    batch_size: int = BATCH_SIZE
+) -> dict:
+    ''' brings the database in line with the source files, returns the rows changed per table '''
+    if cars_for_sale_file.endswith('.json'):
+        cars_for_sale_df = normalize(load_json_data(cars_for_sale_file))
+    else:
+        cars_for_sale_df = pd_load_file(cars_for_sale_file)
+
+    with get_engine().connect() as conn:
+        existing = {
+            table: fetch_table(conn, table.__table__) for table in [*NATURAL_KEYS, *DELETABLE]
+        }
+
+    tables = resolve_tables(
+        pd_load_json('data/json/cars.json'), pd_load_file(customers_file), existing
+    )
+    tables[CarsForSale] = resolve_car_ids(
+        create_cars_for_sale(cars_for_sale_df, tables=tables), existing[CarsForSale]
+    )
+
+    summary, removed = {}, {}
+    for table, incoming in tables.items():
+        if table in DELETABLE:
+            changed, removed[table] = diff_table(incoming, existing[table])
+        else:
+            # dimension rows matched by natural key are unchanged, only new ids are inserted
+            changed = incoming[~incoming.index.isin(existing[table].index)]
+        upserted = upsert_rows(table.__table__, changed, batch_size)
+        summary[table.__tablename__] = {'upserted': upserted}
+
+    for table in DELETABLE:
+        summary[table.__tablename__]['deleted'] = delete_rows(
+            table.__table__, removed[table], batch_size
+        )
+
+    with get_engine().begin() as conn:
+        refresh_car_listings(conn)
+
+    refresh_location_index()
+    with get_engine().connect() as conn:
+        publish_snapshot(conn)
+    return summary
+
+
+if __name__ == '__main__':
+    print(sync_tables(*sys.argv[1:3]))
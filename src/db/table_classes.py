@@ -3,10 +3,13 @@
 import enum
 from typing import Annotated
 from decimal import Decimal
-from sqlalchemy import Numeric, Enum, create_mock_engine
-from sqlalchemy.dialects.postgresql import VARCHAR
-from sqlalchemy.schema import ForeignKeyConstraint
+from sqlalchemy import DDL, Computed, Numeric, Enum, Text, create_mock_engine, event
+from sqlalchemy.dialects.postgresql import TSVECTOR, VARCHAR
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import ForeignKeyConstraint, Index, UniqueConstraint
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, registry
+from sqlalchemy.sql.compiler import SQLCompiler
+from sqlalchemy.sql.functions import FunctionElement
 
 
 Varchar50 = Annotated[str, 50]
@@ -26,24 +29,38 @@ class TransmissionTypes(enum.Enum):
     manual = 'manual'
     automatic = 'automatic'
 
+TYPE_ANNOTATION_MAP = {
+    Varchar100: VARCHAR(100),
+    Varchar50: VARCHAR(50),
+    Decimal2: Numeric(10, 2),
+    FuelTypes: Enum(FuelTypes),
+    TransmissionTypes: Enum(TransmissionTypes),
+}
+
 # pylint: disable=too-few-public-methods
 class Base(DeclarativeBase):
     '''Base class for tables'''
 
-    registry = registry(
-        type_annotation_map={
-            Varchar100: VARCHAR(100),
-            Varchar50: VARCHAR(50),
-            Decimal2: Numeric(10, 2),
-            FuelTypes: Enum(FuelTypes),
-            TransmissionTypes: Enum(TransmissionTypes),
-        }
-    )
+    registry = registry(type_annotation_map=TYPE_ANNOTATION_MAP)
+
+class ViewBase(DeclarativeBase):
+    '''Base class for views derived from the tables, kept out of Base.metadata
+    so they are not created, dropped or synced with the tables'''
+
+    registry = registry(type_annotation_map=TYPE_ANNOTATION_MAP)
+
+# trigram indexes for the location prefix search need the pg_trgm extension
+event.listen(
+    Base.metadata,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
 
 class Makes(Base):
     '''Shops table'''
 
     __tablename__ = 'makes'
+    __table_args__ = (UniqueConstraint('make_name'),)
 
     make_id: Mapped[IntPrimary]
     make_name: Mapped[Varchar50]
@@ -56,6 +73,8 @@ class Models(Base):
         ForeignKeyConstraint(
             ['make_id'], ['makes.make_id'], onupdate='CASCADE', ondelete='CASCADE'
         ),
+        Index('ix_models_make_id', 'make_id'),
+        UniqueConstraint('make_id', 'model_name'),
     )
 
     model_id: Mapped[IntPrimary]
@@ -66,6 +85,7 @@ class Colours(Base):
     '''Colours table'''
 
     __tablename__ = 'colours'
+    __table_args__ = (UniqueConstraint('colour_name'),)
 
     colour_id: Mapped[IntPrimary]
     colour_name: Mapped[Varchar50]
@@ -74,6 +94,7 @@ class Counties(Base):
     '''Counties table'''
 
     __tablename__ = 'counties'
+    __table_args__ = (UniqueConstraint('county_name'),)
 
     county_id: Mapped[IntPrimary]
     county_name: Mapped[Varchar50]
@@ -86,6 +107,8 @@ class Customers(Base):
         ForeignKeyConstraint(
             ['county_id'], ['counties.county_id'], onupdate='CASCADE', ondelete='CASCADE'
         ),
+        Index('ix_customers_county_id', 'county_id'),
+        Index('ix_customers_town_name', 'town_name'),
     )
 
     customer_id: Mapped[IntPrimary]
@@ -93,9 +116,44 @@ class Customers(Base):
     last_name: Mapped[Varchar50]
     town_name: Mapped[Varchar50]
     county_id: Mapped[int]
+    # of the town in data/json/locations.json, read by the radius search
+    latitude: Mapped[float]
+    longitude: Mapped[float]
+
+# istartswith compiles to ILIKE 'abc%' on PostgreSQL, which a btree cannot serve
+Index(
+    'ix_customers_town_name_trgm',
+    Customers.town_name,
+    postgresql_using='gin',
+    postgresql_ops={'town_name': 'gin_trgm_ops'}
+).ddl_if(dialect='postgresql')
 
 # -------- Cars_For_Sale Tables --------
 
+# the text search configuration of the descriptions, queries must use the same one
+TEXT_SEARCH_CONFIG = 'english'
+
+# SQLAlchemy's deep operator hierarchy, nothing is left to implement
+class DescriptionVector(FunctionElement):  # pylint: disable=too-many-ancestors,abstract-method
+    '''Expression of the generated description_tsv column'''
+    name = 'description_vector'
+    inherit_cache = True
+
+# the expression is fixed, the element and compiler are not needed
+@compiles(DescriptionVector)
+def compile_description_vector(
+    _element: DescriptionVector, _compiler: SQLCompiler, **_kw
+) -> str:
+    '''to_tsvector of the description on PostgreSQL'''
+    return f"to_tsvector('{TEXT_SEARCH_CONFIG}', description)"
+
+@compiles(DescriptionVector, 'sqlite')
+def compile_description_vector_sqlite(
+    _element: DescriptionVector, _compiler: SQLCompiler, **_kw
+) -> str:
+    '''SQLite has no tsvector, the lowercased description is searched instead'''
+    return 'lower(description)'
+
 class CarsForSale(Base):
     '''Cars for sale table'''
 
@@ -113,6 +171,13 @@ class CarsForSale(Base):
             onupdate='CASCADE',
             ondelete='CASCADE',
         ),
+        Index('ix_cars_for_sale_model_id', 'model_id'),
+        Index('ix_cars_for_sale_colour_id', 'colour_id'),
+        Index('ix_cars_for_sale_customer_id', 'customer_id'),
+        # keyset pagination and range filters, car_id breaks ties in each sort order
+        Index('ix_cars_for_sale_price_car_id', 'price', 'car_id'),
+        Index('ix_cars_for_sale_year_car_id', 'year', 'car_id'),
+        Index('ix_cars_for_sale_mileage_car_id', 'mileage', 'car_id'),
     )
 
     car_id: Mapped[IntPrimary]
@@ -125,6 +190,60 @@ class CarsForSale(Base):
     price: Mapped[Decimal2]
     mileage: Mapped[int]
     description: Mapped[str]
+    # generated by the database, never loaded or updated
+    description_tsv: Mapped[str] = mapped_column(
+        TSVECTOR().with_variant(Text(), 'sqlite'), Computed(DescriptionVector(), persisted=True)
+    )
+
+# keyword search, websearch_to_tsquery matches are served by the inverted index
+Index(
+    'ix_cars_for_sale_description_tsv', CarsForSale.description_tsv, postgresql_using='gin'
+).ddl_if(dialect='postgresql')
+
+# -------- Search Views --------
+
+class CarListings(ViewBase):
+    '''Cars for sale joined to their dimension tables, a materialized view on
+    PostgreSQL and a table rebuilt by refresh_car_listings elsewhere'''
+
+    __tablename__ = 'car_listings'
+    __table_args__ = (
+        Index('ix_car_listings_make_model', 'make', 'model'),
+        Index('ix_car_listings_colour', 'colour'),
+        Index('ix_car_listings_county_town', 'county', 'town'),
+        Index('ix_car_listings_town', 'town'),
+        # keyset pagination and range filters, car_id breaks ties in each sort order
+        Index('ix_car_listings_price_car_id', 'price', 'car_id'),
+        Index('ix_car_listings_year_car_id', 'year', 'car_id'),
+        Index('ix_car_listings_mileage_car_id', 'mileage', 'car_id'),
+    )
+
+    car_id: Mapped[IntPrimary]
+    make: Mapped[Varchar50]
+    model: Mapped[Varchar50]
+    colour: Mapped[Varchar50]
+    fuel_type: Mapped[FuelTypes]
+    transmission_type: Mapped[TransmissionTypes]
+    year: Mapped[int]
+    price: Mapped[Decimal2]
+    mileage: Mapped[int]
+    town: Mapped[Varchar50]
+    county: Mapped[Varchar50]
+
+# a materialized view has no primary key, REFRESH ... CONCURRENTLY needs a unique index
+Index('ix_car_listings_car_id', CarListings.car_id, unique=True).ddl_if(dialect='postgresql')
+
+# the view depends on the tables so it is dropped with them
+event.listen(
+    Base.metadata,
+    'before_drop',
+    DDL('DROP MATERIALIZED VIEW IF EXISTS car_listings').execute_if(dialect='postgresql')
+)
+event.listen(
+    Base.metadata,
+    'before_drop',
+    DDL('DROP TABLE IF EXISTS car_listings').execute_if(dialect='sqlite')
+)
 
 if __name__ == '__main__':
     # output SQL from metadata
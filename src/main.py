@@ -1,14 +1,42 @@
 ''' This module is the entrypoint for the `Arthur's Motors` FastAPI app. '''
+from contextlib import asynccontextmanager
+from os import path
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.exceptions import RequestValidationError
-from fastapi.templating import Jinja2Templates
 
 from .dependencies import ROOT_PATH
 from .controllers import motors_router
-templates = Jinja2Templates(directory=f'{ROOT_PATH}/views')
+from .controllers.controller_motors import warm_templates
+from .db.connection import APP_ENV, create_async_db_engine, dispose_engine
+from .models.model_motors import refresh_location_index_async, refresh_dimension_cache_async
+from .models.model_inventory import SEARCH_ENGINE, refresh_inventory_snapshot_async
+from .models.model_nearby import refresh_customer_index_async
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(motors_app: FastAPI):
+    ''' Create the async engine, compile the templates and build the in-memory
+        indexes before serving requests, dispose of the engines on shutdown
+    '''
+    print(f'\nEnvironment: {APP_ENV}')
+    motors_app.state.async_engine = create_async_db_engine()
+    warm_templates()
+    if motors_app.state.async_engine is not None:
+        await refresh_location_index_async(motors_app.state.async_engine)
+        await refresh_dimension_cache_async(motors_app.state.async_engine)
+        await refresh_customer_index_async(motors_app.state.async_engine)
+        if SEARCH_ENGINE == 'memory':
+            await refresh_inventory_snapshot_async(motors_app.state.async_engine)
+
+    yield
+
+    if motors_app.state.async_engine is not None:
+        await motors_app.state.async_engine.dispose()
+    dispose_engine()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(motors_router)
 
 # Global Error handling
@@ -33,4 +61,5 @@ app.include_router(motors_router)
 #     )
 
 # Serve static files
-app.mount('/public', StaticFiles(directory=f'{ROOT_PATH}/public', html=True), name='public')
+if path.isdir(f'{ROOT_PATH}/public'):
+    app.mount('/public', StaticFiles(directory=f'{ROOT_PATH}/public', html=True), name='public')
@@ -0,0 +1,96 @@
+''' in-memory cache of the makes, models and colours for the chained search form '''
+from collections import defaultdict
+from typing import Iterable, Optional
+
+
+def group_models(model_keys: Iterable[tuple[str, str]]) -> dict[str, list[str]]:
+    ''' the sorted model names of every make from (make, model) pairs '''
+    models_of = defaultdict(set)
+    for make, model in model_keys:
+        models_of[make].add(model)
+    return {make: sorted(names) for make, names in models_of.items()}
+
+
+def group_colours(
+    model_keys: dict[int, tuple[str, str]],
+    colour_names: dict[int, str],
+    model_colours: Iterable[tuple[int, int]],
+) -> tuple[dict[tuple[str, str], list[str]], dict[str, list[str]]]:
+    ''' the sorted colour names of every (make, model) and of every make '''
+    colours_of_model, colours_of_make = defaultdict(set), defaultdict(set)
+    for model_id, colour_id in model_colours:
+        make, model = model_keys[model_id]
+        colours_of_model[(make, model)].add(colour_names[colour_id])
+        colours_of_make[make].add(colour_names[colour_id])
+    return (
+        {key: sorted(names) for key, names in colours_of_model.items()},
+        {make: sorted(names) for make, names in colours_of_make.items()},
+    )
+
+
+class DimensionCache:
+    ''' the option lists of the make, model and colour selects
+
+        Models are keyed by make and colours by (make, model), model names are
+        only unique within a make. The colours of a model are the colours its
+        cars for sale come in. Every list is sorted when the cache is loaded so
+        a lookup returns it as is.
+    '''
+
+    def __init__(self):
+        self._makes: list[str] = []
+        self._colours: list[str] = []
+        self._models: dict[str, list[str]] = {}
+        self._make_colours: dict[str, list[str]] = {}
+        self._model_colours: dict[tuple[str, str], list[str]] = {}
+        self.loaded = False
+        self.version: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._makes)
+
+    def load(
+        self,
+        makes: Iterable[tuple[int, str]],
+        models: Iterable[tuple[int, str, int]],
+        colours: Iterable[tuple[int, str]],
+        model_colours: Iterable[tuple[int, int]],
+        version: Optional[str] = None
+    ) -> None:
+        ''' rebuilds the cache from (make_id, make_name), (model_id, model_name, make_id),
+            (colour_id, colour_name) and (model_id, colour_id) rows of the data version
+        '''
+        make_names = dict(makes)
+        colour_names = dict(colours)
+        model_keys = {
+            model_id: (make_names[make_id], model_name) for model_id, model_name, make_id in models
+        }
+        colours_of_model, colours_of_make = group_colours(model_keys, colour_names, model_colours)
+
+        # swap everything at once so readers never see a half built cache
+        self._makes, self._colours, self._models, self._make_colours, self._model_colours = (
+            sorted(make_names.values()),
+            sorted(colour_names.values()),
+            group_models(model_keys.values()),
+            colours_of_make,
+            colours_of_model,
+        )
+        self.loaded, self.version = True, version
+
+    def makes(self) -> list[str]:
+        ''' every make '''
+        return self._makes
+
+    def models(self, make: str = '') -> list[str]:
+        ''' the models of the make, none until a make is chosen '''
+        return self._models.get(make, [])
+
+    def colours(self, make: str = '', model: str = '') -> list[str]:
+        ''' the colours of the model, of every model of the make if no model is
+            chosen, or every colour if no make is chosen
+        '''
+        if not make:
+            return self._colours
+        if not model:
+            return self._make_colours.get(make, [])
+        return self._model_colours.get((make, model), [])
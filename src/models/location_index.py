@@ -0,0 +1,64 @@
+''' in-memory prefix index for the locations typeahead '''
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import nsmallest
+from typing import Iterable, Optional
+
+# upper bound used to find the end of a prefix range in the sorted keys
+MAX_CHAR = chr(0x10FFFF)
+
+
+class LocationIndex:
+    ''' sorted array of case-folded town and county names searched with bisect
+
+        Each entry is a (key, label, weight) triple where key is the case-folded
+        name, label is the text shown in the datalist and weight is the number
+        of customers at that location, used to rank the matches.
+    '''
+
+    def __init__(self, rows: Iterable[tuple[str, str, int]] = ()):
+        self._keys: list[str] = []
+        self._labels: list[str] = []
+        self._weights: list[int] = []
+        self.loaded = False
+        self.version: Optional[str] = None
+        if rows:
+            self.load(rows)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def load(self, rows: Iterable[tuple[str, str, int]], version: Optional[str] = None) -> None:
+        ''' rebuilds the index from (town_name, county_name, count) rows of the data version '''
+        weights = defaultdict(int)
+
+        for town, county, count in rows:
+            if town and county:
+                weights[(town.casefold(), f'{town}, {county}')] += count
+            if county:
+                weights[(county.casefold(), county)] += count
+
+        entries = sorted(weights.items())
+
+        # swap all three arrays at once so readers never see a half built index
+        self._keys, self._labels, self._weights = (
+            [key for (key, _), _ in entries],
+            [label for (_, label), _ in entries],
+            [weight for _, weight in entries]
+        )
+        self.loaded, self.version = True, version
+
+    def search(self, search_term: str, limit: int = 10) -> list[str]:
+        ''' returns up to limit labels starting with the search term, most popular first '''
+        prefix = search_term.strip().casefold()
+        if not prefix or limit < 1:
+            return []
+
+        keys, labels, weights = self._keys, self._labels, self._weights
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + MAX_CHAR, lo=start)
+
+        ranked = nsmallest(
+            limit, range(start, end), key=lambda i: (-weights[i], labels[i])
+        )
+        return [labels[i] for i in ranked]
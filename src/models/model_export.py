@@ -0,0 +1,151 @@
+''' streaming export of the matching cars as CSV, NDJSON or Parquet
+
+    Rows are streamed from a server-side cursor over the async engine in batches
+    of EXPORT_BATCH_SIZE and each batch is encoded and sent before the next is
+    fetched, so memory use does not grow with the number of cars exported.
+'''
+import csv
+import io
+import json
+from typing import AsyncIterator, Callable, Literal, Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pydantic import Field
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from ..db.logger import statement_registry
+from .model_search import (
+    SearchFilters, LISTING_COLUMNS, listing_to_dict, listings_source, search_conditions,
+    keyset_order
+)
+
+EXPORT_BATCH_SIZE = 10_000
+
+ExportFormat = Literal['csv', 'ndjson', 'parquet']
+
+EXPORT_MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# low cardinality text is dictionary encoded, as in the seed files
+DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+EXPORT_SCHEMA = pa.schema([
+    ('car_id', pa.int64()),
+    ('make', DICTIONARY),
+    ('model', DICTIONARY),
+    ('colour', DICTIONARY),
+    ('fuel_type', DICTIONARY),
+    ('transmission_type', DICTIONARY),
+    ('year', pa.int64()),
+    ('price', pa.float64()),
+    ('mileage', pa.int64()),
+    ('town', DICTIONARY),
+    ('county', DICTIONARY),
+])
+
+
+class ExportFilters(SearchFilters):
+    ''' the search filters with the file format, limit caps the number of cars exported '''
+    format: ExportFormat = 'csv'
+    limit: Optional[int] = Field(default=None, ge=1)
+
+
+def export_statement(filters: ExportFilters):
+    ''' select of every matching car in sort order, starting after the cursor if given '''
+    order_by, seek = keyset_order(filters.sort, filters.cursor, filters.keyword)
+    stmt = (
+        select(*LISTING_COLUMNS)
+        .select_from(listings_source(filters))
+        .where(*search_conditions(filters), *seek)
+        .order_by(*order_by)
+    )
+    return stmt.limit(filters.limit) if filters.limit else stmt
+
+
+async def fetch_batches(
+    engine: AsyncEngine, stmt, batch_size: int
+) -> AsyncIterator[list[dict]]:
+    ''' yields the rows of the statement in batches read through a server-side cursor '''
+    stmt = statement_registry.register('export_cars', stmt)
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt.execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            yield [listing_to_dict(row) for row in partition]
+
+
+async def csv_chunks(batches: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    ''' encodes the batches as CSV with a header row '''
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_SCHEMA.names)
+    writer.writeheader()
+    async for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # the header alone when nothing matched
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def ndjson_chunks(batches: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    ''' encodes the batches as newline delimited JSON '''
+    async for batch in batches:
+        yield ''.join(json.dumps(row) + '\n' for row in batch).encode()
+
+
+class ChunkSink(io.RawIOBase):
+    ''' write-only file collecting the bytes written since the last drain
+
+        tell() keeps counting across drains as the Parquet footer records offsets.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        ''' returns and forgets the bytes written so far '''
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def parquet_chunks(batches: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    ''' encodes the batches as a Parquet file, one row group per batch '''
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, EXPORT_SCHEMA) as writer:
+        async for batch in batches:
+            writer.write_table(pa.Table.from_pylist(batch, schema=EXPORT_SCHEMA))
+            yield sink.drain()
+    yield sink.drain()
+
+
+ENCODERS: dict[str, Callable[[AsyncIterator[list[dict]]], AsyncIterator[bytes]]] = {
+    'csv': csv_chunks,
+    'ndjson': ndjson_chunks,
+    'parquet': parquet_chunks,
+}
+
+
+async def stream_export(
+    engine: AsyncEngine, stmt, export_format: ExportFormat, batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[bytes]:
+    ''' yields the encoded file a batch at a time, the connection is held until it is done '''
+    async for chunk in ENCODERS[export_format](fetch_batches(engine, stmt, batch_size)):
+        yield chunk
@@ -0,0 +1,313 @@
+''' in-memory columnar engine answering the car search from a snapshot of car_listings
+
+    The snapshot is an Arrow table with the text columns dictionary encoded,
+    held as NumPy arrays of codes and values. A search builds a boolean mask
+    from the filters, counts every facet with np.bincount over the masked codes
+    and reads the page from sort orders computed when the snapshot is loaded.
+    Results, facets and cursors are the same as search_cars, so a client can
+    switch between the engines between pages.
+
+    The snapshot remembers the data version it was read at and is reloaded on
+    the next search after the seeding or sync scripts bump it, mapped from the
+    shared snapshot they publish or else read from the database. Keyword
+    searches need the descriptions and are always answered by SQL.
+'''
+import asyncio
+from decimal import Decimal
+from os import environ as env
+from types import SimpleNamespace
+from typing import Optional
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import Connection, Enum, String, cast, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from ..db.logger import app_logger, statement_registry
+from ..db.table_classes import CarListings
+from ..utils.response_cache import data_version
+from ..utils.shared_snapshot import shared_snapshot
+from .model_search import (
+    SearchFilters, MILEAGE_BANDS, MILEAGE_BAND_LABELS, FACETS, LISTING_COLUMNS, SORT_COLUMNS,
+    RELEVANCE, encode_cursor, decode_cursor, search_cars
+)
+
+# 'memory' answers the searches from the snapshot, 'sql' from the database
+SEARCH_ENGINE = env.get('SEARCH_ENGINE', 'sql')
+
+# text columns held as dictionary codes, in table order
+DICTIONARY_COLUMNS = [
+    'make', 'model', 'colour', 'fuel_type', 'transmission_type', 'town', 'county'
+]
+NUMERIC_COLUMNS = {'car_id': np.int64, 'year': np.int64, 'price': np.float64, 'mileage': np.int64}
+
+# upper bounds of the mileage bands, searchsorted gives the band of every car
+MILEAGE_UPPERS = np.array([upper for _, _, upper in MILEAGE_BANDS if upper is not None])
+
+
+def inventory_statement():
+    ''' every listing in car_id order, enums read as their text values '''
+    columns = [
+        cast(column, String).label(column.name) if isinstance(column.type, Enum) else column
+        for column in LISTING_COLUMNS
+    ]
+    return select(*columns).order_by(CarListings.car_id)
+
+
+INVENTORY_STMT = statement_registry.register('inventory_snapshot', inventory_statement())
+
+
+def fetch_inventory(conn: Connection) -> pa.Table:
+    ''' reads car_listings into an Arrow table with the text columns dictionary encoded '''
+    df = pd.read_sql(INVENTORY_STMT, conn, dtype_backend='pyarrow')
+    table = pa.Table.from_pandas(df.astype(NUMERIC_COLUMNS), preserve_index=False)
+    for name in DICTIONARY_COLUMNS:
+        position = table.schema.get_field_index(name)
+        encoded = table.column(name).combine_chunks().dictionary_encode()
+        table = table.set_column(position, name, encoded)
+    return table
+
+
+def with_search_columns(table: pa.Table) -> pa.Table:
+    ''' adds the mileage band of every car and the rows in each sort order
+
+        The shared snapshot is written with them so the workers do not sort.
+    '''
+    car_id = table.column('car_id').to_numpy()
+    mileage = table.column('mileage').to_numpy()
+    columns = {'mileage_band': np.searchsorted(MILEAGE_UPPERS, mileage, side='right')}
+
+    # car_id breaks ties in every sort order as in keyset_order
+    for name in SORT_COLUMNS:
+        keys = table.column(name).to_numpy()
+        columns[f'order_{name}'] = (
+            np.argsort(keys, kind='stable') if name == 'car_id' else np.lexsort((car_id, keys))
+        )
+
+    for name, values in columns.items():
+        table = table.append_column(name, pa.array(values))
+    return table
+
+
+class InventorySnapshot:
+    ''' car_listings as NumPy arrays searched with vectorised masks '''
+
+    def __init__(self, table: Optional[pa.Table] = None, version: Optional[str] = None):
+        self.version: Optional[str] = None
+        self._state: Optional[SimpleNamespace] = None
+        if table is not None:
+            self.load(table, version)
+
+    def __len__(self) -> int:
+        return len(self._state.car_id) if self._state else 0
+
+    @property
+    def loaded(self) -> bool:
+        ''' True once a snapshot has been loaded '''
+        return self._state is not None
+
+    def load(self, table: pa.Table, version: Optional[str] = None) -> None:
+        ''' replaces the snapshot with the rows of an Arrow table from fetch_inventory
+
+            The arrays are views of the table's buffers, a memory mapped table
+            is searched in place.
+        '''
+        if 'mileage_band' not in table.column_names:
+            table = with_search_columns(table)
+        table = table.combine_chunks()
+        state = SimpleNamespace(table=table, codes={}, values={}, lookup={}, numbers={}, orders={})
+
+        for name in DICTIONARY_COLUMNS:
+            column = table.column(name).chunk(0) if table.num_rows else pa.array(
+                [], pa.dictionary(pa.int32(), pa.string())
+            )
+            state.codes[name] = column.indices.to_numpy(zero_copy_only=False)
+            state.values[name] = np.array(column.dictionary.to_pylist(), dtype=object)
+            state.lookup[name] = {value: code for code, value in enumerate(state.values[name])}
+
+        for name in NUMERIC_COLUMNS:
+            state.numbers[name] = table.column(name).to_numpy()
+        state.car_id = state.numbers['car_id']
+
+        state.codes['mileage_band'] = table.column('mileage_band').to_numpy()
+        state.values['mileage_band'] = np.array(MILEAGE_BAND_LABELS, dtype=object)
+        state.lookup['mileage_band'] = {
+            label: code for code, label in enumerate(state.values['mileage_band'])
+        }
+
+        for name in SORT_COLUMNS:
+            state.orders[name] = table.column(f'order_{name}').to_numpy()
+
+        # swap everything at once so searches never see a half built snapshot
+        self._state, self.version = state, version
+
+    @staticmethod
+    def supports(filters: SearchFilters) -> bool:
+        ''' keyword searches and the relevance sort need the descriptions, which are
+            not in the snapshot, SQL answers or rejects them
+        '''
+        return filters.keyword is None and filters.sort.lstrip('-') != RELEVANCE
+
+    def equals(self, state: SimpleNamespace, name: str, value: str) -> np.ndarray:
+        ''' mask of the rows whose dictionary column holds the value '''
+        code = state.lookup[name].get(value)
+        if code is None:
+            return np.zeros(len(state.car_id), dtype=bool)
+        return state.codes[name] == code
+
+    def location_mask(self, state: SimpleNamespace, location: str) -> np.ndarray:
+        ''' matches a typeahead location as location_condition does '''
+        town, _, county = (part.strip() for part in location.partition(','))
+        if county:
+            return self.equals(state, 'town', town) & self.equals(state, 'county', county)
+        return self.equals(state, 'county', town) | self.equals(state, 'town', town)
+
+    def mask(self, state: SimpleNamespace, filters: SearchFilters) -> np.ndarray:
+        ''' the rows matching the filters, as search_conditions '''
+        mask = np.ones(len(state.car_id), dtype=bool)
+        equals = {
+            'make': filters.make,
+            'model': filters.model,
+            'colour': filters.colour,
+            'fuel_type': getattr(filters.fuel_type, 'value', None),
+            'transmission_type': getattr(filters.transmission_type, 'value', None),
+            'mileage_band': filters.mileage_band,
+        }
+        for name, value in equals.items():
+            if value is not None:
+                mask &= self.equals(state, name, value)
+
+        bounds = [
+            ('price', np.greater_equal, filters.min_price),
+            ('price', np.less_equal, filters.max_price),
+            ('year', np.greater_equal, filters.min_year),
+            ('year', np.less_equal, filters.max_year),
+        ]
+        for name, compare, value in bounds:
+            if value is not None:
+                mask &= compare(state.numbers[name], value)
+
+        if filters.location:
+            mask &= self.location_mask(state, filters.location)
+        return mask
+
+    def facets(self, state: SimpleNamespace, mask: np.ndarray) -> dict:
+        ''' the counts for every facet, largest first as fetch_facets '''
+        facets = {}
+        for name in FACETS:
+            values = state.values[name]
+            counts = np.bincount(state.codes[name][mask], minlength=len(values))
+            present = np.flatnonzero(counts)
+            facets[name] = dict(sorted(
+                ((values[code], int(counts[code])) for code in present),
+                key=lambda item: (-item[1], item[0])
+            ))
+        return facets
+
+    def page(self, state: SimpleNamespace, mask: np.ndarray, filters: SearchFilters) -> np.ndarray:
+        ''' positions of the rows on the page in sort order, with one more if there is a next '''
+        name = filters.sort.lstrip('-')
+        descending = filters.sort.startswith('-')
+        order = state.orders[name][::-1] if descending else state.orders[name]
+        candidates = order[mask[order]]
+
+        if filters.cursor:
+            value, car_id = decode_cursor(filters.sort, filters.cursor)
+            keys, ids = state.numbers[name][candidates], state.car_id[candidates]
+            value = float(value) if name == 'price' else value
+            if descending:
+                after = (keys < value) | ((keys == value) & (ids < car_id))
+            else:
+                after = (keys > value) | ((keys == value) & (ids > car_id))
+            # the candidates are in sort order so the rows after the cursor are a suffix
+            candidates = candidates[np.argmax(after):] if after.any() else candidates[:0]
+
+        return candidates[:filters.limit + 1]
+
+    def listing(self, state: SimpleNamespace, position: int) -> dict:
+        ''' the row at the position as listing_to_dict returns it '''
+        listing = {}
+        for column in LISTING_COLUMNS:
+            if column.name in state.codes:
+                listing[column.name] = state.values[column.name][state.codes[column.name][position]]
+            else:
+                listing[column.name] = state.numbers[column.name][position].item()
+        return listing
+
+    def search(self, filters: SearchFilters) -> dict:
+        ''' returns the same page, cursor and facet counts as search_cars '''
+        if (state := self._state) is None:
+            raise RuntimeError('the inventory snapshot has not been loaded')
+
+        mask = self.mask(state, filters)
+        positions = self.page(state, mask, filters)
+        page = [self.listing(state, position) for position in positions[:filters.limit]]
+        has_more = len(positions) > filters.limit
+
+        search = {'results': page, 'next_cursor': None}
+        if has_more:
+            # price is a Numeric(10, 2) in the database, formatted the same the cursors match
+            last = SimpleNamespace(**{**page[-1], 'price': Decimal(f'{page[-1]["price"]:.2f}')})
+            search['next_cursor'] = encode_cursor(filters.sort, last)
+        if not filters.cursor:
+            search['total'] = int(mask.sum())
+            search['facets'] = self.facets(state, mask)
+
+        return search
+
+    def stats(self) -> dict:
+        ''' returns the number of cars held with the data version they were read at '''
+        return {'engine': SEARCH_ENGINE, 'cars': len(self), 'version': self.version}
+
+
+inventory_snapshot = InventorySnapshot()
+
+# one reload at a time, the searches waiting for it use the snapshot it loaded
+inventory_lock = asyncio.Lock()
+
+
+def refresh_inventory_snapshot(conn: Connection) -> None:
+    ''' reloads the snapshot from car_listings, stamped with the version read beforehand '''
+    version = data_version.current()
+    inventory_snapshot.load(fetch_inventory(conn), version)
+
+
+def load_shared_inventory(version: str) -> bool:
+    ''' maps the inventory published for the version, False if there is none '''
+    if (table := shared_snapshot.read(version, 'inventory')) is None:
+        return False
+    inventory_snapshot.load(table, version)
+    return True
+
+
+async def refresh_inventory_snapshot_async(engine: AsyncEngine) -> bool:
+    ''' maps the shared snapshot of the current version or reads it through the async engine '''
+    if load_shared_inventory(data_version.current()):
+        return True
+    try:
+        async with engine.connect() as conn:
+            await conn.run_sync(refresh_inventory_snapshot)
+    except (SQLAlchemyError, OSError) as exc:
+        app_logger.error('Error building inventory snapshot: %s', exc)
+        return False
+    return True
+
+
+async def search_cars_async(engine: AsyncEngine, filters: SearchFilters) -> dict:
+    ''' answers the search from the snapshot when SEARCH_ENGINE is memory, else from SQL
+
+        The snapshot is reloaded first if the data has changed, the previous
+        one is kept if that fails. Only one search reloads it, the others
+        wait for the lock and find it current. The masks run in a worker thread, NumPy
+        releases the GIL so the event loop keeps serving other requests.
+    '''
+    if SEARCH_ENGINE == 'memory' and InventorySnapshot.supports(filters):
+        if inventory_snapshot.version != data_version.current():
+            async with inventory_lock:
+                if inventory_snapshot.version != data_version.current():
+                    await refresh_inventory_snapshot_async(engine)
+        if inventory_snapshot.loaded:
+            return await asyncio.to_thread(inventory_snapshot.search, filters)
+
+    async with engine.connect() as conn:
+        return await conn.run_sync(search_cars, filters)
@@ -4,9 +4,36 @@
 # import pandas as pd
 # from pydantic import BaseModel, field_validator, PositiveInt
 # from fastapi import HTTPException
-from sqlalchemy import select, join, case, or_, distinct # insert, desc, asc, bindparam
+import asyncio
+import pyarrow as pa
+from sqlalchemy import select, join, union, func, bindparam # insert, desc, asc
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
 from ..db.connection import create_connection
-from ..db.table_classes import Customers, Counties
+from ..db.logger import app_logger, statement_registry
+from ..db.table_classes import Customers, Counties, Makes, Models, Colours, CarsForSale
+from ..utils.response_cache import data_version
+from ..utils.shared_snapshot import shared_snapshot
+from .dimension_cache import DimensionCache
+from .location_index import LocationIndex
+
+# maximum number of locations returned to the typeahead
+LOCATIONS_LIMIT = 10
+
+location_index = LocationIndex()
+dimension_cache = DimensionCache()
+
+# one reload at a time, the requests waiting for it use the index or cache it loaded
+location_lock = asyncio.Lock()
+dimension_lock = asyncio.Lock()
+
+# the columns of every table the dimension cache is loaded from, in load order
+DIMENSION_COLUMNS = {
+    'makes': [Makes.make_id, Makes.make_name],
+    'models': [Models.model_id, Models.model_name, Models.make_id],
+    'colours': [Colours.colour_id, Colours.colour_name],
+    'model_colours': [CarsForSale.model_id, CarsForSale.colour_id],
+}
 
 
 def fetch_column(conn, column, is_distinct: bool=False) -> list[str]:
@@ -16,27 +43,198 @@ def fetch_column(conn, column, is_distinct: bool=False) -> list[str]:
     return list(response.scalars().all())
 
 
+def fetch_columns(conn, *columns, is_distinct: bool=False) -> list[tuple]:
+    ''' fetches all rows of the columns, as fetch_column does for a single column '''
+    stmt = select(*columns)
+    response = conn.execute(stmt.distinct() if is_distinct else stmt)
+    return [tuple(row) for row in response]
+
+
+def locations_statement():
+    ''' returns the select statement for locations starting with :search_term
+
+        Towns and counties are matched in separate selects so each side can use
+        the index on its own name column, the OR across the join could not.
+    '''
+    town_name, county_name = Customers.town_name, Counties.county_name
+    customers_counties = join(Customers, Counties, Customers.county_id == Counties.county_id)
+    search_term = bindparam('search_term', type_=town_name.type)
+
+    towns = (
+        select((town_name + ', ' + county_name).label('location'))
+        .select_from(customers_counties)
+        .filter(town_name.istartswith(search_term))
+    )
+    counties = (
+        select(county_name.label('location'))
+        .select_from(customers_counties)
+        .filter(county_name.istartswith(search_term))
+    )
+    return union(towns, counties)
+
+
+def location_counts_statement():
+    ''' returns the select statement counting the customers of every (town, county) '''
+    town_name, county_name = Customers.town_name, Counties.county_name
+
+    return (
+        select(town_name, county_name, func.count())
+        .select_from(join(Customers, Counties, Customers.county_id == Counties.county_id))
+        .group_by(town_name, county_name)
+    )
+
+
+# built once so every execution after the first is served by the compiled cache
+LOCATIONS_STMT = statement_registry.register('locations', locations_statement())
+LOCATION_COUNTS_STMT = statement_registry.register('location_counts', location_counts_statement())
+
+
 def fetch_locations(search_term: str='') -> list[str]:
     ''' fetches all locations that start with the search term '''
     locations = []
     if not (conn:= create_connection()):
         return locations
 
-    town_name, county_name = Customers.town_name, Counties.county_name
+    with conn, conn.begin():
+        locations = conn.execute(LOCATIONS_STMT, {'search_term': search_term}).scalars().all()
+    return locations
 
-    stmt = (
-        select(
-            distinct(
-                case(
-                    (town_name.istartswith(search_term), town_name + ', ' + county_name),
-                    (county_name.istartswith(search_term), county_name)
-                ).label('location')
-            )
-        )
-        .select_from(join(Customers, Counties, Customers.county_id == Counties.county_id))
-        .filter(or_(town_name.istartswith(search_term), county_name.istartswith(search_term)))
-    )
 
-    with conn.begin():
-        locations = conn.execute(stmt, {'search_term': search_term}).scalars().all()
-    return locations
+def fetch_location_counts(conn) -> list[tuple[str, str, int]]:
+    ''' fetches every (town, county) pair with its number of customers '''
+    return [tuple(row) for row in conn.execute(LOCATION_COUNTS_STMT)]
+
+
+def location_counts_table(rows: list[tuple[str, str, int]]) -> pa.Table:
+    ''' the location counts as an Arrow table for the shared snapshot '''
+    towns, counties, counts = zip(*rows) if rows else ((), (), ())
+    return pa.table({
+        'town': pa.array(towns, pa.string()),
+        'county': pa.array(counties, pa.string()),
+        'count': pa.array(counts, pa.int64()),
+    })
+
+
+def load_shared_locations(version: str) -> bool:
+    ''' loads the index from the location counts published for the version, False if none '''
+    if (table := shared_snapshot.read(version, 'locations')) is None:
+        return False
+    columns = [table.column(name).to_pylist() for name in ('town', 'county', 'count')]
+    location_index.load(zip(*columns), version)
+    return True
+
+
+def refresh_location_index() -> bool:
+    ''' rebuilds the in-memory locations index from the database '''
+    if not (conn:= create_connection()):
+        return False
+
+    try:
+        with conn, conn.begin():
+            location_index.load(fetch_location_counts(conn), data_version.current())
+    except SQLAlchemyError:
+        app_logger.exception('Error building locations index')
+        return False
+    return True
+
+
+def search_locations(search_term: str='', limit: int=LOCATIONS_LIMIT) -> list[str]:
+    ''' returns the most popular locations starting with the search term from memory,
+        falling back to the database if the index could not be built
+    '''
+    if not location_index.loaded and not refresh_location_index():
+        return fetch_locations(search_term)[:limit]
+
+    return location_index.search(search_term, limit)
+
+
+def fetch_dimensions(conn) -> dict[str, list[tuple]]:
+    ''' fetches the makes, models and colours and the distinct colours of every model for sale '''
+    return {
+        name: fetch_columns(conn, *columns, is_distinct=name == 'model_colours')
+        for name, columns in DIMENSION_COLUMNS.items()
+    }
+
+
+def model_colours_table(rows: list[tuple[int, int]]) -> pa.Table:
+    ''' the (model_id, colour_id) pairs as an Arrow table for the shared snapshot '''
+    model_ids, colour_ids = zip(*rows) if rows else ((), ())
+    return pa.table({
+        'model_id': pa.array(model_ids, pa.int64()),
+        'colour_id': pa.array(colour_ids, pa.int64()),
+    })
+
+
+def load_shared_dimensions(version: str) -> bool:
+    ''' loads the cache from the dimension tables published for the version, False if any
+        is missing
+    '''
+    tables = {name: shared_snapshot.read(version, name) for name in DIMENSION_COLUMNS}
+    if any(table is None for table in tables.values()):
+        return False
+    dimension_cache.load(**{
+        name: zip(*(tables[name].column(column.name).to_pylist() for column in columns))
+        for name, columns in DIMENSION_COLUMNS.items()
+    }, version=version)
+    return True
+
+
+# -------- Async versions for the route handlers --------
+
+async def refresh_location_index_async(engine: AsyncEngine) -> bool:
+    ''' loads the locations index from the shared snapshot of the current version,
+        or rebuilds it from the database without blocking the event loop
+    '''
+    version = data_version.current()
+    if load_shared_locations(version):
+        return True
+    try:
+        async with engine.connect() as conn:
+            location_index.load(await conn.run_sync(fetch_location_counts), version)
+    except (SQLAlchemyError, OSError) as exc:
+        app_logger.error('Error building locations index: %s', exc)
+        return False
+    return True
+
+
+async def search_locations_async(
+    engine: AsyncEngine, search_term: str='', limit: int=LOCATIONS_LIMIT
+) -> list[str]:
+    ''' search_locations for the route handlers, the index is reloaded once the data changes '''
+    if location_index.version != data_version.current():
+        async with location_lock:
+            if location_index.version != data_version.current():
+                await refresh_location_index_async(engine)
+    if not location_index.loaded:
+        async with engine.connect() as conn:
+            result = await conn.execute(LOCATIONS_STMT, {'search_term': search_term})
+            return list(result.scalars().all())[:limit]
+
+    return location_index.search(search_term, limit)
+
+
+async def refresh_dimension_cache_async(engine: AsyncEngine) -> bool:
+    ''' loads the dimension cache from the shared snapshot of the current version,
+        or with one select per table from the database
+    '''
+    version = data_version.current()
+    if load_shared_dimensions(version):
+        return True
+    try:
+        async with engine.connect() as conn:
+            dimension_cache.load(**await conn.run_sync(fetch_dimensions), version=version)
+    except (SQLAlchemyError, OSError) as exc:
+        app_logger.error('Error building dimension cache: %s', exc)
+        return False
+    return True
+
+
+async def current_dimensions(engine: AsyncEngine) -> DimensionCache:
+    ''' the dimension cache for the chained form, reloaded once the data changes so the
+        database is not read on every change of the form, the first request reloads it
+    '''
+    if dimension_cache.version != data_version.current():
+        async with dimension_lock:
+            if dimension_cache.version != data_version.current():
+                await refresh_dimension_cache_async(engine)
+    return dimension_cache
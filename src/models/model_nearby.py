@@ -0,0 +1,189 @@
+''' radius search for the cars sold within a distance of a town
+
+    Every customer is located at the coordinates of their town, held in memory
+    by a SpatialIndex of customer ids. A search finds the town in the locations
+    dataset, reads the customers within the radius nearest first and fetches
+    the listings of the nearest customers in batches, stopping once a batch
+    fills the page, so a wide radius only reads the cars it returns. Distances
+    are computed with the haversine formula, the database needs no spatial
+    extension.
+
+    Like the locations index the customer index remembers the data version it
+    was built at and is reloaded from the shared snapshot or the database once
+    the seeding or sync scripts bump it.
+'''
+import asyncio
+from functools import cache
+from typing import Optional
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pydantic import BaseModel, Field
+from sqlalchemy import Connection, bindparam, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from ..db.logger import app_logger, statement_registry
+from ..db.table_classes import CarListings, CarsForSale, Customers
+from ..utils.file_utils import load_json_data
+from ..utils.response_cache import data_version
+from ..utils.shared_snapshot import shared_snapshot
+from .model_search import LISTING_COLUMNS, listing_to_dict
+from .spatial_index import SpatialIndex
+
+MAX_MILES = 200
+
+# customers whose listings are read per statement, nearest first
+CUSTOMER_BATCH = 500
+
+customer_index = SpatialIndex()
+
+# one reload at a time, the searches waiting for it use the index it loaded
+customer_lock = asyncio.Lock()
+
+
+class NearbyFilters(BaseModel):
+    ''' query parameters of the radius search, location is a town or "Town, County" '''
+    location: str = Field(min_length=1, max_length=100)
+    miles: float = Field(default=25, gt=0, le=MAX_MILES)
+    limit: int = Field(default=20, ge=1, le=100)
+
+
+@cache
+def town_coordinates() -> dict[str, list[tuple[str, str, float, float]]]:
+    ''' (town, county, latitude, longitude) of the locations dataset by case-folded town '''
+    towns = {}
+    for location in load_json_data('data/json/locations.json'):
+        towns.setdefault(location['town'].casefold(), []).append((
+            location['town'], location['county'], location['latitude'], location['longitude']
+        ))
+    return towns
+
+
+def locate_town(location: str) -> tuple[float, float]:
+    ''' latitude and longitude of a typeahead location, the county is needed if the
+        town name is in more than one county
+    '''
+    town, _, county = (part.strip() for part in location.partition(','))
+    matches = [
+        match for match in town_coordinates().get(town.casefold(), [])
+        if not county or match[1].casefold() == county.casefold()
+    ]
+    if not matches:
+        raise ValueError(f'Unknown town {location!r}')
+    if len(matches) > 1:
+        labels = [f'{match[0]}, {match[1]}' for match in matches]
+        raise ValueError(f'{town} is in more than one county, one of {labels}')
+
+    _, _, latitude, longitude = matches[0]
+    return latitude, longitude
+
+
+def customer_locations_statement():
+    ''' every customer id with its coordinates '''
+    return select(Customers.customer_id, Customers.latitude, Customers.longitude)
+
+
+def nearby_statement():
+    ''' the listings of the :customer_ids with the customer selling each car '''
+    return (
+        select(*LISTING_COLUMNS, CarsForSale.customer_id)
+        .select_from(CarListings.__table__.join(
+            CarsForSale.__table__, CarsForSale.car_id == CarListings.car_id
+        ))
+        .where(CarsForSale.customer_id.in_(bindparam('customer_ids', expanding=True)))
+    )
+
+
+CUSTOMER_LOCATIONS_STMT = statement_registry.register(
+    'customer_locations', customer_locations_statement()
+)
+NEARBY_STMT = statement_registry.register('nearby_listings', nearby_statement())
+
+
+def fetch_customer_locations(conn: Connection) -> pa.Table:
+    ''' reads the customer coordinates into an Arrow table for the index and shared snapshot '''
+    df = pd.read_sql(CUSTOMER_LOCATIONS_STMT, conn)
+    return pa.Table.from_pandas(
+        df.astype({'customer_id': np.int64, 'latitude': np.float64, 'longitude': np.float64}),
+        preserve_index=False
+    )
+
+
+def load_customer_locations(table: pa.Table, version: Optional[str] = None) -> None:
+    ''' rebuilds the customer index from a customer locations table '''
+    customer_index.load(
+        *(table.column(name).to_numpy() for name in ('customer_id', 'latitude', 'longitude')),
+        version
+    )
+
+
+def refresh_customer_index(conn: Connection) -> None:
+    ''' rebuilds the customer index from the database, stamped with the version read beforehand '''
+    version = data_version.current()
+    load_customer_locations(fetch_customer_locations(conn), version)
+
+
+def load_shared_customers(version: str) -> bool:
+    ''' loads the customer locations published for the version, False if there are none '''
+    if (table := shared_snapshot.read(version, 'customer_locations')) is None:
+        return False
+    load_customer_locations(table, version)
+    return True
+
+
+def nearby_listings(conn: Connection, filters: NearbyFilters) -> dict:
+    ''' returns the cars for sale nearest the town first, with their distance in miles '''
+    latitude, longitude = locate_town(filters.location)
+    if not customer_index.loaded:
+        refresh_customer_index(conn)
+
+    customer_ids, distances = customer_index.within(latitude, longitude, filters.miles)
+    listings, start = [], 0
+    while start < len(customer_ids) and len(listings) < filters.limit:
+        # customers as far away as the last of the batch join it, later batches are all further
+        end = min(start + CUSTOMER_BATCH, len(customer_ids))
+        end = int(np.searchsorted(distances, distances[end - 1], side='right'))
+
+        batch = dict(zip(customer_ids[start:end].tolist(), distances[start:end].tolist()))
+        rows = conn.execute(NEARBY_STMT, {'customer_ids': list(batch)})
+        listings += [(batch[row.customer_id], row) for row in rows]
+        start = end
+
+    listings.sort(key=lambda listing: (listing[0], listing[1].car_id))
+    results = []
+    for distance, row in listings[:filters.limit]:
+        listing = listing_to_dict(row)
+        del listing['customer_id']
+        results.append({**listing, 'distance_miles': round(distance, 2)})
+
+    return {'location': filters.location, 'miles': filters.miles, 'results': results}
+
+
+# -------- Async versions for the route handlers --------
+
+async def refresh_customer_index_async(engine: AsyncEngine) -> bool:
+    ''' loads the customer index from the shared snapshot of the current version,
+        or rebuilds it from the database without blocking the event loop
+    '''
+    if load_shared_customers(data_version.current()):
+        return True
+    try:
+        async with engine.connect() as conn:
+            await conn.run_sync(refresh_customer_index)
+    except (SQLAlchemyError, OSError) as exc:
+        app_logger.error('Error building customer index: %s', exc)
+        return False
+    return True
+
+
+async def nearby_listings_async(engine: AsyncEngine, filters: NearbyFilters) -> dict:
+    ''' nearby_listings for the route handlers, the index is reloaded once the data changes
+        by the first request, the others wait for the lock and find it current
+    '''
+    if customer_index.version != data_version.current():
+        async with customer_lock:
+            if customer_index.version != data_version.current():
+                await refresh_customer_index_async(engine)
+
+    async with engine.connect() as conn:
+        return await conn.run_sync(nearby_listings, filters)
@@ -0,0 +1,418 @@
+''' models and functions for the car search form '''
+import json
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from typing import Literal, Optional
+from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import (
+    select, case, func, literal, literal_column, tuple_, union_all, cast,
+    Boolean, Float, String, Text, Connection
+)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.compiler import SQLCompiler
+from sqlalchemy.sql.functions import FunctionElement
+from ..db.logger import statement_registry
+from ..db.table_classes import (
+    CarListings, CarsForSale, FuelTypes, TransmissionTypes, TEXT_SEARCH_CONFIG
+)
+
+# (label, lower bound, upper bound) for the mileage facet
+MILEAGE_BANDS = [
+    ('up to 10,000', 0, 10_000),
+    ('10,000 to 30,000', 10_000, 30_000),
+    ('30,000 to 60,000', 30_000, 60_000),
+    ('60,000 to 100,000', 60_000, 100_000),
+    ('over 100,000', 100_000, None),
+]
+MILEAGE_BAND_LABELS = [label for label, *_ in MILEAGE_BANDS]
+
+# rendered with inline literals so the expression is identical in SELECT and GROUP BY
+mileage_band = case(
+    *[
+        (CarListings.mileage < literal_column(str(upper)), literal_column(f"'{label}'"))
+        for label, _, upper in MILEAGE_BANDS if upper is not None
+    ],
+    else_=literal_column(f"'{MILEAGE_BANDS[-1][0]}'")
+)
+
+# columns counted for the search form, in display order
+FACETS = {
+    'make': CarListings.make,
+    'model': CarListings.model,
+    'colour': CarListings.colour,
+    'fuel_type': CarListings.fuel_type,
+    'transmission_type': CarListings.transmission_type,
+    'mileage_band': mileage_band,
+    'county': CarListings.county,
+}
+
+# sort orders for the results, car_id breaks ties so every row has a unique position
+SORT_COLUMNS = {
+    'car_id': CarListings.car_id,
+    'price': CarListings.price,
+    'year': CarListings.year,
+    'mileage': CarListings.mileage,
+}
+# best keyword matches first, only with a keyword
+RELEVANCE = 'relevance'
+SortOrder = Literal[
+    'car_id', '-car_id', 'price', '-price', 'year', '-year', 'mileage', '-mileage', '-relevance'
+]
+
+# highlighted fragments of the description returned with keyword results
+HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxWords=30, MinWords=10'
+SNIPPET_LENGTH = 200
+
+# car_listings is refreshed from the tables, see src/db/listings.py
+LISTING_COLUMNS = list(CarListings.__table__.columns)
+
+
+class SearchFilters(BaseModel):
+    ''' query parameters of the search form, unset filters match everything '''
+    make: Optional[str] = None
+    model: Optional[str] = None
+    colour: Optional[str] = None
+    fuel_type: Optional[FuelTypes] = None
+    transmission_type: Optional[TransmissionTypes] = None
+    min_price: Optional[int] = Field(default=None, ge=0)
+    max_price: Optional[int] = Field(default=None, ge=0)
+    min_year: Optional[int] = None
+    max_year: Optional[int] = None
+    mileage_band: Optional[str] = None
+    location: Optional[str] = None
+    keyword: Optional[str] = Field(default=None, max_length=200)
+    limit: int = Field(default=20, ge=1, le=100)
+    sort: SortOrder = 'car_id'
+    cursor: Optional[str] = None
+
+    @field_validator('mileage_band')
+    @classmethod
+    def check_mileage_band(cls, value: Optional[str]) -> Optional[str]:
+        ''' mileage band must be one of the facet labels '''
+        if value is not None and value not in MILEAGE_BAND_LABELS:
+            raise ValueError(f'mileage_band must be one of {MILEAGE_BAND_LABELS}')
+        return value
+
+    @field_validator('keyword')
+    @classmethod
+    def check_keyword(cls, value: Optional[str]) -> Optional[str]:
+        ''' keyword must contain a word, a blank keyword matches everything '''
+        if value is None or not value.strip():
+            return None
+        if not keyword_terms(value):
+            raise ValueError('keyword must contain a word')
+        return value.strip()
+
+
+def keyword_terms(keyword: str) -> list[str]:
+    ''' the lowercased words of the keyword, used where there is no full text search '''
+    return re.findall(r'\w+', keyword.lower())
+
+
+# -------- Keyword search --------
+# PostgreSQL searches the generated description_tsv column with websearch_to_tsquery,
+# which the GIN index serves. Elsewhere description_tsv is the lowercased description,
+# every word of the keyword must appear in it, quotes and operators are ignored.
+
+class KeywordFunction(FunctionElement):
+    ''' function of the keyword, the clauses are the keyword then each of its words '''
+    inherit_cache = True
+
+    def __init__(self, keyword: str):
+        super().__init__(
+            literal(keyword, Text), *(literal(term, Text) for term in keyword_terms(keyword))
+        )
+
+class KeywordMatch(KeywordFunction):
+    ''' true for the cars whose description matches the keyword '''
+    name = 'keyword_match'
+    type = Boolean()
+    inherit_cache = True
+
+class KeywordRank(KeywordFunction):
+    ''' how well the description matches the keyword, higher is better '''
+    name = 'keyword_rank'
+    type = Float()
+    inherit_cache = True
+
+class KeywordSnippet(KeywordFunction):
+    ''' the part of the description matching the keyword '''
+    name = 'keyword_snippet'
+    type = Text()
+    inherit_cache = True
+
+
+def ts_query(element: KeywordFunction, compiler: SQLCompiler, **kw) -> str:
+    ''' websearch_to_tsquery of the keyword '''
+    keyword = compiler.process(element.clauses.clauses[0], **kw)
+    return f"websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', {keyword})"
+
+
+def first_term_position(element: KeywordFunction, compiler: SQLCompiler, **kw) -> str:
+    ''' position of the first word of the keyword in the lowercased description '''
+    vector = compiler.process(CarsForSale.description_tsv, **kw)
+    return f'instr({vector}, {compiler.process(element.clauses.clauses[1], **kw)})'
+
+
+@compiles(KeywordMatch)
+def compile_keyword_match(element: KeywordMatch, compiler: SQLCompiler, **kw) -> str:
+    ''' tsvector @@ tsquery '''
+    vector = compiler.process(CarsForSale.description_tsv, **kw)
+    return f'{vector} @@ {ts_query(element, compiler, **kw)}'
+
+@compiles(KeywordMatch, 'sqlite')
+def compile_keyword_match_sqlite(element: KeywordMatch, compiler: SQLCompiler, **kw) -> str:
+    ''' every word of the keyword appears in the description '''
+    vector = compiler.process(CarsForSale.description_tsv, **kw)
+    return '(' + ' AND '.join(
+        f'instr({vector}, {compiler.process(term, **kw)}) > 0'
+        for term in element.clauses.clauses[1:]
+    ) + ')'
+
+@compiles(KeywordRank)
+def compile_keyword_rank(element: KeywordRank, compiler: SQLCompiler, **kw) -> str:
+    ''' ts_rank of the description, in double precision so cursors compare exactly '''
+    vector = compiler.process(CarsForSale.description_tsv, **kw)
+    return f'CAST(ts_rank({vector}, {ts_query(element, compiler, **kw)}) AS DOUBLE PRECISION)'
+
+@compiles(KeywordRank, 'sqlite')
+def compile_keyword_rank_sqlite(element: KeywordRank, compiler: SQLCompiler, **kw) -> str:
+    ''' the earlier the first word appears the better '''
+    return f'1.0 / {first_term_position(element, compiler, **kw)}'
+
+@compiles(KeywordSnippet)
+def compile_keyword_snippet(element: KeywordSnippet, compiler: SQLCompiler, **kw) -> str:
+    ''' ts_headline with the matching words highlighted '''
+    description = compiler.process(CarsForSale.description, **kw)
+    return (
+        f"ts_headline('{TEXT_SEARCH_CONFIG}', {description}, "
+        f"{ts_query(element, compiler, **kw)}, '{HEADLINE_OPTIONS}')"
+    )
+
+@compiles(KeywordSnippet, 'sqlite')
+def compile_keyword_snippet_sqlite(element: KeywordSnippet, compiler: SQLCompiler, **kw) -> str:
+    ''' the description from shortly before the first word, not highlighted '''
+    description = compiler.process(CarsForSale.description, **kw)
+    start = f'max({first_term_position(element, compiler, **kw)} - 40, 1)'
+    return f'substr({description}, {start}, {SNIPPET_LENGTH})'
+
+
+def listings_source(filters: SearchFilters):
+    ''' car_listings, joined to cars_for_sale by primary key to search the descriptions '''
+    if not filters.keyword:
+        return CarListings.__table__
+    return CarListings.__table__.join(
+        CarsForSale.__table__, CarsForSale.car_id == CarListings.car_id
+    )
+
+
+def location_condition(location: str):
+    ''' matches a typeahead location, either "Town, County" or a county or town name '''
+    town, _, county = (part.strip() for part in location.partition(','))
+    if county:
+        return (CarListings.town == town) & (CarListings.county == county)
+    return (CarListings.county == town) | (CarListings.town == town)
+
+
+def search_conditions(filters: SearchFilters) -> list:
+    ''' converts the search filters into where clauses '''
+    equals = {
+        CarListings.make: filters.make,
+        CarListings.model: filters.model,
+        CarListings.colour: filters.colour,
+        CarListings.fuel_type: filters.fuel_type,
+        CarListings.transmission_type: filters.transmission_type,
+    }
+    conditions = [column == value for column, value in equals.items() if value is not None]
+
+    minimums = {CarListings.price: filters.min_price, CarListings.year: filters.min_year}
+    maximums = {CarListings.price: filters.max_price, CarListings.year: filters.max_year}
+    conditions += [column >= value for column, value in minimums.items() if value is not None]
+    conditions += [column <= value for column, value in maximums.items() if value is not None]
+
+    # mileage bands filter on the range so an index on mileage can be used
+    for label, lower, upper in MILEAGE_BANDS:
+        if filters.mileage_band == label:
+            conditions.append(CarListings.mileage >= lower)
+            if upper is not None:
+                conditions.append(CarListings.mileage < upper)
+
+    if filters.location:
+        conditions.append(location_condition(filters.location))
+
+    # needs the listings_source join
+    if filters.keyword:
+        conditions.append(KeywordMatch(filters.keyword))
+
+    return conditions
+
+
+def facets_statement(conditions: list, dialect_name: str = 'postgresql', source=CarListings):
+    ''' counts every facet and the total in a single statement
+
+        PostgreSQL groups once over the listings with GROUPING SETS, other databases
+        fall back to a UNION ALL of grouped aggregates.
+    '''
+    if dialect_name == 'postgresql':
+        grouping_sets = [tuple_(column) for column in FACETS.values()] + [tuple_()]
+        # GROUPING(column) is 0 in the rows grouped by the column, 1 in the others
+        groupings = [func.grouping(column) for column in FACETS.values()]
+        return (
+            select(*FACETS.values(), *groupings, func.count().label('count'))
+            .select_from(source)
+            .where(*conditions)
+            .group_by(func.grouping_sets(*grouping_sets))
+        )
+
+    selects = [
+        select(literal(name).label('facet'), cast(column, String).label('value'), func.count())
+        .select_from(source)
+        .where(*conditions)
+        .group_by(column)
+        for name, column in FACETS.items()
+    ]
+    selects.append(
+        select(literal('total'), literal(None, String), func.count())
+        .select_from(source)
+        .where(*conditions)
+    )
+    return union_all(*selects)
+
+
+def facet_value(value) -> str:
+    ''' enum facets are returned by their value '''
+    return getattr(value, 'value', value)
+
+
+def fetch_facets(conn: Connection, conditions: list, source=CarListings) -> tuple[int, dict]:
+    ''' returns the total number of matching cars and the counts for every facet
+
+        Every facet is counted with all the filters applied, its own included,
+        so each count is the number of cars the search would return with that
+        value chosen next. Once a make is chosen the make facet only counts that
+        make, to switch make the form clears the filter first.
+    '''
+    dialect_name = conn.dialect.name
+    facets = {name: {} for name in FACETS}
+    total = 0
+
+    stmt = facets_statement(conditions, dialect_name, source)
+    for row in conn.execute(statement_registry.register('search_facets', stmt)):
+        if dialect_name == 'postgresql':
+            # a value of NULL is still grouped, only GROUPING tells the total row apart
+            values, groupings, count = row[:len(FACETS)], row[len(FACETS):-1], row[-1]
+            grouped = [
+                (name, value)
+                for name, value, grouping in zip(FACETS, values, groupings) if grouping == 0
+            ]
+            name, value = grouped[0] if grouped else ('total', None)
+        else:
+            name, value, count = row
+
+        if name == 'total':
+            total = count
+        else:
+            facets[name][facet_value(value)] = count
+
+    return total, {
+        name: dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+        for name, counts in facets.items()
+    }
+
+
+def listing_to_dict(row) -> dict:
+    ''' converts a listings row into json serialisable values '''
+    listing = row._asdict()
+    listing['fuel_type'] = facet_value(listing['fuel_type'])
+    listing['transmission_type'] = facet_value(listing['transmission_type'])
+    listing['price'] = float(listing['price'])
+    return listing
+
+
+def sort_column(sort: str, keyword: Optional[str] = None):
+    ''' the column or, for relevance, the labelled keyword rank to sort by '''
+    name = sort.lstrip('-')
+    if name != RELEVANCE:
+        return SORT_COLUMNS[name]
+    if not keyword:
+        raise ValueError('sorting by relevance needs a keyword')
+    return KeywordRank(keyword).label(RELEVANCE)
+
+
+def encode_cursor(sort: str, row) -> str:
+    ''' opaque token holding the sort key of the last row on the page '''
+    position = [sort, str(getattr(row, sort.lstrip('-'))), row.car_id]
+    return urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(sort: str, cursor: str, keyword: Optional[str] = None) -> tuple:
+    ''' returns the (sort value, car_id) stored in the cursor '''
+    column = sort_column(sort, keyword)
+    try:
+        cursor_sort, value, car_id = json.loads(urlsafe_b64decode(cursor.encode()))
+        if cursor_sort != sort:
+            raise ValueError('cursor does not match the sort order')
+        return column.type.python_type(value), int(car_id)
+    except (DecodeError, TypeError, ValueError, ArithmeticError) as exc:
+        raise ValueError(f'Invalid cursor: {exc}') from exc
+
+
+def keyset_order(
+    sort: str, cursor: Optional[str] = None, keyword: Optional[str] = None
+) -> tuple[list, list]:
+    ''' returns the order by clauses and the seek condition for the page after the cursor
+
+        (column, car_id) is compared as a row value so a composite index on
+        both columns can start the scan at the cursor, whatever the page number.
+    '''
+    descending = sort.startswith('-')
+    column = sort_column(sort, keyword)
+    keys = [column] if column is CarListings.car_id else [column, CarListings.car_id]
+
+    order_by = [key.desc() for key in keys] if descending else keys
+    if not cursor:
+        return order_by, []
+
+    value, car_id = decode_cursor(sort, cursor, keyword)
+    position = tuple_(*keys)
+    after = tuple_(*([car_id] if len(keys) == 1 else [value, car_id]))
+    return order_by, [position < after if descending else position > after]
+
+
+def search_cars(conn: Connection, filters: SearchFilters) -> dict:
+    ''' returns a page of matching cars with the facet counts for the search form
+
+        Facets and the total are only counted for the first page, later pages
+        are requested with the next_cursor of the previous page.
+    '''
+    conditions = search_conditions(filters)
+    order_by, seek = keyset_order(filters.sort, filters.cursor, filters.keyword)
+    source = listings_source(filters)
+
+    # keyword results are ranked and have the matching part of the description
+    columns = list(LISTING_COLUMNS)
+    if filters.keyword:
+        columns += [
+            sort_column(RELEVANCE, filters.keyword),
+            KeywordSnippet(filters.keyword).label('snippet')
+        ]
+
+    stmt = (
+        select(*columns)
+        .select_from(source)
+        .where(*conditions, *seek)
+        .order_by(*order_by)
+        .limit(filters.limit + 1)
+    )
+    rows = conn.execute(statement_registry.register('search_cars', stmt)).all()
+    page, has_more = rows[:filters.limit], len(rows) > filters.limit
+
+    search = {
+        'results': [listing_to_dict(row) for row in page],
+        'next_cursor': encode_cursor(filters.sort, page[-1]) if has_more else None
+    }
+    if not filters.cursor:
+        search['total'], search['facets'] = fetch_facets(conn, conditions, source)
+
+    return search
@@ -0,0 +1,124 @@
+''' in-memory grid index for the radius search '''
+from typing import Optional
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = EARTH_RADIUS_MILES * np.pi / 180
+
+# about 35 miles of latitude, a 25 mile radius reads at most 3 x 3 cells
+CELL_DEGREES = 0.5
+GRID_COLUMNS = int(360 / CELL_DEGREES)
+
+
+def haversine_miles(
+    latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray
+) -> np.ndarray:
+    ''' great circle distances in miles from the point to every point of the arrays '''
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def grid_cells(latitudes: np.ndarray, longitudes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    ''' the (row, column) of the grid cell holding every point '''
+    rows = np.floor((np.asarray(latitudes) + 90) / CELL_DEGREES).astype(np.int64)
+    columns = np.floor((np.asarray(longitudes) + 180) / CELL_DEGREES).astype(np.int64)
+    return rows, np.clip(columns, 0, GRID_COLUMNS - 1)
+
+
+def bounding_cells(
+    latitude: float, longitude: float, miles: float
+) -> tuple[tuple[int, int], tuple[int, int]]:
+    ''' the (south, north) rows and (west, east) columns of the cells overlapping
+        the bounding box of the radius
+    '''
+    latitude_span = miles / MILES_PER_DEGREE
+    north, south = min(latitude + latitude_span, 90), max(latitude - latitude_span, -90)
+
+    # a degree of longitude is shortest at the edge of the box furthest from the equator
+    cos_latitude = np.cos(np.radians(max(abs(north), abs(south))))
+    longitude_span = miles / (MILES_PER_DEGREE * cos_latitude) if cos_latitude > 1e-9 else 360
+    rows, columns = grid_cells(
+        [south, north], [longitude - longitude_span, longitude + longitude_span]
+    )
+    return tuple(rows.tolist()), tuple(columns.tolist())
+
+
+class SpatialIndex:
+    ''' points bucketed into a fixed grid of latitude and longitude cells
+
+        The points are sorted by cell key, row * GRID_COLUMNS + column, so the
+        cells of one grid row covering a search are a single slice found with
+        np.searchsorted. Only the points in the slices around the origin have
+        their distance computed. Longitudes are not wrapped at the antimeridian.
+    '''
+
+    def __init__(
+        self,
+        ids: np.ndarray = (),
+        latitudes: np.ndarray = (),
+        longitudes: np.ndarray = (),
+    ):
+        self._keys = np.empty(0, np.int64)
+        self._ids = np.empty(0, np.int64)
+        self._latitudes = np.empty(0, np.float64)
+        self._longitudes = np.empty(0, np.float64)
+        self.loaded = False
+        self.version: Optional[str] = None
+        if np.asarray(ids).size:
+            self.load(ids, latitudes, longitudes)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def load(
+        self,
+        ids: np.ndarray,
+        latitudes: np.ndarray,
+        longitudes: np.ndarray,
+        version: Optional[str] = None
+    ) -> None:
+        ''' rebuilds the index from the ids and coordinates of the data version '''
+        ids = np.asarray(ids, np.int64)
+        latitudes = np.asarray(latitudes, np.float64)
+        longitudes = np.asarray(longitudes, np.float64)
+        rows, columns = grid_cells(latitudes, longitudes)
+        keys = rows * GRID_COLUMNS + columns
+        order = np.lexsort((ids, keys))
+
+        # swap all the arrays at once so readers never see a half built index
+        self._keys, self._ids, self._latitudes, self._longitudes = (
+            keys[order], ids[order], latitudes[order], longitudes[order]
+        )
+        self.loaded, self.version = True, version
+
+    def candidates(self, latitude: float, longitude: float, miles: float) -> np.ndarray:
+        ''' positions of the points in the grid cells overlapping the bounding box '''
+        (south_row, north_row), (west, east) = bounding_cells(latitude, longitude, miles)
+        rows = np.arange(south_row, north_row + 1) * GRID_COLUMNS
+        starts = np.searchsorted(self._keys, rows + west, side='left')
+        ends = np.searchsorted(self._keys, rows + east, side='right')
+        if not rows.size or not (ends > starts).any():
+            return np.empty(0, np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+    def within(
+        self, latitude: float, longitude: float, miles: float, limit: Optional[int] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        ''' ids and distances of the points within miles of the origin, nearest first
+
+            Points at the same distance are ordered by id.
+        '''
+        positions = self.candidates(latitude, longitude, miles)
+        distances = haversine_miles(
+            latitude, longitude, self._latitudes[positions], self._longitudes[positions]
+        )
+        inside = distances <= miles
+        positions, distances = positions[inside], distances[inside]
+
+        order = np.lexsort((self._ids[positions], distances))[:limit]
+        return self._ids[positions[order]], distances[order]
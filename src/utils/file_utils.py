@@ -1,7 +1,12 @@
 ''' Module for file operations '''
 from os import path
+from typing import Iterable, Iterator
 import json
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import feather
+import pyarrow.parquet as pq
 from ..dependencies import ROOT_PATH
 
 def load_json_data(file_path: str, root=True) -> dict:
@@ -30,3 +35,148 @@ def pd_save_json(df: pd.DataFrame, file_path: str, root=True):
     df.to_json(
         path_or_buf=file_path, orient='records', indent=2, force_ascii=False
     )
+
+
+# -------- Columnar files --------
+
+# low cardinality text columns stored as dictionaries, read back as categoricals
+DICTIONARY_COLUMNS = ['make', 'model', 'color', 'fuel_type', 'transmission', 'town', 'county']
+
+
+def root_path(file_path: str, root=True) -> str:
+    '''Prefix the path with the project root'''
+    return path.join(ROOT_PATH, file_path) if root else file_path
+
+
+def file_format(file_path: str) -> str:
+    '''The file format from the extension, json, ndjson, parquet or feather'''
+    extension = path.splitext(file_path)[1].lstrip('.')
+    return 'ndjson' if extension == 'jsonl' else extension
+
+
+def dictionary_encode(df: pd.DataFrame) -> pd.DataFrame:
+    '''Convert the DICTIONARY_COLUMNS to categoricals, stored as Arrow dictionaries'''
+    columns = {
+        column: df[column].astype('category') for column in DICTIONARY_COLUMNS
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype)
+    }
+    return df.assign(**columns) if columns else df
+
+
+def to_arrow(df: pd.DataFrame) -> pa.Table:
+    '''Convert a DataFrame to an Arrow table with dictionary encoded text columns
+
+    Dictionary indices are widened to int32 so chunks with different numbers of
+    categories share one schema.
+    '''
+    table = pa.Table.from_pandas(dictionary_encode(df), preserve_index=False)
+    schema = pa.schema([
+        field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        if pa.types.is_dictionary(field.type) else field
+        for field in table.schema
+    ], metadata=table.schema.metadata)
+    return table.cast(schema)
+
+
+def from_arrow(table: pa.Table) -> pd.DataFrame:
+    '''Convert an Arrow table to a DataFrame, releasing the Arrow buffers as it goes'''
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def pd_save_parquet(df: pd.DataFrame, file_path: str, root=True):
+    '''Save a pandas DataFrame to a Parquet file'''
+    pq.write_table(to_arrow(df), root_path(file_path, root))
+
+
+def pd_load_parquet(file_path: str, root=True, columns: list[str] = None) -> pd.DataFrame:
+    '''Load a Parquet file into a pandas DataFrame'''
+    return from_arrow(pq.read_table(root_path(file_path, root), columns=columns))
+
+
+def pd_save_feather(df: pd.DataFrame, file_path: str, root=True):
+    '''Save a pandas DataFrame to an uncompressed Feather file which can be memory mapped'''
+    feather.write_feather(to_arrow(df), root_path(file_path, root), compression='uncompressed')
+
+
+def pd_load_feather(file_path: str, root=True, columns: list[str] = None) -> pd.DataFrame:
+    '''Load a Feather file into a pandas DataFrame through a memory map'''
+    return from_arrow(
+        feather.read_table(root_path(file_path, root), columns=columns, memory_map=True)
+    )
+
+
+def pd_load_file(file_path: str, root=True) -> pd.DataFrame:
+    '''Load a JSON, NDJSON, Parquet or Feather file based on the file extension'''
+    loaders = {'json': pd_load_json, 'parquet': pd_load_parquet, 'feather': pd_load_feather}
+    if (loader := loaders.get(file_format(file_path))):
+        return loader(file_path, root)
+    return pd.concat(pd_load_ndjson_chunks(file_path, root=root), ignore_index=True)
+
+
+# -------- Chunked files for datasets larger than memory --------
+
+def pd_save_ndjson_chunks(chunks: Iterable[pd.DataFrame], file_path: str, root=True) -> int:
+    '''Write DataFrame chunks to a newline delimited JSON file, returns the rows written'''
+    rows = 0
+    with open(root_path(file_path, root), 'w', encoding='utf-8') as file:
+        for chunk in chunks:
+            chunk.to_json(file, orient='records', lines=True, force_ascii=False)
+            rows += len(chunk.index)
+    return rows
+
+
+def pd_save_columnar_chunks(chunks: Iterable[pd.DataFrame], file_path: str, root=True) -> int:
+    '''Write DataFrame chunks as batches of a Parquet or Feather file, returns the rows written'''
+    rows, writer, schema = 0, None, None
+    try:
+        for chunk in chunks:
+            table = to_arrow(chunk)
+            if writer is None:
+                file_path, schema = root_path(file_path, root), table.schema
+                writer = (
+                    pq.ParquetWriter(file_path, schema)
+                    if file_format(file_path) == 'parquet'
+                    else pa.ipc.new_file(file_path, schema)
+                )
+            writer.write_table(table.cast(schema))
+            rows += len(chunk.index)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def pd_save_chunks(chunks: Iterable[pd.DataFrame], file_path: str, root=True) -> int:
+    '''Write DataFrame chunks to Parquet, Feather or NDJSON based on the file extension'''
+    if file_format(file_path) in ('parquet', 'feather'):
+        return pd_save_columnar_chunks(chunks, file_path, root)
+    return pd_save_ndjson_chunks(chunks, file_path, root)
+
+
+def pd_load_ndjson_chunks(
+    file_path: str, chunksize: int = 100_000, root=True
+) -> Iterator[pd.DataFrame]:
+    '''Read a newline delimited JSON file as DataFrames of chunksize rows'''
+    with pd.read_json(
+        root_path(file_path, root), lines=True, chunksize=chunksize,
+        dtype_backend='pyarrow', encoding='utf-8'
+    ) as reader:
+        yield from reader
+
+
+def pd_load_columnar_chunks(
+    file_path: str, chunksize: int = 100_000, root=True, columns: list[str] = None
+) -> Iterator[pd.DataFrame]:
+    '''Read a Parquet or Feather file or directory as DataFrames of up to chunksize rows'''
+    file_path = root_path(file_path, root)
+    dataset_format = 'feather' if file_format(file_path) == 'feather' else 'parquet'
+    dataset = ds.dataset(file_path, format=dataset_format)
+    for batch in dataset.to_batches(columns=columns, batch_size=chunksize):
+        yield from_arrow(pa.Table.from_batches([batch]))
+
+
+def pd_load_chunks(file_path: str, chunksize: int = 100_000, root=True) -> Iterator[pd.DataFrame]:
+    '''Read Parquet, Feather or NDJSON in chunks based on the file extension'''
+    if file_format(file_path) in ('parquet', 'feather'):
+        return pd_load_columnar_chunks(file_path, chunksize, root)
+    return pd_load_ndjson_chunks(file_path, chunksize, root)
@@ -0,0 +1,287 @@
+''' response caching for the read-only routes
+
+    Rendered responses are kept in a bounded in-process LRU with a TTL, backed
+    by an optional SQLite file so several uvicorn workers share their entries,
+    point RESPONSE_CACHE_PATH at /dev/shm to keep it in shared memory.
+
+    Every entry is stamped with the data version, which the seeding and sync
+    scripts bump once the data has changed, so stale responses are never
+    served whatever their TTL. Responses carry an ETag and Cache-Control
+    header, requests with a matching If-None-Match get an empty 304.
+'''
+import sqlite3
+from asyncio import iscoroutinefunction
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from hashlib import sha1
+from os import environ as env, replace, stat
+from threading import Lock
+from time import time, time_ns
+from typing import Callable, Optional
+from urllib.parse import urlencode
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from ..dependencies import ROOT_PATH
+
+# Cache settings, override in the environment
+CACHE_SIZE = int(env.get('RESPONSE_CACHE_SIZE') or 1024)
+CACHE_TTL = int(env.get('RESPONSE_CACHE_TTL') or 300)
+CACHE_MAX_AGE = int(env.get('RESPONSE_CACHE_MAX_AGE') or 0)
+CACHE_PATH = env.get('RESPONSE_CACHE_PATH', '')
+DATA_VERSION_PATH = env.get('DATA_VERSION_PATH') or f'{ROOT_PATH}/.data_version'
+
+
+def new_version() -> str:
+    ''' a fresh version stamp, later stamps sort after earlier ones '''
+    return format(time_ns(), 'x')
+
+
+class DataVersion:
+    ''' version stamp of the data kept in a file shared by every process
+
+        The file is only re-read when its modification time changes.
+    '''
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._mtime = None
+        self._version = '0'
+        self._lock = Lock()
+
+    def current(self) -> str:
+        ''' returns the version written by the last bump, '0' before the first '''
+        try:
+            mtime = stat(self.file_path).st_mtime_ns
+        except FileNotFoundError:
+            return '0'
+
+        with self._lock:
+            if mtime != self._mtime:
+                with open(self.file_path, encoding='utf-8') as file:
+                    self._version = file.read().strip() or '0'
+                self._mtime = mtime
+            return self._version
+
+    def bump(self, version: Optional[str] = None) -> str:
+        ''' writes a new or the given version, invalidating every cached response '''
+        version = version or new_version()
+        temp_path = f'{self.file_path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(version)
+        replace(temp_path, self.file_path)
+        return version
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    ''' a rendered response with the data version it was rendered from '''
+    version: str
+    expires: float
+    etag: str
+    status_code: int
+    media_type: Optional[str]
+    body: bytes
+
+
+class DiskCache:
+    ''' responses stored in a SQLite file, shared by every worker opening it '''
+
+    def __init__(self, file_path: str, maxsize: int):
+        self.maxsize = maxsize
+        self._conn = sqlite3.connect(file_path, timeout=5, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, version TEXT, expires REAL, etag TEXT, '
+                'status_code INTEGER, media_type TEXT, body BLOB)'
+            )
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        ''' returns the stored response or None '''
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT version, expires, etag, status_code, media_type, body '
+                'FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+        return CachedResponse(*row) if row else None
+
+    def set(self, key: str, entry: CachedResponse) -> None:
+        ''' stores the response, removing expired, outdated and the oldest entries '''
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, entry.version, entry.expires, entry.etag,
+                 entry.status_code, entry.media_type, entry.body)
+            )
+            self._conn.execute(
+                'DELETE FROM responses WHERE expires < ? OR version != ?',
+                (time(), entry.version)
+            )
+            self._conn.execute(
+                'DELETE FROM responses WHERE key NOT IN '
+                '(SELECT key FROM responses ORDER BY expires DESC LIMIT ?)', (self.maxsize,)
+            )
+
+    def clear(self) -> None:
+        ''' removes every stored response '''
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM responses')
+
+
+def cache_key(request: Request) -> str:
+    ''' path with the non-empty query parameters trimmed and sorted '''
+    params = sorted(
+        (name, value.strip()) for name, value in request.query_params.multi_items()
+        if value.strip()
+    )
+    return f'{request.url.path}?{urlencode(params)}'
+
+
+def entity_tag(version: str, body: bytes) -> str:
+    ''' strong ETag from the data version and the body '''
+    return f'"{version}-{sha1(body).hexdigest()[:16]}"'
+
+
+class ResponseCache:  # pylint: disable=too-many-instance-attributes
+    ''' bounded LRU of rendered responses with a TTL, optionally backed by a DiskCache '''
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def __init__(
+        self,
+        version: DataVersion,
+        maxsize: int = CACHE_SIZE,
+        ttl: float = CACHE_TTL,
+        max_age: int = CACHE_MAX_AGE,
+        disk: Optional[DiskCache] = None,
+        clock: Callable[[], float] = time
+    ):
+        self.data_version = version
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_age = max_age
+        self.disk = disk
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        ''' returns a fresh entry of the current data version or None '''
+        version, now = self.data_version.current(), self.clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.version == version and entry.expires > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self._entries.pop(key, None)
+
+        if self.disk and (entry := self.disk.get(key)):
+            if entry.version == version and entry.expires > now:
+                self._store(key, entry)
+                with self._lock:
+                    self.hits += 1
+                return entry
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, response: Response) -> CachedResponse:
+        ''' caches the rendered response under the current data version '''
+        version = self.data_version.current()
+        entry = CachedResponse(
+            version=version,
+            expires=self.clock() + self.ttl,
+            etag=entity_tag(version, response.body),
+            status_code=response.status_code,
+            media_type=response.media_type,
+            body=response.body
+        )
+        self._store(key, entry)
+        if self.disk:
+            self.disk.set(key, entry)
+        return entry
+
+    def _store(self, key: str, entry: CachedResponse) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        ''' removes every entry from memory and disk '''
+        with self._lock:
+            self._entries.clear()
+        if self.disk:
+            self.disk.clear()
+
+    def stats(self) -> dict:
+        ''' returns the hit and miss counts with the number of entries held '''
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+    def respond(self, request: Request, entry: CachedResponse) -> Response:
+        ''' the cached response, or an empty 304 if the client already holds it '''
+        headers = {
+            'ETag': entry.etag,
+            'Cache-Control': f'public, max-age={self.max_age}, must-revalidate'
+        }
+        if entry.etag in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+        return Response(
+            entry.body, status_code=entry.status_code, media_type=entry.media_type, headers=headers
+        )
+
+    def store(self, key: str, response) -> tuple[Response, Optional[CachedResponse]]:
+        ''' renders dicts and lists as json and caches the response if it is a 200 '''
+        if not isinstance(response, Response):
+            response = JSONResponse(jsonable_encoder(response))
+        if response.status_code != 200:
+            return response, None
+        return response, self.set(key, response)
+
+    def cached(self, handler: Callable) -> Callable:
+        ''' decorates a sync or async route handler taking a `request: Request` argument
+
+            Dicts and lists returned by the handler are rendered as json, only
+            200 responses are cached, exceptions pass through uncached.
+        '''
+        if iscoroutinefunction(handler):
+            @wraps(handler)
+            async def async_wrapper(*args, **kwargs):
+                request = kwargs['request']
+                key = cache_key(request)
+                if not (entry := self.get(key)):
+                    response, entry = self.store(key, await handler(*args, **kwargs))
+                    if entry is None:
+                        return response
+                return self.respond(request, entry)
+
+            return async_wrapper
+
+        @wraps(handler)
+        def wrapper(*args, **kwargs):
+            request = kwargs['request']
+            key = cache_key(request)
+            if not (entry := self.get(key)):
+                response, entry = self.store(key, handler(*args, **kwargs))
+                if entry is None:
+                    return response
+            return self.respond(request, entry)
+
+        return wrapper
+
+
+data_version = DataVersion(DATA_VERSION_PATH)
+
+response_cache = ResponseCache(
+    data_version, disk=DiskCache(CACHE_PATH, CACHE_SIZE) if CACHE_PATH else None
+)
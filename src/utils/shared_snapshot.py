@@ -0,0 +1,74 @@
+''' versioned Arrow IPC files shared by the app workers through memory maps
+
+    Every version is a directory of uncompressed Arrow IPC files, one per table,
+    written under a temporary name and renamed into place so readers never see
+    a partial version. Readers memory map the files read-only, the Arrow buffers
+    point straight into the page cache, so however many workers map a version
+    its pages are held in memory once. Point SNAPSHOT_PATH at /dev/shm to keep
+    the files off disk.
+'''
+import shutil
+from os import environ as env, listdir, makedirs, path, rename
+from typing import Optional
+import pyarrow as pa
+from ..dependencies import ROOT_PATH
+
+SNAPSHOT_PATH = env.get('SNAPSHOT_PATH') or f'{ROOT_PATH}/.snapshots'
+
+# versions kept on disk, the previous one may still be mapped by a worker
+KEEP_VERSIONS = 2
+
+TEMP_SUFFIX = '.tmp'
+
+
+class SharedSnapshot:
+    ''' directory of snapshot versions, each holding named Arrow tables '''
+
+    def __init__(self, directory: str, keep: int = KEEP_VERSIONS):
+        self.directory = directory
+        self.keep = keep
+
+    def file_path(self, version: str, name: str) -> str:
+        ''' path of the table file in a version '''
+        return f'{self.directory}/{version}/{name}.arrow'
+
+    def versions(self) -> list[str]:
+        ''' the complete versions on disk, oldest first '''
+        if not path.isdir(self.directory):
+            return []
+        return sorted(
+            (entry for entry in listdir(self.directory) if not entry.endswith(TEMP_SUFFIX)),
+            key=lambda entry: (path.getmtime(f'{self.directory}/{entry}'), entry)
+        )
+
+    def write(self, version: str, tables: dict[str, pa.Table]) -> str:
+        ''' writes the tables as a new version and removes the older versions '''
+        temp_directory = f'{self.directory}/{version}{TEMP_SUFFIX}'
+        makedirs(temp_directory)
+
+        # one record batch per table so every column maps as a single buffer
+        for name, table in tables.items():
+            table = table.combine_chunks()
+            with pa.OSFile(f'{temp_directory}/{name}.arrow', 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+        rename(temp_directory, f'{self.directory}/{version}')
+        self.prune()
+        return version
+
+    def read(self, version: str, name: str) -> Optional[pa.Table]:
+        ''' maps the table of the version read-only, None if it was not written '''
+        try:
+            with pa.memory_map(self.file_path(version, name), 'r') as source:
+                return pa.ipc.open_file(source).read_all()
+        except FileNotFoundError:
+            return None
+
+    def prune(self) -> None:
+        ''' removes all but the newest versions, mapped files stay readable until unmapped '''
+        for version in self.versions()[:-self.keep]:
+            shutil.rmtree(f'{self.directory}/{version}', ignore_errors=True)
+
+
+shared_snapshot = SharedSnapshot(SNAPSHOT_PATH)
@@ -0,0 +1,67 @@
+from os import environ as env
+from pytest import fixture, skip
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool, StaticPool
+from src.controllers import motors_router
+from src.db.table_classes import Base, CarsForSale
+from src.db.bulk_load import load_dataframe, create_tables_deferred, create_deferred_constraints
+from src.db.listings import refresh_car_listings
+from src.db.seed_db import create_dimension_tables, create_cars_for_sale, normalize
+from src.utils.file_utils import pd_load_json, load_json_data
+
+def seed_database(engine):
+    ''' creates and loads every table from the json data '''
+    tables = create_dimension_tables(
+        pd_load_json('data/json/cars.json'), pd_load_json('data/json/customers.json')
+    )
+    tables[CarsForSale] = create_cars_for_sale(
+        normalize(load_json_data('data/json/cars_for_sale.json')), tables=tables
+    )
+
+    Base.metadata.drop_all(engine)
+    with engine.begin() as conn:
+        create_tables_deferred(conn, Base.metadata)
+        for table, df in tables.items():
+            load_dataframe(conn, table.__table__, df)
+        create_deferred_constraints(conn, Base.metadata)
+        refresh_car_listings(conn)
+
+    return engine
+
+@fixture(scope='session')
+def seeded_engine():
+    ''' in-memory SQLite database seeded from the json data '''
+    return seed_database(create_engine(
+        'sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool
+    ))
+
+@fixture(scope='session')
+def pg_engine():
+    ''' PostgreSQL database from TEST_DATABASE_URL seeded from the json data '''
+    if not (url := env.get('TEST_DATABASE_URL')):
+        skip('TEST_DATABASE_URL is not set')
+    return seed_database(create_engine(url))
+
+@fixture(scope='session')
+def seeded_db_file(tmp_path_factory):
+    ''' SQLite file seeded from the json data, readable by the sync and async engines '''
+    file_path = tmp_path_factory.mktemp('db') / 'motors.db'
+    seed_database(create_engine(f'sqlite:///{file_path}')).dispose()
+    return file_path
+
+@fixture
+def async_engine(seeded_db_file):
+    ''' async engine on the seeded SQLite file, unpooled as each test runs its own event loop '''
+    return create_async_engine(f'sqlite+aiosqlite:///{seeded_db_file}', poolclass=NullPool)
+
+@fixture
+def client(async_engine):
+    ''' test client for the motors routes using the async engine '''
+    app = FastAPI()
+    app.include_router(motors_router)
+    app.state.async_engine = async_engine
+    with TestClient(app) as test_client:
+        yield test_client
@@ -0,0 +1,36 @@
+from pytest import mark, fixture
+import pandas as pd
+from sqlalchemy import create_engine, select
+from src.db import bulk_load
+from src.db.table_classes import Base, Makes
+
+@fixture
+def engine():
+    return create_engine('sqlite://')
+
+@mark.describe('Test the bulk dataframe loader')
+class TestBulkLoad():
+
+    @mark.it('loads every row in chunks keeping the indexed primary keys')
+    def test_load_dataframe(self, engine, monkeypatch):
+        monkeypatch.setattr(bulk_load, 'CHUNK_SIZE', 2)
+        makes = pd.DataFrame(
+            {'make_name': ['Audi', 'BMW', 'Ford', 'Tesla', 'Toyota']},
+            index=pd.Index([3, 4, 5, 6, 7], name='make_id')
+        )
+
+        with engine.begin() as conn:
+            bulk_load.create_tables_deferred(conn, Base.metadata)
+            assert bulk_load.load_dataframe(conn, Makes.__table__, makes) == 5
+            bulk_load.create_deferred_constraints(conn, Base.metadata)
+
+            rows = conn.execute(select(Makes.make_id, Makes.make_name)).all()
+
+        assert rows == list(makes['make_name'].items())
+
+    @mark.it('writes missing values as the NULL marker so empty strings stay empty for COPY')
+    def test_csv_buffer(self):
+        df = pd.DataFrame({'description': ['', None, 'Lorem'], 'price': [1.5, None, 2.0]})
+        rows = bulk_load.csv_buffer(df).read().splitlines()
+
+        assert rows == [',1.5', '\\N,\\N', 'Lorem,2.0']
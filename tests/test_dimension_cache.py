@@ -0,0 +1,46 @@
+from pytest import mark, fixture
+from src.models.dimension_cache import DimensionCache
+
+@fixture(scope='class')
+def dimension_cache():
+    cache = DimensionCache()
+    cache.load(
+        makes=[(1, 'Ford'), (2, 'Audi')],
+        models=[(1, 'Focus', 1), (2, 'Fiesta', 1), (3, 'A3', 2), (4, 'Ka', 1)],
+        colours=[(1, 'red'), (2, 'blue'), (3, 'black'), (4, 'green')],
+        model_colours=[(1, 1), (1, 2), (2, 2), (3, 3), (3, 1)],
+    )
+    return cache
+
+@mark.describe('Test the make, model and colour cache')
+class TestDimensionCache():
+
+    @mark.it('returns every make in order')
+    def test_makes(self, dimension_cache):
+        assert dimension_cache.makes() == ['Audi', 'Ford']
+
+    @mark.it('returns the models of the make, none without a make')
+    def test_models(self, dimension_cache):
+        assert dimension_cache.models('Ford') == ['Fiesta', 'Focus', 'Ka']
+        assert dimension_cache.models('Audi') == ['A3']
+        assert dimension_cache.models('') == []
+        assert dimension_cache.models('Tesla') == []
+
+    @mark.it('returns the colours of the model, the make or every colour')
+    def test_colours(self, dimension_cache):
+        assert dimension_cache.colours('Ford', 'Focus') == ['blue', 'red']
+        assert dimension_cache.colours('Ford', 'Ka') == []
+        assert dimension_cache.colours('Ford') == ['blue', 'red']
+        assert dimension_cache.colours('Audi', 'Focus') == []
+        assert dimension_cache.colours() == ['black', 'blue', 'green', 'red']
+
+    @mark.it('replaces the previous entries when reloaded')
+    def test_reload(self):
+        cache = DimensionCache()
+        cache.load([(1, 'Ford')], [(1, 'Focus', 1)], [(1, 'red')], [(1, 1)])
+        cache.load([(1, 'Audi')], [(1, 'A3', 1)], [(1, 'black')], [(1, 1)], version='v2')
+
+        assert cache.makes() == ['Audi']
+        assert cache.models('Ford') == []
+        assert cache.colours('Audi', 'A3') == ['black']
+        assert cache.version == 'v2'
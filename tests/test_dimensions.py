@@ -0,0 +1,50 @@
+from pytest import mark, fixture, raises
+import pandas as pd
+from src.data.car_gen import generate_cars_frame
+from src.db.dimensions import key_lookup, resolve_keys
+from src.db.seed_db import create_dimension_tables, create_cars_for_sale
+from src.db.table_classes import Makes, Models, Colours, Counties, Customers
+from src.utils.file_utils import pd_load_json
+
+@fixture(scope='module')
+def tables():
+    return create_dimension_tables(
+        pd_load_json('data/json/cars.json'), pd_load_json('data/json/customers.json')
+    )
+
+@mark.describe('Test the dimension key resolution')
+class TestDimensions():
+
+    @mark.it('resolves every car to the model and colour it came from')
+    def test_cars_aligned(self, tables):
+        # shuffled and re-indexed so a positional merge would misalign the ids
+        source = generate_cars_frame(5_000, 100, seed=3).sample(frac=1, random_state=0)
+        cars = create_cars_for_sale(source, tables=tables)
+
+        models = tables[Models].join(tables[Makes], on='make_id')
+        resolved = models.loc[cars['model_id'], ['make_name', 'model_name']]
+        assert (resolved['make_name'].to_numpy() == source['make'].astype(str).to_numpy()).all()
+        assert (resolved['model_name'].to_numpy() == source['model'].astype(str).to_numpy()).all()
+        colours = tables[Colours].loc[cars['colour_id'], 'colour_name'].to_numpy()
+        assert (colours == source['color'].astype(str).to_numpy()).all()
+
+    @mark.it('keeps the customers in source order with their county')
+    def test_customers_aligned(self, tables):
+        customers = pd_load_json('data/json/customers.json')
+        counties = tables[Customers]['county_id'].map(tables[Counties]['county_name'])
+        assert counties.tolist() == customers['county'].tolist()
+
+    @mark.it('resolves composite keys and raises for unknown keys')
+    def test_resolve_keys(self):
+        dimension = pd.DataFrame(
+            {'make_name': ['Ford', 'Kia', 'Ford'], 'model_name': ['Ka', 'Rio', 'Focus']},
+            index=pd.Index([1, 2, 3], name='model_id')
+        )
+        lookup = key_lookup(dimension, ['make_name', 'model_name'])
+        keys = pd.DataFrame(
+            {'make_name': ['Ford', 'Ford', 'Kia'], 'model_name': ['Focus', 'Ka', 'Rio']}
+        )
+
+        assert resolve_keys(keys, lookup).tolist() == [3, 1, 2]
+        with raises(ValueError, match='Unknown model_id'):
+            resolve_keys(pd.DataFrame({'make_name': ['Kia'], 'model_name': ['Ka']}), lookup)
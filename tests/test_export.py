@@ -0,0 +1,63 @@
+from pytest import mark
+import asyncio
+import csv
+import io
+import json
+import pyarrow.parquet as pq
+from src.models.model_export import ExportFilters, export_statement, stream_export
+from src.models.model_search import SearchFilters, search_cars
+
+def export(engine, batch_size=50, **filters) -> list[bytes]:
+    filters = ExportFilters(**filters)
+
+    async def collect():
+        stream = stream_export(engine, export_statement(filters), filters.format, batch_size)
+        return [chunk async for chunk in stream]
+
+    return asyncio.run(collect())
+
+@mark.describe('Test the streaming export')
+class TestExport():
+
+    @mark.it('streams every car as csv one batch at a time')
+    def test_csv(self, async_engine):
+        chunks = export(async_engine, format='csv')
+        rows = list(csv.DictReader(io.StringIO(b''.join(chunks).decode())))
+
+        assert len(chunks) == 10
+        assert len(rows) == 500
+        assert [int(row['car_id']) for row in rows] == list(range(1, 501))
+
+    @mark.it('applies the search filters and sort order')
+    def test_ndjson_filters(self, seeded_engine, async_engine):
+        with seeded_engine.connect() as conn:
+            search = search_cars(conn, SearchFilters(fuel_type='petrol', sort='-price', limit=100))
+        chunks = export(async_engine, format='ndjson', fuel_type='petrol', sort='-price')
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+
+        assert len(rows) == search['total']
+        assert rows[:100] == search['results']
+
+    @mark.it('writes a parquet file with a row group per batch')
+    def test_parquet(self, async_engine):
+        chunks = export(async_engine, format='parquet', limit=120)
+        parquet_file = pq.ParquetFile(io.BytesIO(b''.join(chunks)))
+
+        assert parquet_file.metadata.num_rows == 120
+        assert parquet_file.metadata.num_row_groups == 3
+        assert parquet_file.read().column('car_id').to_pylist() == list(range(1, 121))
+
+    @mark.it('sends the export as an attachment')
+    def test_endpoint(self, client):
+        response = client.get('/api/cars/export', params={'format': 'ndjson', 'make': 'Ford'})
+
+        assert response.status_code == 200
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        assert 'cars_for_sale.ndjson' in response.headers['content-disposition']
+        assert {json.loads(line)['make'] for line in response.text.splitlines()} == {'Ford'}
+
+    @mark.it('rejects an invalid cursor before streaming')
+    def test_invalid_cursor(self, client):
+        response = client.get('/api/cars/export', params={'cursor': 'not a cursor'})
+
+        assert response.status_code == 400
@@ -0,0 +1,39 @@
+from pytest import mark
+import pandas as pd
+from src.data.car_gen import generate_cars_chunks
+from src.data.customers_gen import generate_customers_chunks
+from src.utils.file_utils import pd_save_chunks, pd_load_chunks
+
+@mark.describe('Test chunked file reading and writing')
+class TestChunkedFiles():
+
+    @mark.it('round trips generated chunks through NDJSON, Parquet and Feather in bounded chunks')
+    @mark.parametrize('extension', ['ndjson', 'parquet', 'feather'])
+    def test_round_trip(self, tmp_path, extension):
+        file_path = str(tmp_path / f'cars_for_sale.{extension}')
+        chunks = list(generate_cars_chunks(2_500, 100, chunk_size=1_000, seed=7))
+
+        assert pd_save_chunks(iter(chunks), file_path, root=False) == 2_500
+
+        loaded = list(pd_load_chunks(file_path, chunksize=600, root=False))
+        assert max(len(chunk.index) for chunk in loaded) <= 1_000
+
+        expected = pd.concat(chunks, ignore_index=True)
+        actual = pd.concat(loaded, ignore_index=True)
+        assert list(actual.columns) == list(expected.columns)
+        assert actual['price'].astype('int64').tolist() == expected['price'].tolist()
+        assert actual['model'].astype(str).tolist() == expected['model'].astype(str).tolist()
+
+    @mark.it('round trips several chunks of customers, each chunk holding different towns')
+    @mark.parametrize('extension', ['parquet', 'feather'])
+    def test_customers_round_trip(self, tmp_path, extension):
+        file_path = str(tmp_path / f'customers.{extension}')
+        chunks = list(generate_customers_chunks(5_000, 1_000, seed=1))
+
+        assert pd_save_chunks(iter(chunks), file_path, root=False) == 5_000
+
+        expected = pd.concat(chunks, ignore_index=True)
+        actual = pd.concat(pd_load_chunks(file_path, chunksize=1_500, root=False), ignore_index=True)
+        assert actual['customer_id'].tolist() == expected['customer_id'].tolist()
+        for column in ['town', 'county']:
+            assert actual[column].astype(str).tolist() == expected[column].astype(str).tolist()
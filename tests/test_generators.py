@@ -0,0 +1,49 @@
+from pytest import mark, fixture
+import pandas as pd
+from src.data.car_gen import generate_cars_frame, calculate_price, OLDEST, NEWEST
+from src.data.customers_gen import generate_customers_frame
+from src.utils.file_utils import load_json_data
+
+@fixture(scope='module')
+def cars_frame():
+    return generate_cars_frame(5_000, 100, seed=42)
+
+@mark.describe('Test the batched data generators')
+class TestGenerators():
+
+    @mark.it('generates the same data for the same seed')
+    def test_reproducible(self, cars_frame):
+        pd.testing.assert_frame_equal(cars_frame, generate_cars_frame(5_000, 100, seed=42))
+        pd.testing.assert_frame_equal(
+            generate_customers_frame(50, seed=1), generate_customers_frame(50, seed=1)
+        )
+
+    @mark.it('only offers fuel types, transmissions and colours available for the car')
+    def test_car_options(self, cars_frame):
+        cars = {car['model']: car for car in load_json_data('data/json/cars.json')}
+
+        for row in cars_frame.sample(500, random_state=0).itertuples():
+            car = cars[row.model]
+            assert row.make == car['make']
+            assert row.fuel_type in car['fuel_types']
+            assert row.transmission in car['transmissions']
+            assert row.color in car['colours']
+
+    @mark.it('calculates prices the same way as the single car generator')
+    def test_prices(self, cars_frame):
+        cars = {car['model']: car for car in load_json_data('data/json/cars.json')}
+
+        assert cars_frame['year'].between(OLDEST, NEWEST).all()
+        assert cars_frame['customer_id'].between(1, 100).all()
+        for row in cars_frame.head(200).itertuples():
+            retail_price = cars[row.model]['retail_price']
+            assert row.price == calculate_price(row.year, retail_price, row.mileage)
+
+    @mark.it('generates customers with locations from the locations data')
+    def test_customers(self):
+        customers = generate_customers_frame(200, seed=3)
+        locations = load_json_data('data/json/locations.json')
+        locations = {(location['town'], location['county']) for location in locations}
+
+        assert list(customers['customer_id']) == list(range(1, 201))
+        assert set(zip(customers['town'], customers['county'])) <= locations
@@ -0,0 +1,103 @@
+import asyncio
+import pyarrow as pa
+from pytest import mark, fixture, raises
+from src.models import model_inventory
+from src.models.model_inventory import InventorySnapshot, fetch_inventory, search_cars_async
+from src.models.model_search import SearchFilters, search_cars
+from src.utils.response_cache import DataVersion
+
+FILTERS = [
+    SearchFilters(),
+    SearchFilters(make='Ford', sort='-price'),
+    SearchFilters(fuel_type='petrol', transmission_type='manual', sort='year'),
+    SearchFilters(min_price=3_000, max_price=20_000, max_year=2018, sort='-mileage'),
+    SearchFilters(mileage_band='over 100,000', location='Somerset'),
+    SearchFilters(colour='red', min_year=2015),
+    SearchFilters(make='No Such Make'),
+]
+
+@fixture
+def conn(seeded_engine):
+    with seeded_engine.connect() as conn:
+        yield conn
+
+@fixture
+def snapshot(conn):
+    return InventorySnapshot(fetch_inventory(conn), version='1')
+
+@mark.describe('Test the in-memory inventory snapshot')
+class TestInventorySnapshot():
+
+    @mark.it('dictionary encodes the text columns of the listings')
+    def test_fetch_inventory(self, conn):
+        table = fetch_inventory(conn)
+
+        assert table.num_rows == 500
+        assert pa.types.is_dictionary(table.schema.field('make').type)
+        assert pa.types.is_float64(table.schema.field('price').type)
+
+    @mark.it('returns the same results, facets and cursors as the SQL search')
+    def test_matches_sql(self, conn, snapshot):
+        for filters in FILTERS:
+            assert snapshot.search(filters) == search_cars(conn, filters)
+
+    @mark.it('pages with the cursors of either engine')
+    def test_keyset_pagination(self, conn, snapshot):
+        filters = SearchFilters(fuel_type='diesel', sort='-price', limit=15)
+        page = search_cars(conn, filters)
+
+        while page['next_cursor']:
+            filters = filters.model_copy(update={'cursor': page['next_cursor']})
+            page = snapshot.search(filters)
+            assert page == search_cars(conn, filters)
+
+    @mark.it('does not answer keyword searches')
+    def test_supports(self):
+        assert InventorySnapshot.supports(SearchFilters(make='Ford'))
+        assert not InventorySnapshot.supports(SearchFilters(keyword='tempora'))
+
+    @mark.it('raises if searched before it is loaded')
+    def test_not_loaded(self):
+        with raises(RuntimeError):
+            InventorySnapshot().search(SearchFilters())
+
+    @mark.it('is reloaded through the async engine when the data version changes')
+    def test_reload(self, async_engine, monkeypatch, tmp_path):
+        version = DataVersion(str(tmp_path / 'version'))
+        snapshot = InventorySnapshot()
+        monkeypatch.setattr(model_inventory, 'SEARCH_ENGINE', 'memory')
+        monkeypatch.setattr(model_inventory, 'data_version', version)
+        monkeypatch.setattr(model_inventory, 'inventory_snapshot', snapshot)
+
+        search = asyncio.run(search_cars_async(async_engine, SearchFilters()))
+        assert search['total'] == len(snapshot) == 500
+        assert snapshot.version == '0'
+
+        current = version.bump()
+        asyncio.run(search_cars_async(async_engine, SearchFilters(keyword='tempora')))
+        assert snapshot.version == '0'
+
+        asyncio.run(search_cars_async(async_engine, SearchFilters(make='Ford')))
+        assert snapshot.version == current
+
+    @mark.it('is reloaded once by concurrent searches after the data version changes')
+    def test_reload_once(self, async_engine, monkeypatch, tmp_path):
+        version = DataVersion(str(tmp_path / 'version'))
+        refresh, reloads = model_inventory.refresh_inventory_snapshot_async, []
+        async def counted_refresh(engine):
+            reloads.append(version.current())
+            return await refresh(engine)
+        monkeypatch.setattr(model_inventory, 'SEARCH_ENGINE', 'memory')
+        monkeypatch.setattr(model_inventory, 'data_version', version)
+        monkeypatch.setattr(model_inventory, 'inventory_snapshot', InventorySnapshot())
+        monkeypatch.setattr(model_inventory, 'inventory_lock', asyncio.Lock())
+        monkeypatch.setattr(model_inventory, 'refresh_inventory_snapshot_async', counted_refresh)
+
+        async def search_together():
+            return await asyncio.gather(*[
+                search_cars_async(async_engine, SearchFilters()) for _ in range(5)
+            ])
+        searches = asyncio.run(search_together())
+
+        assert reloads == ['0']
+        assert all(search['total'] == 500 for search in searches)
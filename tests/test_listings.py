@@ -0,0 +1,38 @@
+from pytest import mark, fixture
+from sqlalchemy import create_engine, select, func, inspect, update
+from sqlalchemy.pool import StaticPool
+from src.db.listings import listings_select, refresh_car_listings
+from src.db.table_classes import Base, CarsForSale, CarListings
+from tests.conftest import seed_database
+
+@fixture
+def engine():
+    return seed_database(create_engine('sqlite://', poolclass=StaticPool))
+
+@mark.describe('Test the denormalised car listings')
+class TestListings():
+
+    @mark.it('holds one row per car matching the join')
+    def test_listings(self, engine):
+        with engine.connect() as conn:
+            listings = conn.execute(select(CarListings).order_by(CarListings.car_id)).all()
+            joined = conn.execute(listings_select.order_by(CarsForSale.car_id)).all()
+
+        assert len(listings) == 500
+        assert [tuple(row) for row in listings] == [tuple(row) for row in joined]
+
+    @mark.it('picks up changes to the tables on refresh')
+    def test_refresh(self, engine):
+        with engine.begin() as conn:
+            conn.execute(update(CarsForSale).where(CarsForSale.car_id == 1).values(price=1))
+            refresh_car_listings(conn)
+
+        with engine.connect() as conn:
+            assert conn.scalar(select(CarListings.price).where(CarListings.car_id == 1)) == 1
+            assert conn.scalar(select(func.count()).select_from(CarListings)) == 500
+
+    @mark.it('is dropped with the tables')
+    def test_drop(self, engine):
+        Base.metadata.drop_all(engine)
+
+        assert not inspect(engine).has_table(CarListings.__tablename__)
@@ -0,0 +1,46 @@
+from pytest import mark, fixture
+from src.models.location_index import LocationIndex
+
+@fixture(scope='class')
+def location_index():
+    return LocationIndex([
+        ('Aberdeen', 'Aberdeenshire', 5),
+        ('Banff', 'Aberdeenshire', 1),
+        ('Aberdare', 'Mid Glamorgan', 2),
+        ('abergele', 'Clwyd', 1),
+        ('London', 'Greater London', 9),
+    ])
+
+@mark.describe('Test the in-memory locations index')
+class TestLocationIndex():
+
+    @mark.it('returns towns and counties starting with the search term, most popular first')
+    def test_prefix_search(self, location_index):
+        assert location_index.search('aber') == [
+            'Aberdeenshire',
+            'Aberdeen, Aberdeenshire',
+            'Aberdare, Mid Glamorgan',
+            'abergele, Clwyd'
+        ]
+
+    @mark.it('ignores case and surrounding whitespace in the search term')
+    def test_case_insensitive(self, location_index):
+        assert location_index.search('  LON') == ['London, Greater London']
+
+    @mark.it('limits the number of results')
+    def test_limit(self, location_index):
+        assert location_index.search('a', limit=2) == ['Aberdeenshire', 'Aberdeen, Aberdeenshire']
+        assert location_index.search('a', limit=0) == []
+
+    @mark.it('returns an empty list when nothing matches')
+    def test_no_match(self, location_index):
+        assert location_index.search('zz') == []
+        assert location_index.search('') == []
+
+    @mark.it('replaces the previous entries when reloaded')
+    def test_reload(self):
+        index = LocationIndex([('Leeds', 'West Yorkshire', 1)])
+        index.load([('Bath', 'Somerset', 1)])
+
+        assert index.search('leeds') == []
+        assert index.search('bath') == ['Bath, Somerset']
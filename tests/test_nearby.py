@@ -0,0 +1,65 @@
+import asyncio
+from pytest import mark, raises
+from src.models import model_nearby
+from src.models.model_nearby import (
+    NearbyFilters, locate_town, nearby_listings, nearby_listings_async
+)
+from src.models.spatial_index import SpatialIndex
+from src.utils.file_utils import load_json_data
+from src.utils.response_cache import DataVersion
+
+@mark.describe('Test the radius search')
+class TestNearby():
+
+    @mark.it('locates every town of the locations dataset')
+    def test_locations_have_coordinates(self):
+        for location in load_json_data('data/json/locations.json'):
+            latitude, longitude = locate_town(f'{location["town"]}, {location["county"]}')
+
+            # the Channel Islands are the furthest south
+            assert 49.1 < latitude < 60.9 and -8.7 < longitude < 1.8
+
+    @mark.it('needs the county of a town name found in more than one county')
+    def test_locate_town(self):
+        assert locate_town('aberdeen') == locate_town('Aberdeen, Aberdeenshire')
+        with raises(ValueError, match='more than one county'):
+            locate_town('Newport')
+        with raises(ValueError, match='Unknown town'):
+            locate_town('Atlantis')
+
+    @mark.it('returns the cars within the radius, nearest first')
+    def test_nearby_listings(self, seeded_engine, monkeypatch):
+        monkeypatch.setattr(model_nearby, 'customer_index', SpatialIndex())
+        monkeypatch.setattr(model_nearby, 'CUSTOMER_BATCH', 3)
+        filters = NearbyFilters(location='Bath, Avon', miles=30, limit=100)
+        with seeded_engine.connect() as conn:
+            results = nearby_listings(conn, filters)['results']
+            everything = nearby_listings(conn, filters.model_copy(update={'miles': 200}))
+
+        distances = [(car['distance_miles'], car['car_id']) for car in results]
+        assert results and distances == sorted(distances)
+        assert all(car['distance_miles'] <= 30 for car in results)
+        assert len(everything['results']) == 100
+        assert everything['results'][:len(results)] == results
+
+    @mark.it('reloads the index once for concurrent searches after the data version changes')
+    def test_reload_once(self, async_engine, monkeypatch, tmp_path):
+        version = DataVersion(str(tmp_path / 'version'))
+        refresh, reloads = model_nearby.refresh_customer_index_async, []
+        async def counted_refresh(engine):
+            reloads.append(version.current())
+            return await refresh(engine)
+        monkeypatch.setattr(model_nearby, 'data_version', version)
+        monkeypatch.setattr(model_nearby, 'customer_index', SpatialIndex())
+        monkeypatch.setattr(model_nearby, 'customer_lock', asyncio.Lock())
+        monkeypatch.setattr(model_nearby, 'refresh_customer_index_async', counted_refresh)
+
+        async def search_together():
+            filters = NearbyFilters(location='Bath, Avon', miles=30)
+            return await asyncio.gather(*[
+                nearby_listings_async(async_engine, filters) for _ in range(5)
+            ])
+        searches = asyncio.run(search_together())
+
+        assert reloads == ['0']
+        assert all(search == searches[0] for search in searches)
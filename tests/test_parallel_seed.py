@@ -0,0 +1,56 @@
+from pytest import mark, fixture
+import pandas as pd
+from sqlalchemy import create_engine
+from src.db import parallel_seed
+from src.db.parallel_seed import SeedSettings, dependency_levels, seed_tables
+from src.db.seed_db import create_dimension_tables, create_cars_for_sale, normalize
+from src.db.table_classes import Base, CarsForSale
+from src.utils.file_utils import pd_load_json, load_json_data
+from src.db import snapshot
+from src.utils.response_cache import DataVersion
+from src.utils.shared_snapshot import SharedSnapshot
+
+@fixture
+def engine(monkeypatch, tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "seed.db"}')
+    monkeypatch.setattr(parallel_seed, 'get_engine', lambda: engine)
+    monkeypatch.setattr(parallel_seed, 'refresh_location_index', lambda: True)
+    monkeypatch.setattr(snapshot, 'data_version', DataVersion(str(tmp_path / 'version')))
+    monkeypatch.setattr(snapshot, 'shared_snapshot', SharedSnapshot(str(tmp_path / 'snapshots')))
+    return engine
+
+@mark.describe('Test the parallel seeding scheduler')
+class TestParallelSeed():
+
+    @mark.it('schedules every table after the tables it references')
+    def test_dependency_levels(self):
+        levels = [{table.name for table in level} for level in dependency_levels(Base.metadata)]
+
+        assert levels == [
+            {'makes', 'colours', 'counties'}, {'models', 'customers'}, {'cars_for_sale'}
+        ]
+
+    @mark.it('loads the same rows as the serial seeding')
+    def test_seed_tables(self, engine):
+        timings = seed_tables(SeedSettings(workers=3, report=lambda message: None))
+
+        tables = create_dimension_tables(
+            pd_load_json('data/json/cars.json'), pd_load_json('data/json/customers.json')
+        )
+        tables[CarsForSale] = create_cars_for_sale(
+            normalize(load_json_data('data/json/cars_for_sale.json')), tables=tables
+        )
+        for table, expected in tables.items():
+            generated = [column.name for column in table.__table__.c if column.computed is not None]
+            loaded = pd.read_sql_table(
+                table.__tablename__, engine, index_col=expected.index.name
+            ).drop(columns=generated).sort_index()
+            assert loaded.index.tolist() == expected.index.tolist()
+            assert loaded.columns.tolist() == expected.columns.tolist()
+
+        loaded_cars = pd.read_sql_table('cars_for_sale', engine, index_col='car_id').sort_index()
+        for column in ['model_id', 'colour_id', 'customer_id', 'price']:
+            assert loaded_cars[column].tolist() == tables[CarsForSale][column].astype(int).tolist()
+
+        assert 'build and load cars_for_sale' in timings
+        assert snapshot.shared_snapshot.versions() == [snapshot.data_version.current()]
@@ -0,0 +1,72 @@
+import logging
+from pytest import mark
+from sqlalchemy import create_engine, text, select, bindparam, literal, Integer
+from src.db.logger import QueryMetrics, StatementRegistry, fingerprint
+
+@mark.describe('Test query instrumentation')
+class TestQueryMetrics():
+
+    @mark.it('reduces statements with different literals and parameter lists to one fingerprint')
+    def test_fingerprint(self):
+        assert fingerprint("SELECT * FROM makes WHERE make_name = 'Ford' LIMIT 10") == (
+            'SELECT * FROM makes WHERE make_name = ? LIMIT ?'
+        )
+        assert fingerprint('INSERT INTO makes (make_name) VALUES (%s), (%s), (%s)') == (
+            fingerprint('INSERT INTO makes (make_name)\n  VALUES (%s)')
+        )
+
+    @mark.it('installs the listeners only once per engine')
+    def test_instrument_once(self):
+        metrics = QueryMetrics()
+        engine = create_engine('sqlite://')
+        for _ in range(3):
+            metrics.instrument(engine)
+
+        with engine.connect() as conn:
+            for value in range(5):
+                conn.execute(text(f'SELECT {value}'))
+
+        [stats] = metrics.snapshot()
+        assert stats['statement'] == 'SELECT ?'
+        assert stats['count'] == 5
+        assert 0 < stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms']
+
+    @mark.it('logs the queries of each engine to its own logger')
+    def test_logger_per_engine(self, caplog):
+        metrics = QueryMetrics()
+        engines = {name: create_engine('sqlite://') for name in ['queries.first', 'queries.second']}
+        for name, engine in engines.items():
+            metrics.set_logger(engine, logging.getLogger(name))
+            metrics.instrument(engine)
+
+        with caplog.at_level(logging.DEBUG):
+            for engine in engines.values():
+                with engine.connect() as conn:
+                    conn.execute(text('SELECT 1'))
+
+        assert [record.name for record in caplog.records] == [
+            'queries.first', 'queries.first', 'queries.second', 'queries.second'
+        ]
+
+    @mark.it('clears the statistics on reset')
+    def test_reset(self):
+        metrics = QueryMetrics()
+        metrics.record('SELECT 1', 1_000, 1)
+        metrics.reset()
+
+        assert not metrics.snapshot()
+
+    @mark.it('counts compiled cache hits for registered statements')
+    def test_statement_registry(self):
+        registry = StatementRegistry()
+        engine = create_engine('sqlite://')
+        registry.instrument(engine)
+        stmt = registry.register('echo', select(bindparam('value', type_=Integer) + literal(1)))
+
+        with engine.connect() as conn:
+            assert [conn.scalar(stmt, {'value': value}) for value in range(4)] == [1, 2, 3, 4]
+            conn.execute(text('SELECT 1'))
+
+        assert registry.snapshot() == [
+            {'statement': 'echo', 'executions': 4, 'cache_hits': 3, 'hit_rate': 0.75}
+        ]
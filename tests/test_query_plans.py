@@ -0,0 +1,62 @@
+from pytest import mark, fixture
+from sqlalchemy import select
+from src.models.model_motors import LOCATIONS_STMT
+from src.models.model_search import (
+    SearchFilters, LISTING_COLUMNS, listings_source, search_conditions, keyset_order
+)
+
+def search_statement(filters: SearchFilters):
+    order_by, _ = keyset_order(filters.sort, keyword=filters.keyword)
+    return (
+        select(*LISTING_COLUMNS)
+        .select_from(listings_source(filters))
+        .where(*search_conditions(filters))
+        .order_by(*order_by)
+        .limit(filters.limit)
+    )
+
+def explain(conn, stmt) -> str:
+    sql = str(stmt.compile(conn.engine, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    return '\n'.join(str(row[-1]) for row in conn.exec_driver_sql(prefix + sql))
+
+@fixture(scope='module')
+def sqlite_conn(seeded_engine):
+    with seeded_engine.connect() as conn:
+        conn.exec_driver_sql('ANALYZE')
+        yield conn
+
+@fixture(scope='module')
+def pg_conn(pg_engine):
+    # a few hundred rows fit in a page, so only check that an index can serve the query
+    with pg_engine.connect() as conn:
+        conn.exec_driver_sql('SET enable_seqscan = off')
+        yield conn
+
+@mark.describe('Test the hot queries use index scans')
+class TestQueryPlans():
+
+    @mark.it('finds cars for a make and model through the listings index')
+    def test_model_filter(self, sqlite_conn):
+        plan = explain(sqlite_conn, search_statement(SearchFilters(make='Ford', model='Focus')))
+        assert 'ix_car_listings_make_model' in plan
+
+    @mark.it('reads keyset pages in order from the composite sort index')
+    def test_keyset_sort(self, sqlite_conn):
+        plan = explain(sqlite_conn, search_statement(SearchFilters(sort='-price')))
+        assert 'ix_car_listings_price_car_id' in plan
+
+    @mark.it('searches town name prefixes through an index on PostgreSQL')
+    def test_pg_location_prefix(self, pg_conn):
+        plan = explain(pg_conn, LOCATIONS_STMT.params(search_term='aber'))
+        assert 'ix_customers_town_name_trgm' in plan
+
+    @mark.it('searches the materialized listings through their index on PostgreSQL')
+    def test_pg_search_listings(self, pg_conn):
+        plan = explain(pg_conn, search_statement(SearchFilters(make='Ford')))
+        assert 'ix_car_listings_make_model' in plan
+
+    @mark.it('searches the descriptions through the GIN index on PostgreSQL')
+    def test_pg_keyword_search(self, pg_conn):
+        plan = explain(pg_conn, search_statement(SearchFilters(keyword='tempora', make='Ford')))
+        assert 'ix_cars_for_sale_description_tsv' in plan
@@ -0,0 +1,93 @@
+from pytest import mark, fixture
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+from src.utils.response_cache import DataVersion, DiskCache, ResponseCache
+
+class Clock():
+    def __init__(self):
+        self.now = 1_000.0
+
+    def __call__(self):
+        return self.now
+
+@fixture
+def data_version(tmp_path):
+    return DataVersion(str(tmp_path / 'version'))
+
+@fixture
+def client(data_version):
+    app = FastAPI()
+    cache = ResponseCache(data_version, maxsize=2, ttl=60)
+    calls = []
+
+    @app.get('/items')
+    @cache.cached
+    def items(request: Request, name: str = '', page: int = 1):
+        calls.append((name, page))
+        return {'name': name, 'page': page}
+
+    client = TestClient(app)
+    client.calls = calls
+    client.cache = cache
+    return client
+
+@mark.describe('Test the response cache')
+class TestResponseCache():
+
+    @mark.it('serves repeated requests with normalised parameters from the cache')
+    def test_cached(self, client):
+        first = client.get('/items', params={'name': 'ford', 'page': 2})
+        second = client.get('/items?page=2&name=ford%20&unused=')
+
+        assert first.json() == second.json() == {'name': 'ford', 'page': 2}
+        assert first.headers['etag'] == second.headers['etag']
+        assert 'must-revalidate' in first.headers['cache-control']
+        assert client.calls == [('ford', 2)]
+
+    @mark.it('returns 304 when the client already holds the response')
+    def test_not_modified(self, client):
+        etag = client.get('/items').headers['etag']
+        response = client.get('/items', headers={'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert not response.content
+
+    @mark.it('renders the response again once the data version is bumped')
+    def test_invalidation(self, client, data_version):
+        etag = client.get('/items').headers['etag']
+        data_version.bump()
+        response = client.get('/items', headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert response.headers['etag'] != etag
+        assert len(client.calls) == 2
+
+    @mark.it('evicts the least recently used entry')
+    def test_lru(self, client):
+        for page in [1, 2, 1, 3, 1, 2]:
+            client.get('/items', params={'page': page})
+
+        assert [page for _, page in client.calls] == [1, 2, 3, 2]
+        assert client.cache.stats() == {'hits': 2, 'misses': 4, 'entries': 2}
+
+    @mark.it('expires entries after the ttl')
+    def test_ttl(self, data_version):
+        clock = Clock()
+        cache = ResponseCache(data_version, ttl=10, clock=clock)
+        cache.set('key', Response(b'body'))
+
+        assert cache.get('key').body == b'body'
+        clock.now += 11
+        assert cache.get('key') is None
+
+    @mark.it('shares entries between caches through the disk backing')
+    def test_disk(self, data_version, tmp_path):
+        caches = [
+            ResponseCache(data_version, disk=DiskCache(str(tmp_path / 'cache.db'), 10))
+            for _ in range(2)
+        ]
+        caches[0].set('key', Response(b'body'))
+
+        assert caches[1].get('key').body == b'body'
+        data_version.bump()
+        assert caches[1].get('key') is None
@@ -0,0 +1,114 @@
+from pytest import mark
+from sqlalchemy import select
+from src.db.table_classes import CarsForSale, Colours, Makes, Models
+from src.models import model_inventory, model_motors
+from src.models.dimension_cache import DimensionCache
+from src.models.model_motors import location_index
+from src.models.model_nearby import NearbyFilters, nearby_listings
+from src.models.model_search import SearchFilters, search_cars
+
+@mark.describe('Test the async route handlers')
+class TestRoutes():
+
+    @mark.it('searches through the async engine')
+    def test_search(self, client, seeded_engine):
+        response = client.get('/api/cars/search', params={'make': 'Ford', 'sort': '-price'})
+        with seeded_engine.connect() as conn:
+            expected = search_cars(conn, SearchFilters(make='Ford', sort='-price'))
+
+        assert response.status_code == 200
+        assert response.json() == expected
+
+    @mark.it('rejects an invalid cursor')
+    def test_search_invalid_cursor(self, client):
+        response = client.get('/api/cars/search', params={'cursor': 'not a cursor'})
+
+        assert response.status_code == 400
+
+    @mark.it('rejects a relevance sort without a keyword on both engines')
+    def test_search_relevance_without_keyword(self, client, monkeypatch):
+        for engine in ['sql', 'memory']:
+            monkeypatch.setattr(model_inventory, 'SEARCH_ENGINE', engine)
+            response = client.get('/api/cars/search', params={'sort': '-relevance'})
+
+            assert response.status_code == 400
+            assert 'needs a keyword' in response.json()['detail']
+
+    @mark.it('builds the locations index through the async engine on first use')
+    def test_locations(self, client, monkeypatch):
+        monkeypatch.setattr(location_index, 'loaded', False)
+        monkeypatch.setattr(location_index, 'version', None)
+        response = client.get('/api/locations', params={'search_term': 'Somer'})
+
+        assert response.status_code == 200
+        assert 'Somerset' in response.text
+        assert location_index.loaded
+
+    @mark.it('searches by distance from a town through the async engine')
+    def test_nearby(self, client, seeded_engine):
+        params = {'location': 'Bath, Avon', 'miles': 50}
+        response = client.get('/api/cars/nearby', params=params)
+        with seeded_engine.connect() as conn:
+            expected = nearby_listings(conn, NearbyFilters(**params))
+
+        assert response.status_code == 200
+        assert response.json() == expected
+
+    @mark.it('rejects a town it cannot locate')
+    def test_nearby_unknown_town(self, client):
+        response = client.get('/api/cars/nearby', params={'location': 'Newport'})
+
+        assert response.status_code == 400
+        assert 'more than one county' in response.json()['detail']
+
+    @mark.it('chains the make, model and colour options from the dimension cache')
+    def test_cascade(self, client, seeded_engine, monkeypatch):
+        monkeypatch.setattr(model_motors, 'dimension_cache', DimensionCache())
+        makes = client.get('/api/makes')
+        models = client.get('/api/models', params={'make': 'Ford'})
+        colours = client.get('/api/colours', params={'make': 'Ford', 'model': 'Focus'})
+
+        with seeded_engine.connect() as conn:
+            make_names = conn.scalars(select(Makes.make_name)).all()
+            ford_colours = conn.scalars(
+                select(Colours.colour_name).distinct()
+                .join(CarsForSale, CarsForSale.colour_id == Colours.colour_id)
+                .join(Models, CarsForSale.model_id == Models.model_id)
+                .join(Makes, Models.make_id == Makes.make_id)
+                .where(Makes.make_name == 'Ford', Models.model_name == 'Focus')
+            ).all()
+
+        assert all(response.status_code == 200 for response in [makes, models, colours])
+        assert makes.text.count('<option') == len(make_names) + 1
+        assert "<option value='Focus'>Focus</option>" in models.text
+        assert "<option value='A3'>" not in models.text
+        assert colours.text.count('<option') == len(ford_colours) + 1
+        assert all(f"<option value='{colour}'>" in colours.text for colour in ford_colours)
+
+    @mark.it('keeps the current make, model and colour selected')
+    def test_cascade_selected(self, client, monkeypatch):
+        monkeypatch.setattr(model_motors, 'dimension_cache', DimensionCache())
+        makes = client.get('/api/makes', params={'make': 'Ford'})
+        models = client.get('/api/models', params={'make': 'Ford', 'model': 'Focus'})
+        colours = client.get('/api/colours', params={'make': 'Ford'})
+        colour = model_motors.dimension_cache.colours('Ford')[0]
+        chosen = client.get('/api/colours', params={'make': 'Ford', 'colour': colour})
+
+        assert "<option value='Ford' selected>Ford</option>" in makes.text
+        assert "<option value='Focus' selected>Focus</option>" in models.text
+        assert ' selected' not in colours.text
+        assert f"<option value='{colour}' selected>{colour}</option>" in chosen.text
+        assert chosen.text.count(' selected') == 1
+
+    @mark.it('answers every change of the form without reading the database')
+    def test_cascade_cached(self, client, monkeypatch):
+        monkeypatch.setattr(model_motors, 'dimension_cache', DimensionCache())
+        client.get('/api/models', params={'make': 'Audi'})
+
+        def fetch_dimensions(_):
+            raise AssertionError('the dimensions were read again')
+        monkeypatch.setattr(model_motors, 'fetch_dimensions', fetch_dimensions)
+        response = client.get('/api/colours', params={'make': 'Audi'})
+
+        assert response.status_code == 200
+        assert "<option value=''>Any colour</option>" in response.text
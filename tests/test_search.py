@@ -0,0 +1,133 @@
+from pytest import mark, fixture, raises
+from pydantic import ValidationError
+from sqlalchemy import select
+from src.db.table_classes import CarsForSale
+from src.models.model_search import FACETS, SearchFilters, fetch_facets, search_cars
+
+@fixture
+def conn(seeded_engine):
+    with seeded_engine.connect() as conn:
+        yield conn
+
+@mark.describe('Test the faceted car search')
+class TestSearch():
+
+    @mark.it('returns the total with counts for every facet')
+    def test_facets(self, conn):
+        search = search_cars(conn, SearchFilters())
+
+        assert search['total'] == 500
+        assert len(search['results']) == 20
+        for counts in search['facets'].values():
+            assert sum(counts.values()) == search['total']
+
+    @mark.it('tells the PostgreSQL total row from a facet grouped on NULL by GROUPING')
+    def test_grouping_rows(self):
+        def row(name, value, count):
+            # facet values, GROUPING of every facet, then the count
+            values = [value if facet == name else None for facet in FACETS]
+            return (*values, *(0 if facet == name else 1 for facet in FACETS), count)
+
+        class PostgresConnection:
+            dialect = type('Dialect', (), {'name': 'postgresql'})
+
+            def execute(self, _):
+                return [row('make', 'Ford', 3), row('colour', None, 2), row('total', None, 5)]
+
+        total, facets = fetch_facets(PostgresConnection(), [])
+
+        assert total == 5
+        assert facets['make'] == {'Ford': 3} and facets['colour'] == {None: 2}
+
+    @mark.it('applies the filters to the results and the facet counts')
+    def test_filters(self, conn):
+        make, count = next(iter(search_cars(conn, SearchFilters())['facets']['make'].items()))
+        search = search_cars(conn, SearchFilters(make=make, limit=100))
+
+        assert search['total'] == count
+        assert search['facets']['make'] == {make: count}
+        assert {car['make'] for car in search['results']} == {make}
+
+    @mark.it('filters by mileage band and location')
+    def test_mileage_and_location(self, conn):
+        search = search_cars(conn, SearchFilters(mileage_band='over 100,000', location='Somerset'))
+
+        assert all(car['mileage'] >= 100_000 for car in search['results'])
+        assert all(car['county'] == 'Somerset' for car in search['results'])
+        assert search['facets']['mileage_band'] == {'over 100,000': search['total']}
+
+    @mark.it('rejects an unknown mileage band')
+    def test_invalid_mileage_band(self):
+        with raises(ValidationError):
+            SearchFilters(mileage_band='lots')
+
+    @mark.it('pages through every result in sort order with cursors')
+    def test_keyset_pagination(self, conn):
+        for sort in ['car_id', '-price', 'year', '-mileage']:
+            filters = SearchFilters(fuel_type='petrol', sort=sort, limit=15)
+            first_page = search_cars(conn, filters)
+            cars, page = first_page['results'], first_page
+
+            while page['next_cursor']:
+                filters = filters.model_copy(update={'cursor': page['next_cursor']})
+                page = search_cars(conn, filters)
+                assert 'facets' not in page
+                cars += page['results']
+
+            key = sort.lstrip('-')
+            expected = sorted(
+                cars, key=lambda car: (car[key], car['car_id']), reverse=sort.startswith('-')
+            )
+            assert len({car['car_id'] for car in cars}) == first_page['total']
+            assert cars == expected
+
+    @mark.it('rejects a cursor from a different sort order')
+    def test_invalid_cursor(self, conn):
+        page = search_cars(conn, SearchFilters(sort='price', limit=5))
+
+        with raises(ValueError):
+            search_cars(conn, SearchFilters(sort='year', cursor=page['next_cursor']))
+        with raises(ValueError):
+            search_cars(conn, SearchFilters(cursor='not a cursor'))
+
+    @mark.it('searches the descriptions with a keyword combined with the filters')
+    def test_keyword(self, conn):
+        descriptions = conn.execute(select(CarsForSale.car_id, CarsForSale.description)).all()
+        expected = {
+            car_id for car_id, description in descriptions
+            if 'tempora' in description.lower() and 'magnam' in description.lower()
+        }
+        search = search_cars(conn, SearchFilters(keyword='Tempora magnam', limit=100))
+
+        assert search['total'] == len(expected)
+        assert {car['car_id'] for car in search['results']} <= expected
+        assert all('tempora' in car['snippet'].lower() for car in search['results'])
+        assert sum(search['facets']['make'].values()) == search['total']
+
+        make = next(iter(search['facets']['make']))
+        filtered = search_cars(conn, SearchFilters(keyword='tempora magnam', make=make))
+        assert filtered['total'] == search['facets']['make'][make]
+
+    @mark.it('pages through keyword results by relevance')
+    def test_relevance(self, conn):
+        filters = SearchFilters(keyword='ipsum', sort='-relevance', limit=25)
+        page = search_cars(conn, filters)
+        cars, total = page['results'], page['total']
+
+        while page['next_cursor']:
+            filters = filters.model_copy(update={'cursor': page['next_cursor']})
+            page = search_cars(conn, filters)
+            cars += page['results']
+
+        assert len({car['car_id'] for car in cars}) == total
+        assert cars == sorted(
+            cars, key=lambda car: (car['relevance'], car['car_id']), reverse=True
+        )
+
+    @mark.it('rejects a relevance sort without a keyword and a keyword without words')
+    def test_invalid_keyword(self, conn):
+        with raises(ValueError):
+            search_cars(conn, SearchFilters(sort='-relevance'))
+        with raises(ValidationError):
+            SearchFilters(keyword='!!')
+        assert SearchFilters(keyword='  ').keyword is None
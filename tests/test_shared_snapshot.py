@@ -0,0 +1,80 @@
+import asyncio
+import pyarrow as pa
+from pytest import mark, fixture
+from src.db import snapshot
+from src.models import model_inventory, model_motors, model_nearby
+from src.models.dimension_cache import DimensionCache
+from src.models.location_index import LocationIndex
+from src.models.model_inventory import InventorySnapshot, search_cars_async
+from src.models.model_search import SearchFilters, search_cars
+from src.utils.response_cache import DataVersion
+from src.utils.shared_snapshot import SharedSnapshot
+
+@fixture
+def shared(monkeypatch, tmp_path):
+    ''' every module reads and writes the snapshot and data version in tmp_path '''
+    shared_snapshot = SharedSnapshot(str(tmp_path / 'snapshots'))
+    version = DataVersion(str(tmp_path / 'version'))
+    for module in [snapshot, model_inventory, model_motors, model_nearby]:
+        monkeypatch.setattr(module, 'shared_snapshot', shared_snapshot)
+        monkeypatch.setattr(module, 'data_version', version)
+    return shared_snapshot
+
+@fixture
+def published(shared, seeded_engine):
+    with seeded_engine.connect() as conn:
+        return snapshot.publish_snapshot(conn)
+
+@mark.describe('Test the shared snapshot files')
+class TestSharedSnapshot():
+
+    @mark.it('maps the tables of a version and keeps only the newest versions')
+    def test_write_read(self, tmp_path):
+        shared = SharedSnapshot(str(tmp_path), keep=2)
+        table = pa.table({'id': [1, 2, 3], 'name': pa.array(['a', 'b', 'a']).dictionary_encode()})
+        for version in ['v1', 'v2', 'v3']:
+            shared.write(version, {'things': table})
+
+        assert shared.versions() == ['v2', 'v3']
+        assert shared.read('v3', 'things').equals(table)
+        assert shared.read('v1', 'things') is None
+        assert shared.read('v3', 'others') is None
+
+    @mark.it('publishes every table then bumps the data version to it')
+    def test_publish(self, shared, published):
+        assert snapshot.data_version.current() == published
+        assert shared.versions() == [published]
+        for name in [
+            'inventory', 'locations', 'customer_locations', 'makes', 'models', 'colours',
+            'model_colours'
+        ]:
+            assert shared.read(published, name).num_rows > 0
+
+    @mark.it('searches the mapped inventory in place')
+    def test_mapped_inventory(self, shared, published, seeded_engine):
+        allocated = pa.total_allocated_bytes()
+        inventory = InventorySnapshot(shared.read(published, 'inventory'), published)
+        filters = SearchFilters(make='Ford', sort='-price')
+
+        # only the dictionaries are copied, the columns are views of the mapped file
+        assert pa.total_allocated_bytes() - allocated < len(inventory)
+        with seeded_engine.connect() as conn:
+            assert inventory.search(filters) == search_cars(conn, filters)
+
+    @mark.it('warms up from the snapshot without querying the database')
+    def test_warm_up(self, published, monkeypatch):
+        inventory, locations = InventorySnapshot(), LocationIndex()
+        monkeypatch.setattr(model_motors, 'dimension_cache', DimensionCache())
+        monkeypatch.setattr(model_inventory, 'SEARCH_ENGINE', 'memory')
+        monkeypatch.setattr(model_inventory, 'inventory_snapshot', inventory)
+        monkeypatch.setattr(model_motors, 'location_index', locations)
+
+        # an engine is never connected to, None would raise if it were
+        search = asyncio.run(search_cars_async(None, SearchFilters()))
+        matches = asyncio.run(model_motors.search_locations_async(None, 'Somer'))
+        dimensions = asyncio.run(model_motors.current_dimensions(None))
+
+        assert search['total'] == 500
+        assert inventory.version == locations.version == published
+        assert 'Somerset' in matches
+        assert 'Focus' in dimensions.models('Ford') and dimensions.version == published
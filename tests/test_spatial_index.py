@@ -0,0 +1,58 @@
+import numpy as np
+from pytest import mark, approx
+from src.models.spatial_index import SpatialIndex, haversine_miles
+
+@mark.describe('Test the in-memory spatial index')
+class TestSpatialIndex():
+
+    @mark.it('measures great circle distances in miles')
+    def test_haversine(self):
+        # Aberdeen to Edinburgh, and London to itself
+        distances = haversine_miles(57.1437, -2.0981, np.array([55.9521, 51.5085]),
+                                    np.array([-3.1965, -0.1257]))
+
+        assert distances[0] == approx(92.3, abs=0.5)
+        assert haversine_miles(51.5085, -0.1257, np.array([51.5085]), np.array([-0.1257]))[0] == 0
+
+    @mark.it('returns the same points as a scan of every point, nearest first')
+    def test_matches_scan(self):
+        rng = np.random.default_rng(7)
+        ids = rng.permutation(20_000)
+        latitudes, longitudes = rng.uniform(50, 58.5, 20_000), rng.uniform(-6, 1.7, 20_000)
+        index = SpatialIndex(ids, latitudes, longitudes)
+
+        for miles in [0.5, 25, 150]:
+            found, distances = index.within(54.0, -2.0, miles)
+            scanned = haversine_miles(54.0, -2.0, latitudes, longitudes)
+            inside = scanned <= miles
+
+            assert sorted(found) == sorted(ids[inside])
+            assert (np.diff(distances) >= 0).all()
+
+    @mark.it('orders points at the same distance by id and limits the results')
+    def test_ties_and_limit(self):
+        index = SpatialIndex([5, 3, 9, 1], [51.5, 51.5, 51.5, 52.5], [-0.1, -0.1, -0.1, -0.1])
+        found, distances = index.within(51.5, -0.1, 100)
+
+        assert found.tolist() == [3, 5, 9, 1]
+        assert distances[:3].tolist() == [0, 0, 0]
+        assert index.within(51.5, -0.1, 100, limit=2)[0].tolist() == [3, 5]
+
+    @mark.it('returns nothing when the index is empty or no point is in range')
+    def test_empty(self):
+        assert len(SpatialIndex().within(51.5, -0.1, 25)[0]) == 0
+        index = SpatialIndex([1], [57.1], [-2.1])
+        assert len(index.within(51.5, -0.1, 25)[0]) == 0
+
+    @mark.it('finds points on both sides of a cell boundary and exactly at the radius')
+    def test_cell_boundary(self):
+        # 52.0 and -1.0 are cell boundaries, the origin is in the cell north east of them
+        latitudes = [52.01, 51.99, 52.01, 51.99, 51.6]
+        longitudes = [-0.99, -0.99, -1.01, -1.01, -0.99]
+        index = SpatialIndex([1, 2, 3, 4, 5], latitudes, longitudes)
+        radius = haversine_miles(52.01, -0.99, np.array([51.6]), np.array([-0.99]))[0]
+
+        found, distances = index.within(52.01, -0.99, radius)
+        assert sorted(found.tolist()) == [1, 2, 3, 4, 5]
+        assert distances[-1] == radius
+        assert 5 not in index.within(52.01, -0.99, radius - 1e-6)[0]
@@ -0,0 +1,86 @@
+from pytest import mark, fixture
+import json
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.pool import StaticPool
+from src.db import sync_db
+from src.db.table_classes import CarsForSale, Makes
+from src.utils.file_utils import load_json_data
+from src.db import snapshot
+from src.utils.response_cache import DataVersion
+from src.utils.shared_snapshot import SharedSnapshot
+from tests.conftest import seed_database
+
+@fixture
+def engine(monkeypatch, tmp_path):
+    engine = seed_database(create_engine('sqlite://', poolclass=StaticPool))
+    monkeypatch.setattr(sync_db, 'get_engine', lambda: engine)
+    monkeypatch.setattr(sync_db, 'refresh_location_index', lambda: True)
+    monkeypatch.setattr(snapshot, 'data_version', DataVersion(str(tmp_path / 'version')))
+    monkeypatch.setattr(snapshot, 'shared_snapshot', SharedSnapshot(str(tmp_path / 'snapshots')))
+    return engine
+
+@fixture
+def cars_for_sale_file(tmp_path):
+    def write(cars):
+        file_path = tmp_path / 'cars_for_sale.json'
+        file_path.write_text(json.dumps(cars), encoding='utf-8')
+        return str(file_path)
+    return write
+
+@mark.describe('Test the incremental sync')
+class TestSync():
+
+    @mark.it('changes nothing when the source matches the database')
+    def test_unchanged(self, engine):
+        summary = sync_db.sync_tables()
+
+        assert all(counts['upserted'] == 0 for counts in summary.values())
+        assert summary['cars_for_sale']['deleted'] == 0
+
+    @mark.it('upserts only the changed cars and deletes cars removed from the source')
+    def test_changed(self, engine, cars_for_sale_file):
+        cars = load_json_data('data/json/cars_for_sale.json')
+        cars[0]['price'] += 1_000
+        cars[10]['mileage'] += 5
+        summary = sync_db.sync_tables(cars_for_sale_file(cars[:-3]), batch_size=2)
+
+        assert summary['cars_for_sale'] == {'upserted': 2, 'deleted': 3}
+        with engine.connect() as conn:
+            assert conn.scalar(select(func.count()).select_from(CarsForSale)) == 497
+            assert conn.scalar(select(CarsForSale.price).where(CarsForSale.car_id == 1)) == (
+                cars[0]['price']
+            )
+
+    @mark.it('deletes a car removed from the middle of the source without renumbering the rest')
+    def test_removed_from_middle(self, engine, cars_for_sale_file):
+        cars = load_json_data('data/json/cars_for_sale.json')
+        with engine.connect() as conn:
+            removed_id = conn.scalar(select(CarsForSale.car_id).order_by(CarsForSale.car_id))
+        summary = sync_db.sync_tables(cars_for_sale_file(cars[1:]), batch_size=50)
+
+        assert summary['cars_for_sale'] == {'upserted': 0, 'deleted': 1}
+        with engine.connect() as conn:
+            remaining = conn.scalars(select(CarsForSale.car_id)).all()
+        assert removed_id not in remaining and len(remaining) == 499
+
+        # a car added back is new, the ids of the others are kept
+        summary = sync_db.sync_tables(cars_for_sale_file(cars), batch_size=50)
+        assert summary['cars_for_sale'] == {'upserted': 1, 'deleted': 0}
+
+    @mark.it('adds new makes and models keeping the existing ids')
+    def test_new_dimension(self, engine, cars_for_sale_file, monkeypatch):
+        cars = load_json_data('data/json/cars.json')
+        new_car = {**cars[0], 'make': 'Aardvark', 'model': 'Burrow'}
+        monkeypatch.setattr(
+            sync_db, 'pd_load_json',
+            lambda _: sync_db.pd.DataFrame(cars + [new_car]).convert_dtypes(dtype_backend='pyarrow')
+        )
+        with engine.connect() as conn:
+            before = dict(conn.execute(select(Makes.make_name, Makes.make_id)).all())
+
+        summary = sync_db.sync_tables()
+
+        assert summary['makes']['upserted'] == 1 and summary['models']['upserted'] == 1
+        with engine.connect() as conn:
+            after = dict(conn.execute(select(Makes.make_name, Makes.make_id)).all())
+        assert after == {**before, 'Aardvark': max(before.values()) + 1}